@@ -0,0 +1,11 @@
+import os
+
+from celery import Celery
+
+import globals
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'{globals.PROJECT_NAME}.settings')
+
+app = Celery(globals.PROJECT_NAME)
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,80 @@
+"""concurrent booking throughput and double booking check
+
+    python -m benchmarks.booking [threads] [attempts per thread]
+
+meant for PostgreSQL, SQLite serializes every write anyway.
+"""
+from benchmarks.common import report, test_database
+
+import datetime
+import sys
+import threading
+import time
+
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.availability import busy_intervals
+from core.models import Item, Reservation, Service, Shift, User
+
+
+def patient(user, shift, service, attempts, statuses):
+    client = APIClient()
+    client.force_authenticate(user)
+    try:
+        for i in range(attempts):
+            response = client.post(reverse('reservation-list'), {
+                'shift': shift.pk,
+                'service': service.pk,
+                'item': shift.item_id,
+                'time_date': shift.start_date + datetime.timedelta(minutes=5 * (i % 96)),
+            })
+            statuses.append(response.status_code)
+    finally:
+        connection.close()
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    attempts = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with test_database():
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        item = Item.objects.create(name='bench')
+        service = Service.objects.create(name='bench', duration=datetime.timedelta(minutes=15), price=1)
+        shift = Shift.objects.create(
+            item=item, start_date=start, end_date=start + datetime.timedelta(hours=8),
+            repeat='do not repeat',
+        )
+        users = [User.objects.create(username=f'bench{i}') for i in range(threads)]
+
+        statuses = []
+        workers = [
+            threading.Thread(target=patient, args=(user, shift, service, attempts, statuses))
+            for user in users
+        ]
+        began = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - began
+
+        busy = busy_intervals(shift.pk)
+        double_booked = sum(1 for (_, end), (next_start, _) in zip(busy, busy[1:]) if next_start < end)
+        report(
+            f'{threads} threads x {attempts} bookings on one shift ({connection.vendor})',
+            [(
+                len(statuses), f'{len(statuses) / elapsed:.0f}/s',
+                statuses.count(201), statuses.count(409),
+                len(statuses) - statuses.count(201) - statuses.count(409),
+                Reservation.objects.count(), double_booked,
+            )],
+            ('requests', 'throughput', '201', '409', 'other', 'reservations', 'double booked'),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""throughput of /reservations/bulk/ against one POST per reservation
+
+    python -m benchmarks.bulk_booking
+"""
+from benchmarks.common import best_of, count_queries, ms, report, test_database
+
+import datetime
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Item, Reservation, Service, Shift, User
+
+
+def main():
+    with test_database():
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        item = Item.objects.create(name='bench')
+        service = Service.objects.create(name='bench', duration=datetime.timedelta(minutes=5), price=1)
+        shift = Shift.objects.create(
+            item=item, start_date=start, end_date=start + datetime.timedelta(days=7),
+            repeat='do not repeat',
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='bench'))
+
+        def payload(n):
+            return [
+                {
+                    'shift': shift.pk,
+                    'service': service.pk,
+                    'item': item.pk,
+                    'time_date': (start + service.duration * i).isoformat(),
+                }
+                for i in range(n)
+            ]
+
+        def one_by_one(n):
+            Reservation.objects.all().delete()
+            for data in payload(n):
+                assert client.post(reverse('reservation-list'), data, format='json').status_code == 201
+
+        def bulk(n):
+            Reservation.objects.all().delete()
+            assert client.post(reverse('reservation-bulk'), payload(n), format='json').status_code == 201
+
+        rows = []
+        for n in (1, 5, 20, 100):
+            single = best_of(lambda: one_by_one(n), 3)
+            batched = best_of(lambda: bulk(n), 3)
+            rows.append((
+                n,
+                ms(single), count_queries(lambda: one_by_one(n)), f'{n / single:.0f}/s',
+                ms(batched), count_queries(lambda: bulk(n)), f'{n / batched:.0f}/s',
+            ))
+
+        report(
+            'reservations per request',
+            rows,
+            ('n', 'one by one', 'queries', 'throughput', 'bulk', 'queries', 'throughput'),
+        )
+
+
+if __name__ == '__main__':
+    main()
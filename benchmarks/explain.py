@@ -0,0 +1,123 @@
+"""query plans of the hot queries with and without the indexes of migration 0008
+
+    python -m benchmarks.explain [shifts]
+
+seeds `shifts` shifts (100000 by default) over 200 items and 20 services
+with two reservations each, then prints EXPLAIN ANALYZE (EXPLAIN QUERY PLAN on sqlite)
+and the best time of every query, first with the indexes dropped and again
+with them in place.
+"""
+from benchmarks.common import best_of, ms, report, test_database
+
+import datetime
+import random
+import sys
+
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Item, Reservation, Service, Shift, User
+
+INDEXES = {
+    Shift: ('core_shift_item_id_81e086_idx', 'shift_active_start_idx'),
+    Reservation: ('core_reserv_shift_i_578d75_idx', 'reservation_active_item_idx'),
+}
+N_ITEMS = 200
+N_SERVICES = 20
+BATCH = 5000
+
+
+def seed(total):
+    random.seed(0)
+    items = Item.objects.bulk_create(Item(name=f'item {i}', description='') for i in range(N_ITEMS))
+    services = Service.objects.bulk_create(
+        Service(name=f'service {i}', duration=datetime.timedelta(minutes=15), price=1) for i in range(N_SERVICES)
+    )
+    service = services[0]
+    user = User.objects.create(username='bench')
+    start = timezone.now().replace(microsecond=0) - datetime.timedelta(days=365)
+    for offset in range(0, total, BATCH):
+        shifts = Shift.objects.bulk_create(
+            Shift(
+                item=random.choice(items),
+                start_date=start + datetime.timedelta(hours=6 * n),
+                end_date=start + datetime.timedelta(hours=6 * n + 4),
+                repeat='do not repeat',
+                # most of the older shifts end up archived
+                is_archive=n < total * 0.7 and random.random() < 0.9,
+            )
+            for n in range(offset, min(offset + BATCH, total))
+        )
+        Shift.services.through.objects.bulk_create(
+            Shift.services.through(shift_id=shift.pk, service_id=random.choice(services).pk) for shift in shifts
+        )
+        Reservation.objects.bulk_create(
+            Reservation(
+                reserver=user, item=shift.item, shift=shift, service=service,
+                time_date=shift.start_date + service.duration * i,
+                is_archive=shift.is_archive, code=f'{shift.pk:07d}{i:02d}',
+            )
+            for shift in shifts
+            for i in (0, 2)
+        )
+    return items, service, start
+
+
+def hot_queries(items, service, start):
+    """(name, queryset) of the query shapes behind the API and the admin"""
+    item = items[N_ITEMS // 2]
+    now = start + datetime.timedelta(days=300)
+    shift = Shift.objects.filter(item=item, start_date__gte=now).order_by('start_date').first()
+    return [
+        ('item shifts from now', Shift.objects.filter(item=item, start_date__gte=now).order_by('start_date')[:20]),
+        ('free time window', Shift.objects.filter(
+            services=service, is_archive=False, is_available=True,
+            start_date__lt=now + datetime.timedelta(days=7), end_date__gt=now,
+        ).order_by('start_date')),
+        ('busy intervals', Reservation.objects.filter(shift=shift, service__isnull=False).order_by('time_date')),
+        ('shift admin', Shift.objects.filter(is_archive=False).order_by('start_date')[:100]),
+        ('reservation admin', Reservation.objects.filter(item=item, is_archive=False).exclude(
+            status='not accepted',
+        ).order_by('time_date')[:100]),
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True)
+    return queryset.explain()
+
+
+def set_indexes(present):
+    with connection.schema_editor() as editor:
+        for model, names in INDEXES.items():
+            for index in model._meta.indexes:
+                if index.name in names:
+                    (editor.add_index if present else editor.remove_index)(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with test_database():
+        queries = hot_queries(*seed(total))
+        timings = {}
+        for present in (False, True):
+            set_indexes(present)
+            label = 'with' if present else 'without'
+            for name, queryset in queries:
+                print(f'--- {name}, {label} the new indexes')
+                print(explain(queryset))
+                print()
+                timings.setdefault(name, []).append(best_of(lambda: list(queryset.all()), 5))
+
+    report(
+        f'{total} shifts on {connection.vendor}',
+        [(name, ms(before), ms(after), f'{before / after:.1f}x') for name, (before, after) in timings.items()],
+        ('query', 'without', 'with', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
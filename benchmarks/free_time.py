@@ -0,0 +1,84 @@
+"""compare the sorted interval free time engine with the old linear walk
+
+    python -m benchmarks.free_time
+"""
+from benchmarks.common import best_of, count_queries, ms, report, test_database
+
+import datetime
+
+from django.db import connection
+from django.utils import timezone
+
+from core.availability import free_slots
+from core.models import Item, Reservation, Service, Shift, User
+
+
+def legacy_free_time(shift, service):
+    """the previous ShiftViewSet.free_time body"""
+    reserved = Reservation.objects.filter(shift=shift).order_by('time_date')
+    startAvailable = shift.start_date
+    available_times = []
+    if reserved:
+        for reservation in reserved:
+            difft = reservation.time_date - startAvailable
+            if difft.seconds >= service.duration.seconds:
+                x = startAvailable
+                while reservation.time_date >= x+service.duration:
+                    available_times.append({'start': x})
+                    x = x+service.duration
+            startAvailable = reservation.time_date + reservation.service.duration
+    x = startAvailable
+    while x+service.duration <= shift.end_date:
+        available_times.append({'start': x})
+        x = x + service.duration
+    return available_times
+
+
+def make_shift(item, service, user, n_reservations):
+    """shift long enough for n_reservations bookings with a free slot between each"""
+    start = timezone.now().replace(microsecond=0)
+    shift = Shift.objects.create(
+        item=item,
+        start_date=start,
+        end_date=start + service.duration * (2 * n_reservations + 1),
+        repeat='do not repeat',
+    )
+    Reservation.objects.bulk_create(
+        Reservation(
+            reserver=user, item=item, shift=shift, service=service,
+            time_date=start + service.duration * (2 * i + 1),
+        )
+        for i in range(n_reservations)
+    )
+    return shift
+
+
+def main():
+    with test_database():
+        item = Item.objects.create(name='bench')
+        service = Service.objects.create(name='bench', duration=datetime.timedelta(minutes=5), price=1)
+        user = User.objects.create(username='bench')
+
+        rows = []
+        for n in (100, 1000, 5000, 10000):
+            shift = make_shift(item, service, user, n)
+            assert legacy_free_time(shift, service) == free_slots(shift, service.duration)
+
+            legacy = best_of(lambda: legacy_free_time(shift, service))
+            new = best_of(lambda: free_slots(shift, service.duration))
+            rows.append((
+                n,
+                ms(legacy), count_queries(lambda: legacy_free_time(shift, service)),
+                ms(new), count_queries(lambda: free_slots(shift, service.duration)),
+                f'{legacy / new:.1f}x',
+            ))
+
+        report(
+            f'free_time on {connection.vendor}',
+            rows,
+            ('reservations', 'linear walk', 'queries', 'intervals', 'queries', 'speedup'),
+        )
+
+
+if __name__ == '__main__':
+    main()
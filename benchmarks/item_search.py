@@ -0,0 +1,101 @@
+"""latency of the item search and the /items/ filters with and without their indexes
+
+    python -m benchmarks.item_search [items]
+
+seeds `items` items (100000 by default) with random doctor names over 30
+categories, then prints the plan and the best time of every query, first with
+the indexes of migration 0009 dropped and again with them in place. The
+search indexes are PostgreSQL only, on other databases search_items falls
+back to icontains and only the filter indexes change.
+"""
+from benchmarks.common import best_of, ms, report, test_database
+
+import importlib
+import random
+import sys
+
+from django.db import connection
+
+from core.models import Category, Item
+from core.search import search_items
+
+migration = importlib.import_module('core.migrations.0009_item_search')
+
+FIRST_NAMES = ['Sara', 'Reza', 'Ali', 'Maryam', 'Hossein', 'Zahra', 'Mehdi', 'Fatemeh', 'Amir', 'Neda']
+LAST_NAMES = ['Ahmadi', 'Karimi', 'Rahimi', 'Hosseini', 'Moradi', 'Jafari', 'Rezaei', 'Kazemi', 'Nouri', 'Sadeghi']
+WORDS = ['surgeon', 'heart', 'implant', 'children', 'skin', 'vision', 'sports', 'injury', 'sleep', 'allergy']
+N_CATEGORIES = 30
+BATCH = 5000
+
+
+def seed(total):
+    random.seed(0)
+    categories = Category.objects.bulk_create(Category(name=f'category {i}') for i in range(N_CATEGORIES))
+    for offset in range(0, total, BATCH):
+        items = []
+        for n in range(offset, min(offset + BATCH, total)):
+            # a suffix keeps the names from repeating every hundred rows
+            first, last = random.choice(FIRST_NAMES), f'{random.choice(LAST_NAMES)}{n}'
+            items.append(Item(
+                name=f'{first} {last}', first_name=first, last_name=last,
+                category=random.choice(categories), experience=str(random.randint(1, 40)),
+                description=' '.join(random.sample(WORDS, 3)),
+            ))
+        Item.objects.bulk_create(items)
+    return categories
+
+
+def queries(categories):
+    """(name, queryset) of the searches and filters behind /items/"""
+    items = Item.objects.select_related('category')
+    category = categories[N_CATEGORIES // 2]
+    return [
+        ('search full name', search_items(items, 'Sara Karimi12345')[:20]),
+        ('search prefix', search_items(items, 'kazemi777')[:20]),
+        ('search description', search_items(items, 'heart implant')[:20]),
+        ('search category', search_items(items, 'category 15')[:20]),
+        ('admin last name', items.filter(last_name__icontains='moradi4242')),
+        ('filter category', items.filter(category=category)),
+        ('filter category and experience', items.filter(category=category, experience='10')),
+        ('filter experience', items.filter(experience='10')),
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True)
+    return queryset.explain()
+
+
+def set_indexes(present):
+    with connection.schema_editor() as editor:
+        for index in Item._meta.indexes:
+            (editor.add_index if present else editor.remove_index)(Item, index)
+        (migration.add_search_indexes if present else migration.remove_search_indexes)(None, editor)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with test_database():
+        cases = queries(seed(total))
+        timings = {}
+        for present in (False, True):
+            set_indexes(present)
+            label = 'with' if present else 'without'
+            for name, queryset in cases:
+                print(f'--- {name}, {label} the indexes')
+                print(explain(queryset))
+                print()
+                timings.setdefault(name, []).append(best_of(lambda: list(queryset.all()), 5))
+
+    report(
+        f'{total} items on {connection.vendor}',
+        [(name, ms(before), ms(after), f'{before / after:.1f}x') for name, (before, after) in timings.items()],
+        ('query', 'without', 'with', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""render time and peak memory of a long free_time response
+
+    python -m benchmarks.json_rendering [slots]
+
+renders the free slots of one long shift (100000 by default) with DRF's
+JSONRenderer, with ORJSONRenderer and as the chunks stream_json sends. Peak
+memory is what rendering allocates on top of the slots themselves.
+"""
+from benchmarks.common import best_of, ms, report
+
+import datetime
+import sys
+import tracemalloc
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core.availability import free_slots
+from core.models import Shift
+from main.renderers import ORJSONRenderer, iter_json
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def drain(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    duration = datetime.timedelta(minutes=5)
+    start = timezone.localtime(timezone.now())
+    shift = Shift(start_date=start, end_date=start + duration * total)
+    slots = free_slots(shift, duration, busy=[])
+
+    cases = [
+        ('JSONRenderer', lambda: JSONRenderer().render(slots)),
+        ('ORJSONRenderer', lambda: ORJSONRenderer().render(slots)),
+        ('stream_json', lambda: drain(iter_json(slots))),
+    ]
+    assert JSONRenderer().render(slots) == ORJSONRenderer().render(slots) == b''.join(iter_json(slots))
+    baseline = None
+    rows = []
+    for name, render in cases:
+        seconds = best_of(render, 5)
+        baseline = baseline or seconds
+        rows.append((name, ms(seconds), f'{baseline / seconds:.1f}x', f'{peak_memory(render) / 2 ** 20:.1f}MB'))
+
+    report(f'free_time of {len(slots)} slots', rows, ('renderer', 'time', 'speedup', 'peak memory'))
+
+
+if __name__ == '__main__':
+    main()
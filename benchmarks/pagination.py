@@ -0,0 +1,86 @@
+"""deep page latency of the shift list, page numbers against cursors
+
+    python -m benchmarks.pagination [shifts]
+
+the first columns time GET /shifts/ with ?page= and with ?cursor=. The shift
+list has no ORDER BY so its page numbers are cheap but not stable, the last
+columns time the SQL of a page in (start_date, id) order by OFFSET and by key.
+"""
+from benchmarks.common import best_of, count_queries, ms, report, test_database
+
+import base64
+import datetime
+import json
+import sys
+
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Item, Shift, User
+from main.pagination import KeysetPagination
+
+PAGE_SIZE = 12
+
+
+def cursor_at(offset):
+    """the cursor a client following next links would hold before row `offset`"""
+    start_date, pk = Shift.objects.order_by('start_date', 'pk').values_list('start_date', 'pk')[offset - 1]
+    return base64.urlsafe_b64encode(json.dumps([start_date.isoformat(), pk, 0]).encode()).decode()
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with test_database():
+        item = Item.objects.create(name='bench')
+        start = timezone.now().replace(microsecond=0)
+        Shift.objects.bulk_create(
+            (
+                Shift(
+                    item=item, repeat='do not repeat',
+                    start_date=start + datetime.timedelta(minutes=30 * (i // 3)),
+                    end_date=start + datetime.timedelta(minutes=30 * (i // 3 + 1)),
+                )
+                for i in range(total)
+            ),
+            batch_size=5000,
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='bench'))
+        url = reverse('shift-list')
+
+        rows = []
+        for page in (1, 10, 100, 1000, total // PAGE_SIZE):
+            offset = (page - 1) * PAGE_SIZE
+            page_params = {'page': page}
+            cursor_params = {'cursor': cursor_at(offset)} if offset else {'pagination': 'cursor'}
+            page_ids = [row['id'] for row in client.get(url, page_params).data['results']]
+            cursor_ids = [row['id'] for row in client.get(url, cursor_params).data['results']]
+            assert page_ids == cursor_ids or page == 1
+
+            page_time = best_of(lambda: client.get(url, page_params), 5)
+            cursor_time = best_of(lambda: client.get(url, cursor_params), 5)
+
+            ordered = Shift.objects.order_by('start_date', 'pk')
+            key = ordered.values_list('start_date', 'pk')[offset - 1] if offset else None
+            keyset = KeysetPagination()
+            offset_sql = best_of(lambda: list(ordered[offset:offset + PAGE_SIZE]), 5)
+            keyset_sql = best_of(lambda: keyset.queryset_page(Shift.objects.all(), key and (*key, False)), 5)
+            rows.append((
+                page, offset,
+                ms(page_time), count_queries(lambda: client.get(url, page_params)),
+                ms(cursor_time), count_queries(lambda: client.get(url, cursor_params)),
+                ms(offset_sql), ms(keyset_sql), f'{offset_sql / keyset_sql:.1f}x',
+            ))
+
+    report(
+        f'GET /shifts/ over {total} shifts on {connection.vendor}',
+        rows,
+        ('page', 'offset', 'page number', 'queries', 'cursor', 'queries', 'ordered offset', 'keyset', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""queries and time of expanding a repeating shift
+
+    python -m benchmarks.repeat_shifts
+
+compares the chunked bulk expansion done by core.tasks.expand_repetitions,
+called in process here, with creating every repetition and its services one
+row at a time.
+"""
+from benchmarks.common import count_queries, ms, report, test_database
+
+import datetime
+import time
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.utils import timezone
+
+from core.models import Item, Service, Shift, repeat_shifts, update_item
+from core.tasks import expand_repetitions
+
+
+def per_row(shift):
+    """the expansion as it was before the bulk inserts"""
+    services = list(shift.services.all())
+    for repeat_shift in repeat_shifts(shift):
+        repeat_shift.save()
+        for service in services:
+            repeat_shift.services.add(service)
+
+
+def expand(item, services, n_time_repeat, expansion):
+    start = timezone.now().replace(microsecond=0)
+    shift = Shift.objects.create(
+        item=item, start_date=start, end_date=start + datetime.timedelta(hours=8),
+        repeat='every week', n_time_repeat=n_time_repeat,
+    )
+    m2m_changed.disconnect(update_item, sender=Shift.services.through)
+    try:
+        shift.services.add(*services)
+    finally:
+        m2m_changed.connect(update_item, sender=Shift.services.through)
+
+    def run():
+        with transaction.atomic():
+            expansion(shift)
+
+    began = time.perf_counter()
+    queries = count_queries(run)
+    return queries, time.perf_counter() - began
+
+
+def bulk(shift):
+    expand_repetitions(shift.pk)
+
+
+def main():
+    with test_database():
+        item = Item.objects.create(name='bench')
+        services = [
+            Service.objects.create(name=f'bench {i}', duration=datetime.timedelta(minutes=15), price=1)
+            for i in range(5)
+        ]
+        rows = []
+        for n_time_repeat in (1, 4, 12, 52, 104):
+            row_queries, row_time = expand(item, services, n_time_repeat, per_row)
+            bulk_queries, bulk_time = expand(item, services, n_time_repeat, bulk)
+            rows.append((
+                n_time_repeat, row_queries, bulk_queries,
+                ms(row_time), ms(bulk_time), f'{row_time / bulk_time:.1f}x',
+            ))
+
+    report(
+        'weekly shift with 5 services',
+        rows,
+        ('repeats', 'queries per row', 'queries job', 'per row', 'job', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""per row cost of the list serializers against their compiled versions
+
+    python -m benchmarks.serializers [rows]
+
+times serializer(queryset, many=True).data against CompiledSerializer rendering
+the same rows from values_list, both including their queries, and checks the
+JSON of the two is the same bytes.
+"""
+from benchmarks.common import best_of, count_queries, report, test_database
+
+import datetime
+import sys
+
+from django.db import connection
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.models import Category, Item, Reservation, Service, Shift, User
+from main.fast_serializers import compile_serializer
+from main.serializers import ItemSerializer, ReservationSerializer, ServiceSerializer, ShiftSerializer
+
+
+def seed(total):
+    category = Category.objects.create(name='bench')
+    user = User.objects.create(username='bench')
+    services = Service.objects.bulk_create(
+        Service(name=f'service {i}', duration=datetime.timedelta(minutes=15), price=10) for i in range(3)
+    )
+    items = Item.objects.bulk_create(
+        Item(name=f'item {i}', category=category, description='about the item', experience='10')
+        for i in range(total)
+    )
+    start = timezone.now()
+    shifts = Shift.objects.bulk_create(
+        Shift(
+            item=item, repeat='do not repeat',
+            start_date=start + datetime.timedelta(hours=i),
+            end_date=start + datetime.timedelta(hours=i + 2),
+        )
+        for i, item in enumerate(items)
+    )
+    Shift.services.through.objects.bulk_create(
+        Shift.services.through(shift_id=shift.pk, service_id=service.pk) for shift in shifts for service in services
+    )
+    Reservation.objects.bulk_create(
+        Reservation(reserver=user, item=shift.item, shift=shift, service=services[0], time_date=shift.start_date)
+        for shift in shifts
+    )
+
+
+def per_row(seconds, total):
+    return f'{seconds / total * 1e6:.1f}us'
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    context = {'request': APIRequestFactory().get('/')}
+    cases = [
+        ('items', ItemSerializer, Item.objects.select_related('category')),
+        ('shifts', ShiftSerializer, Shift.objects.prefetch_related(
+            Prefetch('services', queryset=Service.objects.order_by('pk')),
+        )),
+        ('reservations', ReservationSerializer, Reservation.objects.select_related('reserver')),
+        ('services', ServiceSerializer, Service.objects.all()),
+    ]
+    rows = []
+    with test_database():
+        seed(total)
+        for name, serializer_class, queryset in cases:
+            compiled = compile_serializer(serializer_class, context)
+
+            def drf():
+                return serializer_class(queryset.all(), many=True, context=context).data
+
+            def fast():
+                return compiled.render(compiled.rows(queryset.all()))
+
+            same = JSONRenderer().render(drf()) == JSONRenderer().render(fast())
+            n = queryset.count()
+            drf_time, fast_time = best_of(drf, 3), best_of(fast, 3)
+            rows.append((
+                name, n,
+                per_row(drf_time, n), count_queries(drf),
+                per_row(fast_time, n), count_queries(fast),
+                f'{drf_time / fast_time:.1f}x', 'yes' if same else 'NO',
+            ))
+
+    report(
+        f'list serializers per row on {connection.vendor}',
+        rows,
+        ('list', 'rows', 'serializer', 'queries', 'compiled', 'queries', 'speedup', 'same json'),
+    )
+
+
+if __name__ == '__main__':
+    main()
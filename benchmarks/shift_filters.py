@@ -0,0 +1,107 @@
+"""latency of the /shifts/ filters with and without the indexes of migration 0010
+
+    python -m benchmarks.shift_filters [shifts]
+
+seeds `shifts` shifts (200000 by default) over 200 items and 20 services,
+every item working a shift a day for years up to a month from now and most
+of the past ones archived, then prints the plan and the best time of the
+ShiftFilter queryset of every filter combination, first with the new indexes
+dropped and again with them in place. Only the last month of shifts is
+upcoming, so with the indexes the times should not grow with `shifts`.
+"""
+from benchmarks.common import best_of, ms, report, test_database
+
+import datetime
+import random
+import sys
+
+from django.db import connection
+from django.utils import timezone
+
+from core.models import Item, Service, Shift
+from main.filters import ShiftFilter
+
+INDEXES = ('shift_active_item_end_idx', 'shift_active_end_idx')
+N_ITEMS = 200
+N_SERVICES = 20
+BATCH = 5000
+
+
+def seed(total):
+    random.seed(0)
+    items = Item.objects.bulk_create(Item(name=f'item {i}', description='') for i in range(N_ITEMS))
+    services = Service.objects.bulk_create(
+        Service(name=f'service {i}', duration=datetime.timedelta(minutes=15), price=1) for i in range(N_SERVICES)
+    )
+    now = timezone.now().replace(microsecond=0)
+    days = total // N_ITEMS
+    first = now - datetime.timedelta(days=days - 30)
+    for offset in range(0, total, BATCH):
+        shifts = []
+        for n in range(offset, min(offset + BATCH, total)):
+            start = first + datetime.timedelta(days=n // N_ITEMS, hours=8)
+            shifts.append(Shift(
+                item=items[n % N_ITEMS], start_date=start, end_date=start + datetime.timedelta(hours=8),
+                repeat='do not repeat', is_available=random.random() < 0.8,
+                is_archive=start < now - datetime.timedelta(days=7) and random.random() < 0.9,
+            ))
+        shifts = Shift.objects.bulk_create(shifts)
+        Shift.services.through.objects.bulk_create(
+            Shift.services.through(shift_id=shift.pk, service_id=random.choice(services).pk) for shift in shifts
+        )
+    return items, services, now
+
+
+def cases(items, services, now):
+    """(name, query parameters) of the filter combinations of /shifts/"""
+    item, service = items[N_ITEMS // 2].pk, services[0].pk
+    week = {'after': now.isoformat(), 'before': (now + datetime.timedelta(days=7)).isoformat()}
+    return [
+        ('upcoming', {}),
+        ('doctor week', {'item': item, **week}),
+        ('doctor upcoming available', {'item': item, 'is_available': 'true'}),
+        ('service week', {'service': service, **week}),
+        ('doctor service', {'item': item, 'service': service}),
+        ('available week', {'is_available': 'true', **week}),
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        return queryset.explain(analyze=True)
+    return queryset.explain()
+
+
+def set_indexes(present):
+    with connection.schema_editor() as editor:
+        for index in Shift._meta.indexes:
+            if index.name in INDEXES:
+                (editor.add_index if present else editor.remove_index)(Shift, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with test_database():
+        filters = cases(*seed(total))
+        timings = {}
+        for present in (False, True):
+            set_indexes(present)
+            label = 'with' if present else 'without'
+            for name, params in filters:
+                queryset = ShiftFilter(params, queryset=Shift.objects.all()).qs
+                print(f'--- {name}, {label} the new indexes')
+                print(explain(queryset))
+                print()
+                timings.setdefault(name, []).append(best_of(lambda: list(queryset.all()), 5))
+
+    report(
+        f'{total} shifts on {connection.vendor}',
+        [(name, ms(before), ms(after), f'{before / after:.1f}x') for name, (before, after) in timings.items()],
+        ('filters', 'without', 'with', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""rows per second of the shift import
+
+    python -m benchmarks.shift_import [rows]
+
+the CSV lines are generated on the fly, like reading a file line by line.
+"""
+from benchmarks.common import count_queries, report, test_database
+
+import datetime
+import sys
+
+from django.utils import timezone
+
+from core.models import Item, Service, Shift
+from core.shift_import import csv_rows, import_shifts
+
+
+def lines(items, services, rows):
+    yield 'item,start_date,end_date,services\n'
+    start = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+    for i in range(rows):
+        begin = start + datetime.timedelta(hours=i)
+        yield (
+            f'{items[i % len(items)].pk},{begin:%Y-%m-%d %H:%M},'
+            f'{begin + datetime.timedelta(hours=1):%Y-%m-%d %H:%M},'
+            f'{";".join(str(service.pk) for service in services)}\n'
+        )
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with test_database():
+        items = [Item.objects.create(name=f'bench {i}') for i in range(20)]
+        services = [
+            Service.objects.create(name=f'bench {i}', duration=datetime.timedelta(minutes=15), price=1)
+            for i in range(3)
+        ]
+        results = []
+        for chunk_size in (100, 1000, 5000):
+            result = None
+
+            def run():
+                nonlocal result
+                result = import_shifts(csv_rows(lines(items, services, rows)), chunk_size)
+
+            queries = count_queries(run)
+            results.append((chunk_size, result.created, queries, f'{result.seconds:.2f}s', f'{result.rows_per_second:.0f}'))
+            Shift.objects.all().delete()
+
+    report(f'{rows} shifts with 3 services each', results, ('chunk', 'imported', 'queries', 'time', 'rows/s'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""compare the pure python slot generation with the numpy occupancy mask
+
+    python -m benchmarks.slot_generation
+"""
+from benchmarks.common import best_of, ms, report
+
+import datetime
+import random
+
+from django.utils import timezone
+
+from core import availability
+from core.availability import free_gaps, merge_intervals, slot_starts, vector_slot_starts
+
+
+def dense_bookings(start, end, rng):
+    """reservations of 5 to 20 minutes covering roughly half of the shift"""
+    busy = []
+    cursor = start
+    while cursor < end:
+        length = datetime.timedelta(minutes=rng.choice((5, 10, 15, 20)))
+        if rng.random() < 0.5:
+            busy.append((cursor, cursor + length))
+        cursor += length
+    return busy
+
+
+def main():
+    if availability.np is None:
+        print('numpy is not installed, only the pure python path is available')
+        return
+
+    rng = random.Random(0)
+    start = timezone.now().replace(second=0, microsecond=0)
+    duration = datetime.timedelta(minutes=5)
+
+    rows = []
+    for hours in (1, 12, 24, 24 * 7, 24 * 30, 24 * 90):
+        end = start + datetime.timedelta(hours=hours)
+        busy = dense_bookings(start, end, rng)
+
+        def python():
+            return slot_starts(free_gaps(start, end, merge_intervals(busy)), duration)
+
+        def vector():
+            return vector_slot_starts(start, end, busy, duration)
+
+        assert python() == vector()
+        python_time = best_of(python, 20)
+        vector_time = best_of(vector, 20)
+        rows.append((
+            f'{hours}h', len(busy), len(python()),
+            ms(python_time), ms(vector_time), f'{python_time / vector_time:.1f}x',
+        ))
+
+    report(
+        '5 minute slots, about half of each shift booked',
+        rows,
+        ('shift', 'reservations', 'slots', 'python', 'numpy', 'speedup'),
+    )
+
+
+if __name__ == '__main__':
+    main()
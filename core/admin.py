@@ -1,12 +1,23 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
 from .widget import TimePickerInput, DatePickerInput
 from durationwidget.widgets import TimeDurationWidget
 from django.forms import ModelForm, ValidationError
 from datetime import datetime, date
 from django import forms
 from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
 from django.contrib.auth.admin import UserAdmin
 from .models import Item, Reservation, Shift, Service, Category, User, ShiftArchive, ReservationArchive
+from .models import REPEAT_STEPS, repeat_shift
+from .recurrence import lazy_recurrence_enabled
+from .shift_import import COLUMNS, csv_rows, format_of, ics_rows, import_shifts
+from .validators import validate_service_durations
 from rest_framework.authtoken.models import TokenProxy as DRFToken
 
 
@@ -47,10 +58,7 @@ class ShiftAdminForm(ModelForm):
         services = self.cleaned_data.get('services')
         start_date = self.cleaned_data.get('start_date')
         end_date = self.cleaned_data.get('end_date')
-        for service in services:
-            difft = end_date - start_date
-            if difft.seconds < service.duration.seconds:
-                raise ValidationError("duration of service is greater than your time slot length")
+        validate_service_durations(start_date, end_date, services)
 
         return super().clean()
 
@@ -74,6 +82,19 @@ class ShiftAdminForm(ModelForm):
 
 
 
+
+
+class ShiftImportForm(forms.Form):
+    file = forms.FileField(help_text='a .csv or .ics file')
+    item = forms.ModelChoiceField(
+        queryset=Item.objects.all(), required=False,
+        help_text='item of iCalendar events without X-ITEM',
+    )
+    services = forms.CharField(
+        required=False,
+        help_text='service ids of iCalendar events without X-SERVICES, e.g. 1;2',
+    )
+    dry_run = forms.BooleanField(required=False, help_text='only validate the rows')
 
 
 @admin.action(description='archive')
@@ -83,14 +104,51 @@ def make_archive(modeladmin, request, queryset):
 class ShiftAdmin(admin.ModelAdmin):
     list_display = ('start_date', 'end_date', 'item', 'get_category')
     list_filter = ('services', 'item')
+    readonly_fields = ('expansion_progress', 'occurrences')
 
     actions = [make_archive]
+    change_list_template = 'admin/core/shift/change_list.html'
 
     def get_form(self, request, obj, **kwargs):
         if obj:
             return super().get_form(request, obj,**kwargs)
         return ShiftAdminForm
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='core_shift_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """upload a CSV or iCalendar file of shifts, see core.shift_import"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ShiftImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            if format_of(upload.name) == 'ics':
+                item = form.cleaned_data['item']
+                rows = ics_rows(lines, item and str(item.pk), form.cleaned_data['services'])
+            else:
+                rows = csv_rows(lines)
+            result = import_shifts(rows, dry_run=form.cleaned_data['dry_run'])
+            for line, message in result.rejected[:20]:
+                self.message_user(request, f'line {line}: {message}', messages.WARNING)
+            if len(result.rejected) > 20:
+                self.message_user(request, f'{len(result.rejected) - 20} more rows rejected', messages.WARNING)
+            self.message_user(request, str(result), messages.SUCCESS)
+            return redirect('admin:core_shift_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import shifts',
+            'form': form,
+            'columns': ','.join(COLUMNS),
+        }
+        return render(request, 'admin/core/shift/import.html', context)
+
 
     def get_queryset(self, request):
         return super().get_queryset(request).filter(is_archive = False)
@@ -99,6 +157,37 @@ class ShiftAdmin(admin.ModelAdmin):
         return obj.item.category
     get_category.short_description = 'Category'
 
+    def expansion_progress(self, obj):
+        """repetitions created so far by the background job"""
+        if obj is None or obj.pk is None or obj.repeat not in REPEAT_STEPS or lazy_recurrence_enabled():
+            return '-'
+        if obj.n_time_expanded >= obj.n_time_repeat:
+            return f'done, {obj.n_time_repeat} repetitions'
+        return f'{obj.n_time_expanded} of {obj.n_time_repeat} repetitions created'
+
+    # repetitions listed on the change page, the others are counted and linked
+    OCCURRENCES_SHOWN = 20
+
+    def occurrences(self, obj):
+        """the first OCCURRENCES_SHOWN repetitions of the shift, saved ones link to their own page"""
+        if obj is None or obj.pk is None or obj.repeat not in REPEAT_STEPS:
+            return '-'
+        shown = min(obj.n_time_repeat, self.OCCURRENCES_SHOWN)
+        saved = {shift.occurrence: shift for shift in obj.repeatShifts.filter(occurrence__lte=shown)}
+        rows = []
+        for n in range(1, shown + 1):
+            if n in saved:
+                url = reverse('admin:core_shift_change', args=[saved[n].pk])
+                rows.append(format_html('<a href="{}">{}</a>', url, saved[n].start_date))
+            else:
+                rows.append(format_html('{} (not booked yet)', repeat_shift(obj, n).start_date))
+        if obj.n_time_repeat > shown:
+            url = f"{reverse('admin:core_shift_changelist')}?shift__id__exact={obj.pk}"
+            rows.append(format_html(
+                '{} more, the saved ones are <a href="{}">listed here</a>', obj.n_time_repeat - shown, url,
+            ))
+        return format_html_join(mark_safe('<br>'), '{}', ((row,) for row in rows))
+
 
 class ShiftArchiveAdmin(admin.ModelAdmin):
 
@@ -0,0 +1,218 @@
+"""free time computation for shifts
+
+busy time of a shift is fetched as (start, end) pairs in one query, merged into
+a sorted list of disjoint intervals and the free slots are emitted per gap with
+plain arithmetic instead of walking the shift one service duration at a time.
+When numpy is installed, long shifts go through an occupancy mask instead.
+"""
+import bisect
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from django.db.models import DateTimeField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from .models import Reservation
+
+
+def reservation_end():
+    """expression for the end of a reservation (time_date + service duration)"""
+    return ExpressionWrapper(
+        F('time_date') + F('service__duration'),
+        output_field=DateTimeField(),
+    )
+
+
+def busy_intervals(shift_id):
+    """(start, end) pairs of the reservations of a shift, ordered by start"""
+    return list(
+        Reservation.objects
+        .filter(shift_id=shift_id, service__isnull=False)
+        .annotate(end=reservation_end())
+        .order_by('time_date')
+        .values_list('time_date', 'end')
+    )
+
+
+def busy_intervals_by_shift(shift_ids):
+    """busy_intervals for many shifts in one query, keyed by shift id"""
+    busy = {shift_id: [] for shift_id in shift_ids}
+    rows = (
+        Reservation.objects
+        .filter(shift_id__in=busy, service__isnull=False)
+        .annotate(end=reservation_end())
+        .order_by('shift_id', 'time_date')
+        .values_list('shift_id', 'time_date', 'end')
+    )
+    for shift_id, start, end in rows:
+        busy[shift_id].append((start, end))
+    return busy
+
+
+def merge_intervals(intervals):
+    """merge overlapping or touching intervals, input must be sorted by start
+
+    empty intervals are dropped, they do not keep any time busy
+    """
+    merged = []
+    for start, end in intervals:
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def free_gaps(start, end, busy):
+    """gaps of [start, end) that are not covered by the merged busy intervals"""
+    gaps = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = busy_end
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def slot_starts(gaps, duration):
+    """start times of back to back slots of `duration` fitting in each gap"""
+    starts = []
+    if not duration:
+        return starts
+    for gap_start, gap_end in gaps:
+        count = (gap_end - gap_start) // duration
+        starts.extend(gap_start + duration * i for i in range(count))
+    return starts
+
+
+MICROSECOND = timedelta(microseconds=1)
+# below this many possible slots the numpy setup costs more than it saves,
+# see benchmarks/slot_generation.py
+VECTOR_MIN_SLOTS = 1024
+# mask cells are gcd(duration, every boundary), give up on absurdly fine grids
+VECTOR_MAX_CELLS = 1 << 22
+
+
+def vector_slot_starts(start, end, busy, duration):
+    """slot_starts of free_gaps(start, end, busy) computed on an occupancy mask
+
+    busy needs no merging. Returns None when the mask would be too fine.
+    """
+    step = duration // MICROSECOND
+    length = (end - start) // MICROSECOND
+    # integer microsecond offsets from the shift start, clipped to the shift
+    offsets = np.array(
+        [(moment - start) // MICROSECOND for interval in busy for moment in interval],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    offsets = np.clip(offsets, 0, length)
+    offsets = offsets[offsets[:, 1] > offsets[:, 0]]
+    unit = int(np.gcd.reduce(np.concatenate(([step, length], offsets.ravel()))))
+    cells = length // unit
+    if cells > VECTOR_MAX_CELLS:
+        return None
+
+    # +1 where a reservation starts, -1 where it ends, occupied where the running sum is positive
+    offsets //= unit
+    delta = (
+        np.bincount(offsets[:, 0], minlength=cells + 1)
+        - np.bincount(offsets[:, 1], minlength=cells + 1)
+    )
+    free = np.cumsum(delta[:-1]) <= 0
+
+    edges = np.diff(np.concatenate(([False], free, [False])).astype(np.int8))
+    gap_starts = np.flatnonzero(edges == 1)
+    gap_ends = np.flatnonzero(edges == -1)
+
+    per_slot = step // unit
+    counts = (gap_ends - gap_starts) // per_slot
+    first_of_gap = np.repeat(np.cumsum(counts) - counts, counts)
+    slot_cells = np.repeat(gap_starts, counts) + (np.arange(counts.sum()) - first_of_gap) * per_slot
+
+    offsets = (slot_cells * unit).astype('timedelta64[us]').astype(object)
+    return list(np.array([start], dtype=object) + offsets)
+
+
+def free_slots(shift, duration, busy=None):
+    """free slots of a shift for a service duration, in the free_time format"""
+    if busy is None:
+        busy = busy_intervals(shift.pk)
+    starts = None
+    if np is not None and duration and (shift.end_date - shift.start_date) // duration >= VECTOR_MIN_SLOTS:
+        starts = vector_slot_starts(shift.start_date, shift.end_date, busy, duration)
+    if starts is None:
+        gaps = free_gaps(shift.start_date, shift.end_date, merge_intervals(busy))
+        starts = slot_starts(gaps, duration)
+    return [{'start': start} for start in starts]
+
+
+def with_held(busy, held, shift_id):
+    """busy intervals of a shift plus its intervals in held, {shift id: [(start, end)]}"""
+    if not held or shift_id not in held:
+        return busy
+    return sorted(busy + held[shift_id])
+
+
+def free_slots_by_item_and_day(shifts, duration, window_start, window_end, held=None):
+    """free slots of many shifts grouped as {item id: {day: [slots]}}
+
+    shifts should be ordered by start_date, reservations of all of them are
+    fetched in one query and only slots starting inside the window are kept.
+    held are more busy intervals by shift id, e.g. holds
+    """
+    busy = busy_intervals_by_shift([shift.pk for shift in shifts])
+    grouped = {}
+    for shift in shifts:
+        for slot in free_slots(shift, duration, with_held(busy[shift.pk], held, shift.pk)):
+            if window_start <= slot['start'] < window_end:
+                day = timezone.localdate(slot['start']).isoformat()
+                grouped.setdefault(shift.item_id, {}).setdefault(day, []).append(slot)
+    return grouped
+
+
+def earliest_free_slots(shifts, duration, after, k, chunk_size=50, held=None):
+    """earliest k free slots of the shifts queryset starting at or after `after`
+
+    shifts are scanned in start_date order a chunk at a time, the scan stops as
+    soon as the next shift starts after the k-th earliest slot found so far.
+    held are as in free_slots_by_item_and_day
+    """
+    shifts = shifts.filter(end_date__gt=after).order_by('start_date', 'pk')
+    found = []
+    last = None
+    while True:
+        chunk = shifts
+        if last is not None:
+            chunk = chunk.filter(Q(start_date__gt=last.start_date) | Q(start_date=last.start_date, pk__gt=last.pk))
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            break
+        busy = busy_intervals_by_shift([shift.pk for shift in chunk])
+        for shift in chunk:
+            if len(found) >= k and shift.start_date >= found[k - 1][0]:
+                chunk = None
+                break
+            for slot in free_slots(shift, duration, with_held(busy[shift.pk], held, shift.pk)):
+                if slot['start'] < after:
+                    continue
+                if len(found) >= k and slot['start'] >= found[k - 1][0]:
+                    break
+                bisect.insort(found, (slot['start'], shift.pk, shift.item_id))
+                del found[k:]
+        if chunk is None:
+            break
+        last = chunk[-1]
+    return [{'start': start, 'shift': shift, 'item': item} for start, shift, item in found]
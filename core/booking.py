@@ -0,0 +1,83 @@
+"""serialized booking of shifts
+
+every booking path locks the Shift row with SELECT ... FOR UPDATE before
+looking for overlapping reservations, so two requests for the same time on
+the same shift run one after the other and the second one sees the first.
+"""
+import bisect
+
+from django.db import IntegrityError, transaction
+
+from .availability import busy_intervals_by_shift, merge_intervals, reservation_end
+from .models import Reservation, Shift, get_random_string_me
+
+
+class SlotTaken(Exception):
+    """the requested time overlaps another reservation of the shift"""
+
+
+def lock_shift(shift_id):
+    """lock the shift row until the end of the surrounding transaction"""
+    return Shift.objects.select_for_update().get(pk=shift_id)
+
+
+def lock_shifts(shift_ids):
+    """lock several shift rows, always in id order so concurrent batches cannot deadlock"""
+    return list(Shift.objects.select_for_update().filter(pk__in=shift_ids).order_by('pk'))
+
+
+def overlapping_reservations(shift_id, start, end):
+    return (
+        Reservation.objects
+        .filter(shift_id=shift_id, time_date__lt=end)
+        .annotate(end=reservation_end())
+        .filter(end__gt=start)
+    )
+
+
+def check_free(shift_id, start, duration, exclude=None):
+    """raise SlotTaken if [start, start + duration) overlaps a reservation of the shift"""
+    reservations = overlapping_reservations(shift_id, start, start + duration)
+    if exclude is not None:
+        reservations = reservations.exclude(pk=exclude)
+    if reservations.exists():
+        raise SlotTaken()
+
+
+def check_all_free(requested):
+    """raise SlotTaken(index) for the first of the requested (shift_id, start, end)
+    overlapping a stored reservation or another requested one
+
+    the reservations of all shifts are read in one query
+    """
+    busy = {
+        shift_id: merge_intervals(intervals)
+        for shift_id, intervals in busy_intervals_by_shift({shift_id for shift_id, _, _ in requested}).items()
+    }
+    order = sorted(range(len(requested)), key=lambda i: requested[i])
+    for previous, index in zip([None] + order, order):
+        shift_id, start, end = requested[index]
+        if previous is not None:
+            previous_shift, _, previous_end = requested[previous]
+            if previous_shift == shift_id and start < previous_end:
+                raise SlotTaken(index)
+        intervals = busy[shift_id]
+        # the last busy interval starting before the requested end is the only candidate
+        candidate = bisect.bisect_left(intervals, (end,)) - 1
+        if candidate >= 0 and intervals[candidate][1] > start:
+            raise SlotTaken(index)
+
+
+def bulk_create_reservations(reservations):
+    """bulk_create drawing new codes for the batch while one of them is taken"""
+    for attempt in range(Reservation.CODE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return Reservation.objects.bulk_create(reservations)
+        except IntegrityError:
+            codes = [reservation.code for reservation in reservations]
+            collided = len(set(codes)) < len(codes) or Reservation.objects.filter(code__in=codes).exists()
+            if attempt == Reservation.CODE_ATTEMPTS - 1 or not collided:
+                raise
+            for reservation in reservations:
+                reservation.code = get_random_string_me()
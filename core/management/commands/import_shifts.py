@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.shift_import import FORMATS, csv_rows, format_of, ics_rows, import_shifts
+
+
+class Command(BaseCommand):
+    help = 'Import shifts of many items from a CSV or iCalendar file (see core.shift_import)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to import, - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--item', help='item of iCalendar events without X-ITEM')
+        parser.add_argument('--services', default='', help='services of iCalendar events without X-SERVICES')
+        parser.add_argument('--dry-run', action='store_true', help='only validate the rows')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or format_of(path)
+        try:
+            lines = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(e)
+        with lines:
+            if file_format == 'ics':
+                rows = ics_rows(lines, options['item'], options['services'])
+            else:
+                rows = csv_rows(lines)
+            result = import_shifts(rows, options['chunk_size'], options['dry_run'])
+
+        for line, message in result.rejected:
+            self.stderr.write(f'line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(str(result)))
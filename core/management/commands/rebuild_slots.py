@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.availability import busy_intervals_by_shift
+from core.models import Shift, Slot
+from core.slots import build_slots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed free slots of every shift (see SLOT_TABLE_ENABLED)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        shift_ids = list(Shift.objects.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for i in range(0, len(shift_ids), chunk_size):
+            chunk = list(Shift.objects.filter(pk__in=shift_ids[i:i + chunk_size]).prefetch_related('services'))
+            busy = busy_intervals_by_shift([shift.pk for shift in chunk])
+            slots = []
+            for shift in chunk:
+                slots.extend(build_slots(shift, shift.services.all(), busy[shift.pk]))
+            with transaction.atomic():
+                Slot.objects.filter(shift__in=chunk).delete()
+                Slot.objects.bulk_create(slots, batch_size=1000)
+            total += len(slots)
+        self.stdout.write(self.style.SUCCESS(f'{total} slots for {len(shift_ids)} shifts'))
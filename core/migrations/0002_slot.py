@@ -0,0 +1,32 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Slot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.item')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.service')),
+                ('shift', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.shift')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='slot',
+            index=models.Index(fields=['item', 'start'], name='core_slot_item_id_46107e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='slot',
+            index=models.Index(fields=['shift', 'service', 'start'], name='core_slot_shift_i_b57ed2_idx'),
+        ),
+    ]
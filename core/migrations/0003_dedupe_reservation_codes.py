@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count
+from django.utils.crypto import get_random_string
+
+
+def dedupe_codes(apps, schema_editor):
+    """give every reservation but the first of a duplicated code a fresh one"""
+    Reservation = apps.get_model('core', 'Reservation')
+    duplicated = (
+        Reservation.objects.values('code')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .values_list('code', flat=True)
+    )
+    taken = set(Reservation.objects.values_list('code', flat=True))
+    for code in list(duplicated):
+        for reservation in Reservation.objects.filter(code=code).order_by('id')[1:]:
+            new_code = get_random_string(length=9)
+            while new_code in taken:
+                new_code = get_random_string(length=9)
+            taken.add(new_code)
+            reservation.code = new_code
+            reservation.save(update_fields=['code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_slot'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:17
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dedupe_reservation_codes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='code',
+            field=models.CharField(default=core.models.get_random_string_me, max_length=9, unique=True),
+        ),
+    ]
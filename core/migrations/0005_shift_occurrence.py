@@ -0,0 +1,36 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+def number_repetitions(apps, schema_editor):
+    """number the existing repetitions of every shift in start order"""
+    Shift = apps.get_model('core', 'Shift')
+    repetitions = Shift.objects.filter(shift__isnull=False).order_by('shift_id', 'start_date', 'id')
+    parent, n = None, 0
+    for shift in repetitions:
+        if shift.shift_id != parent:
+            parent, n = shift.shift_id, 0
+        n += 1
+        shift.occurrence = n
+        shift.save(update_fields=['occurrence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_reservation_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='occurrence',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(number_repetitions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shift',
+            constraint=models.UniqueConstraint(fields=('shift', 'occurrence'), name='unique_shift_occurrence'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.5 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+def mark_expanded(apps, schema_editor):
+    """repetitions used to be created in the save request, all of them are there"""
+    Shift = apps.get_model('core', 'Shift')
+    parents = Shift.objects.filter(shift__isnull=False).values('shift_id')
+    Shift.objects.filter(pk__in=parents).update(n_time_expanded=models.F('n_time_repeat'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_shift_occurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shift',
+            name='n_time_expanded',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(mark_expanded, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_shift_n_time_expanded'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['reserver', 'time_date', 'id'], name='core_reserv_reserve_07b9fc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['start_date', 'id'], name='core_shift_start_d_c49e49_idx'),
+        ),
+    ]
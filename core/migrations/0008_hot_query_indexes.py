@@ -0,0 +1,29 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['shift', 'time_date'], name='core_reserv_shift_i_578d75_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('is_archive', False), models.Q(('status', 'not accepted'), _negated=True)), fields=['item', 'time_date'], name='reservation_active_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['item', 'start_date'], name='core_shift_item_id_81e086_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(condition=models.Q(('is_archive', False)), fields=['start_date'], name='shift_active_start_idx'),
+        ),
+    ]
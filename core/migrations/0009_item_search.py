@@ -0,0 +1,53 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+# the document core.search.SEARCH_DOCUMENT queries, the planner matches the two
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(first_name, '') || ' ' "
+    "|| coalesce(last_name, '') || ' ' || coalesce(description, ''))"
+)
+
+SEARCH_INDEXES = [
+    ('core_item_search_idx', f'core_item USING gin (({SEARCH_DOCUMENT}))'),
+    ('core_item_name_trgm_idx', 'core_item USING gin (name gin_trgm_ops)'),
+    # icontains is UPPER(column::text) LIKE UPPER(%s) on PostgreSQL, the item admin search and the category match
+    ('core_item_first_name_upper_trgm_idx', 'core_item USING gin ((UPPER(first_name::text)) gin_trgm_ops)'),
+    ('core_item_last_name_upper_trgm_idx', 'core_item USING gin ((UPPER(last_name::text)) gin_trgm_ops)'),
+    ('core_category_name_upper_trgm_idx', 'core_category USING gin ((UPPER(name::text)) gin_trgm_ops)'),
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    """full text and trigram GIN indexes, PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in SEARCH_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['experience'], name='core_item_experie_1e2b4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'experience'], name='core_item_categor_73577e_idx'),
+        ),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
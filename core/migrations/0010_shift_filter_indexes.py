@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_item_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(condition=models.Q(('is_archive', False)), fields=['item', 'end_date'], name='shift_active_item_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(condition=models.Q(('is_archive', False)), fields=['end_date'], name='shift_active_end_idx'),
+        ),
+    ]
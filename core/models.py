@@ -1,7 +1,11 @@
+import calendar
 import os
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import m2m_changed
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 import datetime
 
@@ -60,6 +64,26 @@ class Shift(models.Model):
     n_time_repeat = models.IntegerField(default=1)
     services = models.ManyToManyField('Service')
     is_archive = models.BooleanField(default=False)
+    # which repetition of `shift` this is, see core.recurrence
+    occurrence = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # how many repetitions the background job has created so far
+    n_time_expanded = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shift', 'occurrence'], name='unique_shift_occurrence'),
+        ]
+        indexes = [
+            # cursor pagination, see main.pagination.KeysetPagination
+            models.Index(fields=['start_date', 'id']),
+            # shifts of an item from a date on
+            models.Index(fields=['item', 'start_date']),
+            # free time searches and the admin only look at shifts that are not archived
+            models.Index(fields=['start_date'], condition=Q(is_archive=False), name='shift_active_start_idx'),
+            # the upcoming shifts /shifts/ lists by default, of one item or of all, see main.filters.ShiftFilter
+            models.Index(fields=['item', 'end_date'], condition=Q(is_archive=False), name='shift_active_item_end_idx'),
+            models.Index(fields=['end_date'], condition=Q(is_archive=False), name='shift_active_end_idx'),
+        ]
 
     def __str__(self):
         return  str(self.start_date) + '-' + str(self.end_date) + str(self.id)
@@ -90,14 +114,43 @@ class Reservation(models.Model):
     shift = models.ForeignKey(Shift, on_delete=models.CASCADE, null=True)
     service = models.ForeignKey('Service', on_delete=models.CASCADE, null=True)
     time_date = models.DateTimeField()
-    code = models.CharField(default=get_random_string_me, max_length=9)
+    code = models.CharField(default=get_random_string_me, max_length=9, unique=True)
 
     status = models.CharField(max_length=20, choices=STATUS_TYPES, default='review')
     is_archive = models.BooleanField(default=False)
 
+    CODE_ATTEMPTS = 5
+
+    class Meta:
+        indexes = [
+            # cursor pagination of a patient's reservations
+            models.Index(fields=['reserver', 'time_date', 'id']),
+            # busy intervals of a shift
+            models.Index(fields=['shift', 'time_date']),
+            # the reservation admin, by item, without archived or rejected rows
+            models.Index(
+                fields=['item', 'time_date'],
+                condition=Q(is_archive=False) & ~Q(status='not accepted'),
+                name='reservation_active_item_idx',
+            ),
+        ]
+
     def __str__(self) -> str:
         return self.reserver.username + " " + str(self.service)
 
+    def save(self, *args, **kwargs):
+        # a new reservation draws another code if its code is already taken
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        for attempt in range(self.CODE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.CODE_ATTEMPTS - 1 or not Reservation.objects.filter(code=self.code).exists():
+                    raise
+                self.code = get_random_string_me()
+
 
 class ReservationArchive(Reservation):
     class Meta:
@@ -115,6 +168,13 @@ class Item(models.Model):
     last_name = models.CharField(max_length=100, blank=True, null=True)
     first_name = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # the category and experience filters of /items/, search indexes are in migration 0009
+            models.Index(fields=['experience']),
+            models.Index(fields=['category', 'experience']),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -123,35 +183,203 @@ class ShiftArchive(Shift):
     class Meta:
         proxy = True
 
+
+class Slot(models.Model):
+    """precomputed free slot of a shift for one of its services, see core.slots"""
+
+    shift = models.ForeignKey(Shift, on_delete=models.CASCADE, related_name='slots')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=True)
+    start = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'start']),
+            models.Index(fields=['shift', 'service', 'start']),
+        ]
+
+    def __str__(self):
+        return str(self.start) + ' ' + str(self.shift_id)
+
+# (days, calendar months) between two repetitions
+REPEAT_STEPS = {
+    'every week': (7, 0),
+    'every 2 weeks': (14, 0),
+    'every month': (0, 1),
+    'every 2 months': (0, 2),
+}
+
+
+def add_months(moment, months):
+    """same local wall clock time `months` calendar months later
+
+    the day is clamped to the length of the month, Jan 31 + 1 month is Feb 28
+    """
+    local = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    month = local.month - 1 + months
+    year = local.year + month // 12
+    month = month % 12 + 1
+    return local.replace(year=year, month=month, day=min(local.day, calendar.monthrange(year, month)[1]))
+
+
+def repeat_date(moment, repeat, n):
+    """moment moved n repetitions of `repeat` ahead"""
+    days, months = REPEAT_STEPS[repeat]
+    if months:
+        return add_months(moment, months * n)
+    return moment + datetime.timedelta(days=days * n)
+
+
+def repeat_shift(shift, n):
+    """unsaved n-th repetition of a shift, as long as the shift itself"""
+    start = repeat_date(shift.start_date, shift.repeat, n)
+    return Shift(
+        item_id=shift.item_id,
+        start_date=start,
+        end_date=start + (shift.end_date - shift.start_date),
+        repeat='do not repeat',
+        n_time_repeat=0,
+        shift=shift,
+        occurrence=n,
+    )
+
+
+def repeat_shifts(shift):
+    """unsaved repetitions of a shift, n_time_repeat of them"""
+    return [repeat_shift(shift, n) for n in range(1, shift.n_time_repeat + 1)]
+
+
+def create_repetitions(shift, numbers):
+    """bulk insert the repetitions `numbers` of a shift that have no row yet
+
+    the same few queries however many repetitions there are, no per row
+    signals are sent, see core.tasks.expand_repetitions
+    """
+    from .slots import build_slots, slot_table_enabled
+
+    done = set(shift.repeatShifts.filter(occurrence__in=numbers).values_list('occurrence', flat=True))
+    shifts = Shift.objects.bulk_create([repeat_shift(shift, n) for n in numbers if n not in done])
+    services = list(shift.services.all())
+    Shift.services.through.objects.bulk_create([
+        Shift.services.through(shift_id=repetition.pk, service_id=service.pk)
+        for repetition in shifts
+        for service in services
+    ])
+    if slot_table_enabled():
+        # nothing can be reserved on a shift that did not exist a moment ago
+        Slot.objects.bulk_create([
+            slot for repetition in shifts for slot in build_slots(repetition, services, [])
+        ])
+    return shifts
+
+
+# bulk inserts send no post_save, sent with the new `shifts` instead by
+# core.tasks.expand_repetitions and core.shift_import
+shifts_bulk_created = Signal()
+
+
 # add n_time_repeat more shifts depending on the repeat
-def update_item(sender, instance, action, **kwargs):
-    if action == 'post_add':
-        st = instance.start_date
-        en = instance.end_date
-        if instance.repeat != 'do not repeat':
-            for i in range(instance.n_time_repeat):
-                if instance.repeat == 'every week':
-                    st = st + datetime.timedelta(days=7)
-                    en = en + datetime.timedelta(days=7)
-                elif instance.repeat == 'every 2 weeks':
-                    st = st + datetime.timedelta(days=14)
-                    en = en + datetime.timedelta(days=14)
-                elif instance.repeat == 'every month':
-                    st = st + datetime.timedelta(days=30)
-                    en = en + datetime.timedelta(days=30)
-                elif instance.repeat == 'every 2 months':
-                    st = st+ datetime.timedelta(days=60)
-                    en = en + datetime.timedelta(days=60)
-                s = Shift.objects.create(
-                    item=instance.item,
-                    start_date=st,
-                    end_date=en,
-                    repeat= 'do not repeat',
-                    n_time_repeat = 0,
-                    shift = instance,
-                )
-
-                for t in instance.services.all():
-                    s.services.add(t)
-
-m2m_changed.connect(update_item, sender=Shift.services.through)
\ No newline at end of file
+# the repetitions are created by a background job once the shift is committed
+def update_item(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    from .recurrence import lazy_recurrence_enabled
+    from .slots import refresh_shift_slots, slot_table_enabled
+    from .tasks import expand_repetitions
+
+    if action != 'post_add' or reverse or instance.repeat not in REPEAT_STEPS:
+        return
+    if lazy_recurrence_enabled():
+        # repetitions are expanded when read, see core.recurrence
+        return
+    # repetitions made before only get the services just added
+    existing = list(instance.repeatShifts.filter(occurrence__isnull=False))
+    Shift.services.through.objects.bulk_create([
+        Shift.services.through(shift_id=shift.pk, service_id=pk)
+        for shift in existing
+        for pk in pk_set or ()
+    ], ignore_conflicts=True)
+    if slot_table_enabled():
+        for shift in existing:
+            refresh_shift_slots(shift)
+    if instance.n_time_expanded < instance.n_time_repeat:
+        transaction.on_commit(lambda: expand_repetitions.delay(instance.pk))
+
+m2m_changed.connect(update_item, sender=Shift.services.through)
+
+
+# keep the precomputed slots of a shift in line with its dates and services
+def update_slots(sender, instance, action=None, created=False, reverse=False, pk_set=None, **kwargs):
+    from .slots import refresh_shift_slots, slot_table_enabled
+
+    if not slot_table_enabled() or created:
+        return
+    if action not in (None, 'post_add', 'post_remove', 'post_clear'):
+        return
+    if action is None:
+        refresh_shift_slots(instance)
+    elif action == 'post_add' and not reverse:
+        refresh_shift_slots(instance, Service.objects.filter(pk__in=pk_set))
+    elif action == 'post_add':
+        for shift in Shift.objects.filter(pk__in=pk_set):
+            refresh_shift_slots(shift, [instance])
+    else:
+        # services taken off shifts only lose their own slots
+        removed = Slot.objects.filter(service=instance) if reverse else Slot.objects.filter(shift=instance)
+        if action == 'post_remove':
+            removed = removed.filter(**{'shift__in' if reverse else 'service__in': pk_set})
+        removed.delete()
+
+m2m_changed.connect(update_slots, sender=Shift.services.through)
+post_save.connect(update_slots, sender=Shift)
+
+
+def booking(reservation):
+    """(shift id, start, end) of the time a reservation keeps busy, None if it keeps none"""
+    if reservation.shift_id is None or reservation.service_id is None:
+        return None
+    return reservation.shift_id, reservation.time_date, reservation.time_date + reservation.service.duration
+
+
+# a reservation saved or deleted anywhere, admin and ORM included, moves the slots around its time
+def remember_booking(sender, instance, **kwargs):
+    from .slots import slot_table_enabled
+
+    if not slot_table_enabled() or instance._state.adding:
+        return
+    stored = Reservation.objects.select_related('service').filter(pk=instance.pk).first()
+    instance._stored_booking = booking(stored) if stored is not None else None
+
+
+def update_booking_slots(sender, instance, **kwargs):
+    from .slots import refresh_booked_slots, slot_table_enabled
+
+    if not slot_table_enabled():
+        return
+    bookings = {getattr(instance, '_stored_booking', None), booking(instance)} - {None}
+    instance._stored_booking = None
+    refresh_booked_slots(bookings)
+
+pre_save.connect(remember_booking, sender=Reservation)
+post_save.connect(update_booking_slots, sender=Reservation)
+post_delete.connect(update_booking_slots, sender=Reservation)
+
+
+# a new duration moves every slot of the service
+def remember_duration(sender, instance, **kwargs):
+    from .slots import slot_table_enabled
+
+    if not slot_table_enabled() or instance._state.adding:
+        return
+    stored = Service.objects.filter(pk=instance.pk).values_list('duration', flat=True).first()
+    instance._duration_changed = stored is not None and stored != instance.duration
+
+
+def update_service_slots(sender, instance, created=False, **kwargs):
+    from .slots import refresh_service_slots, slot_table_enabled
+
+    if not slot_table_enabled() or created or not getattr(instance, '_duration_changed', False):
+        return
+    instance._duration_changed = False
+    refresh_service_slots(instance)
+
+pre_save.connect(remember_duration, sender=Service)
+post_save.connect(update_service_slots, sender=Service)
@@ -0,0 +1,169 @@
+"""lazy recurrence of repeating shifts
+
+when settings.LAZY_RECURRENCE is on, a repeating shift keeps its repetitions
+as a rule (repeat, n_time_repeat) instead of copying them into rows. The n-th
+repetition of shift p is addressed as "p-n", expanded in memory when shifts are
+listed or searched for free time and only saved as a real Shift, with
+occurrence=n, once it is booked or edited.
+"""
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .availability import free_slots, free_slots_by_item_and_day
+from .models import REPEAT_STEPS, Shift, repeat_shift
+
+OCCURRENCE_ID = re.compile(r'^(\d+)-(\d+)$')
+
+
+def lazy_recurrence_enabled():
+    return getattr(settings, 'LAZY_RECURRENCE', False)
+
+
+def occurrence_id(shift_id, n):
+    return f'{shift_id}-{n}'
+
+
+def parse_occurrence_id(value):
+    """(parent id, n) of a "parent-n" id, None for anything else"""
+    match = OCCURRENCE_ID.match(str(value))
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def is_virtual(shift):
+    return shift.pk is None and getattr(shift, 'occurrence_id', None) is not None
+
+
+def virtual_occurrence(parent, n, service_ids):
+    """unsaved n-th repetition of parent, carrying its id and the parent's services"""
+    shift = repeat_shift(parent, n)
+    shift.is_available = parent.is_available
+    shift.occurrence_id = occurrence_id(parent.pk, n)
+    shift.service_ids = service_ids
+    return shift
+
+
+def virtual_occurrences(shifts, window_start=None, window_end=None):
+    """repetitions of the shifts queryset that have no row yet, ordered by start
+
+    only occurrences overlapping [window_start, window_end) are kept
+    """
+    parents = shifts.filter(repeat__in=REPEAT_STEPS, n_time_repeat__gt=0)
+    if window_end is not None:
+        parents = parents.filter(start_date__lt=window_end)
+    parents = list(parents)
+    if not parents:
+        return []
+    parent_ids = [parent.pk for parent in parents]
+    materialized = set(
+        Shift.objects
+        .filter(shift__in=parent_ids, occurrence__isnull=False)
+        .values_list('shift_id', 'occurrence')
+    )
+    services = {parent_id: [] for parent_id in parent_ids}
+    links = (
+        Shift.services.through.objects
+        .filter(shift__in=parent_ids)
+        .order_by('service_id')
+        .values_list('shift_id', 'service_id')
+    )
+    for shift_id, service_id in links:
+        services[shift_id].append(service_id)
+
+    occurrences = []
+    for parent in parents:
+        for n in range(1, parent.n_time_repeat + 1):
+            if (parent.pk, n) in materialized:
+                continue
+            shift = virtual_occurrence(parent, n, services[parent.pk])
+            if window_end is not None and shift.start_date >= window_end:
+                break
+            if window_start is not None and shift.end_date <= window_start:
+                continue
+            occurrences.append(shift)
+    occurrences.sort(key=lambda shift: shift.start_date)
+    return occurrences
+
+
+def with_occurrences(shifts, window_start=None, window_end=None, reverse=False):
+    """shifts of the queryset together with their virtual occurrences, ordered by start"""
+    real = shifts
+    if window_start is not None:
+        real = real.filter(end_date__gt=window_start)
+    if window_end is not None:
+        real = real.filter(start_date__lt=window_end)
+    found = list(real) + virtual_occurrences(shifts, window_start, window_end)
+    found.sort(key=lambda shift: shift.start_date, reverse=reverse)
+    return found
+
+
+def _check_occurrence(parent, n):
+    if parent.repeat not in REPEAT_STEPS or not 1 <= n <= parent.n_time_repeat:
+        raise Shift.DoesNotExist()
+
+
+def get_occurrence(parent_id, n):
+    """the saved n-th repetition of a shift if there is one, else a virtual one"""
+    materialized = Shift.objects.filter(shift_id=parent_id, occurrence=n).first()
+    if materialized is not None:
+        return materialized
+    parent = Shift.objects.get(pk=parent_id)
+    _check_occurrence(parent, n)
+    return virtual_occurrence(parent, n, list(parent.services.values_list('pk', flat=True)))
+
+
+def materialize(parent_id, n):
+    """saved n-th repetition of a shift, created with the parent's services if needed
+
+    the parent row is locked so two bookings of the same occurrence end up on
+    the same Shift
+    """
+    with transaction.atomic():
+        parent = Shift.objects.select_for_update().get(pk=parent_id)
+        _check_occurrence(parent, n)
+        materialized = Shift.objects.filter(shift=parent, occurrence=n).first()
+        if materialized is not None:
+            return materialized
+        shift = repeat_shift(parent, n)
+        shift.is_available = parent.is_available
+        try:
+            with transaction.atomic():
+                shift.save()
+        except IntegrityError:
+            # no row locks on SQLite, the unique (shift, occurrence) constraint catches the race
+            return Shift.objects.get(shift=parent, occurrence=n)
+        shift.services.set(parent.services.all())
+    return shift
+
+
+def occurrence_slots_by_item_and_day(shifts, duration, window_start, window_end):
+    """free_slots_by_item_and_day of the virtual occurrences of the shifts queryset"""
+    occurrences = virtual_occurrences(shifts, window_start, window_end)
+    return free_slots_by_item_and_day(occurrences, duration, window_start, window_end)
+
+
+def merge_by_item_and_day(grouped, extra):
+    """add the {item id: {day: [slots]}} of extra to grouped, keeping days sorted by start"""
+    for item_id, days in extra.items():
+        item_days = grouped.setdefault(item_id, {})
+        for day, slots in days.items():
+            item_days[day] = sorted(item_days.get(day, []) + slots, key=lambda slot: slot['start'])
+    return grouped
+
+
+def earliest_occurrence_slots(shifts, duration, after, k):
+    """earliest k free slots of the virtual occurrences of the shifts queryset, as earliest_free_slots"""
+    found = []
+    for shift in virtual_occurrences(shifts, window_start=after):
+        if len(found) >= k and shift.start_date >= found[k - 1]['start']:
+            break
+        # nobody can have booked an occurrence without saving it first
+        for slot in free_slots(shift, duration, busy=[]):
+            if slot['start'] >= after:
+                found.append({'start': slot['start'], 'shift': shift.occurrence_id, 'item': shift.item_id})
+        found.sort(key=lambda slot: slot['start'])
+        del found[k:]
+    return found
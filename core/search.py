@@ -0,0 +1,77 @@
+"""ranked search of items by doctor name, description and category
+
+on PostgreSQL a query is matched against the full text document of an item
+with every word as a prefix, and against the item name by trigram
+similarity, both backed by the GIN indexes of migration 0009. Other databases
+fall back to icontains on the same columns. Results are ordered by rank, best
+first.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+SEARCH_COLUMNS = ('name', 'first_name', 'last_name', 'description')
+
+# the expression of the core_item_search_idx index, queries have to use it as is
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple', "
+    + " || ' ' || ".join(f'coalesce("core_item"."{column}", \'\')' for column in SEARCH_COLUMNS)
+    + ")"
+)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def prefix_tsquery(terms):
+    """to_tsquery text matching documents with every term as a word prefix"""
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _postgres_search(items, query, terms):
+    tsquery = prefix_tsquery(terms)
+    document_matches = RawSQL(
+        f"{SEARCH_DOCUMENT} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField(),
+    )
+    # pg_trgm's % operator, doubled for the driver's parameter style
+    similar_name = RawSQL('"core_item"."name" %% %s', [query], output_field=BooleanField())
+    rank = RawSQL(
+        f"ts_rank({SEARCH_DOCUMENT}, to_tsquery('simple', %s)) + similarity(\"core_item\".\"name\", %s)",
+        [tsquery, query],
+        output_field=FloatField(),
+    )
+    return (
+        items
+        .filter(Q(document_matches) | Q(similar_name) | Q(category__name__icontains=query))
+        .annotate(rank=rank)
+        .order_by('-rank', 'pk')
+    )
+
+
+def _fallback_search(items, query, terms):
+    for term in terms:
+        matches = Q(category__name__icontains=term)
+        for column in SEARCH_COLUMNS:
+            matches |= Q(**{f'{column}__icontains': term})
+        items = items.filter(matches)
+    prefix = terms[0]
+    rank = Case(
+        When(name__istartswith=prefix, then=Value(2)),
+        When(Q(first_name__istartswith=prefix) | Q(last_name__istartswith=prefix), then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return items.annotate(rank=rank).order_by('-rank', 'pk')
+
+
+def search_items(items, query):
+    """items of the queryset matching query, best match first"""
+    terms = search_terms(query)
+    if not terms:
+        return items.none()
+    if connection.vendor == 'postgresql':
+        return _postgres_search(items, query, terms)
+    return _fallback_search(items, query, terms)
@@ -0,0 +1,273 @@
+"""bulk import of shifts from CSV or iCalendar files
+
+both formats are read a line at a time and turned into rows of the CSV
+columns
+
+    item,start_date,end_date,services,repeat,n_time_repeat,is_available
+
+services is a list of service ids separated by ; or spaces. Rows are
+validated a chunk at a time with the same service duration check as the
+shift admin form, and every chunk of valid rows is written with a few bulk
+inserts in its own transaction. Invalid rows are skipped and reported with
+their line number.
+"""
+import csv
+import re
+import time
+from datetime import datetime
+from itertools import islice
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import REPEAT_STEPS, Item, Service, Shift, Slot, shifts_bulk_created
+from .slots import build_slots, slot_table_enabled
+from .validators import validate_service_durations
+
+COLUMNS = ('item', 'start_date', 'end_date', 'services', 'repeat', 'n_time_repeat', 'is_available')
+FORMATS = ('csv', 'ics')
+
+# RRULE (FREQ, INTERVAL) pairs a shift can repeat with
+RRULE_REPEATS = {
+    ('WEEKLY', 1): 'every week',
+    ('WEEKLY', 2): 'every 2 weeks',
+    ('MONTHLY', 1): 'every month',
+    ('MONTHLY', 2): 'every 2 months',
+}
+
+
+class ImportResult:
+    """what an import did, rejected rows are (line, message) pairs"""
+
+    def __init__(self):
+        self.created = 0
+        self.rejected = []
+        self.seconds = 0.0
+
+    @property
+    def rows(self):
+        return self.created + len(self.rejected)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.created} shifts imported, {len(self.rejected)} rows rejected '
+            f'in {self.seconds:.2f}s ({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def format_of(filename):
+    """import format from a file name, csv unless it ends in .ics"""
+    return 'ics' if str(filename).lower().endswith('.ics') else 'csv'
+
+
+def csv_rows(lines):
+    """(line number, row) of a CSV stream with a header line"""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _unfolded(lines):
+    """(line number, content line) of an iCalendar stream, folded lines joined"""
+    current = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if current is not None and line[:1] in (' ', '\t'):
+            current[1] += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = [number, line]
+    if current is not None:
+        yield current
+
+
+def _ics_datetime(value, params):
+    """ISO string of an iCalendar DATE-TIME, keeping its zone"""
+    if params.get('VALUE') == 'DATE' or 'T' not in value:
+        raise ValueError("whole day events have no start time")
+    moment = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        moment = moment.replace(tzinfo=ZoneInfo('UTC'))
+    elif 'TZID' in params:
+        try:
+            moment = moment.replace(tzinfo=ZoneInfo(params['TZID']))
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"unknown time zone {params['TZID']}")
+    return moment.isoformat()
+
+
+def _ics_repeat(value):
+    """(repeat, n_time_repeat) of an RRULE"""
+    rule = dict(part.split('=', 1) for part in value.split(';') if '=' in part)
+    repeat = RRULE_REPEATS.get((rule.get('FREQ'), int(rule.get('INTERVAL', 1))))
+    if repeat is None:
+        raise ValueError(f"unsupported RRULE {value}")
+    if 'COUNT' not in rule:
+        raise ValueError("RRULE needs a COUNT")
+    return repeat, str(int(rule['COUNT']) - 1)
+
+
+def ics_rows(lines, item=None, services=''):
+    """(line number, row) of every VEVENT of an iCalendar stream
+
+    the item and services of an event come from its X-ITEM and X-SERVICES
+    properties and default to `item` and `services`
+    """
+    event = None
+    for number, line in _unfolded(lines):
+        name, _, value = line.partition(':')
+        name, *params = name.split(';')
+        params = dict(param.split('=', 1) for param in params if '=' in param)
+        name = name.upper()
+        if name == 'BEGIN' and value == 'VEVENT':
+            event = {'line': number, 'item': item or '', 'services': services, 'error': None}
+        elif event is None:
+            continue
+        elif name == 'END' and value == 'VEVENT':
+            number, error = event.pop('line'), event.pop('error')
+            yield number, ({'error': error} if error else event)
+            event = None
+        elif event['error'] is None:
+            try:
+                if name == 'DTSTART':
+                    event['start_date'] = _ics_datetime(value, params)
+                elif name == 'DTEND':
+                    event['end_date'] = _ics_datetime(value, params)
+                elif name == 'RRULE':
+                    event['repeat'], event['n_time_repeat'] = _ics_repeat(value)
+                elif name == 'X-ITEM':
+                    event['item'] = value
+                elif name == 'X-SERVICES':
+                    event['services'] = value
+            except ValueError as e:
+                event['error'] = f'{name}: {e}'
+
+
+def _datetime(value, column):
+    moment = parse_datetime((value or '').strip())
+    if moment is None:
+        raise ValueError(f"{column} is not a date and time")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_row(row):
+    """Shift fields of an import row plus the service ids, ValueError when malformed"""
+    if row.get('error'):
+        raise ValueError(row['error'])
+    try:
+        item = int(row.get('item') or '')
+    except ValueError:
+        raise ValueError("item is not an id")
+    start_date = _datetime(row.get('start_date'), 'start_date')
+    end_date = _datetime(row.get('end_date'), 'end_date')
+    if end_date <= start_date:
+        raise ValueError("end_date is not after start_date")
+    try:
+        services = [int(pk) for pk in re.split(r'[;,\s]+', row.get('services') or '') if pk]
+    except ValueError:
+        raise ValueError("services are not ids")
+    repeat = (row.get('repeat') or '').strip() or 'do not repeat'
+    if repeat != 'do not repeat' and repeat not in REPEAT_STEPS:
+        raise ValueError(f"unknown repeat {repeat}")
+    try:
+        n_time_repeat = int(row.get('n_time_repeat') or (0 if repeat == 'do not repeat' else 1))
+    except ValueError:
+        raise ValueError("n_time_repeat is not a number")
+    if n_time_repeat < 0:
+        raise ValueError("n_time_repeat is negative")
+    is_available = (row.get('is_available') or 'true').strip().lower() not in ('0', 'false', 'no')
+    return {
+        'item_id': item,
+        'start_date': start_date,
+        'end_date': end_date,
+        'repeat': repeat,
+        'n_time_repeat': n_time_repeat,
+        'is_available': is_available,
+    }, services
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _save(valid):
+    """bulk insert a chunk of (fields, services) with their services and slots"""
+    from .tasks import expand_repetitions
+
+    shifts = Shift.objects.bulk_create([Shift(**fields) for fields, _ in valid])
+    Shift.services.through.objects.bulk_create([
+        Shift.services.through(shift_id=shift.pk, service_id=service.pk)
+        for shift, (_, services) in zip(shifts, valid)
+        for service in services
+    ])
+    if slot_table_enabled():
+        Slot.objects.bulk_create([
+            slot
+            for shift, (_, services) in zip(shifts, valid)
+            for slot in build_slots(shift, services, [])
+        ])
+    shifts_bulk_created.send(sender=Shift, shifts=shifts)
+    for shift in shifts:
+        if shift.repeat in REPEAT_STEPS and shift.n_time_repeat > 0:
+            transaction.on_commit(lambda pk=shift.pk: expand_repetitions.delay(pk))
+
+
+def import_shifts(rows, chunk_size=1000, dry_run=False):
+    """validate and save (line number, row) pairs a chunk at a time, see the module doc"""
+    result = ImportResult()
+    began = time.perf_counter()
+    services_by_id = {}
+    for chunk in _chunks(rows, chunk_size):
+        parsed = []
+        for line, row in chunk:
+            try:
+                parsed.append((line,) + parse_row(row))
+            except ValueError as e:
+                result.rejected.append((line, str(e)))
+
+        item_ids = set(Item.objects.filter(
+            pk__in={fields['item_id'] for _, fields, _ in parsed},
+        ).values_list('pk', flat=True))
+        missing = {pk for _, _, services in parsed for pk in services} - services_by_id.keys()
+        services_by_id.update(Service.objects.in_bulk(missing))
+
+        valid = []
+        for line, fields, service_ids in parsed:
+            unknown = [pk for pk in service_ids if pk not in services_by_id]
+            if fields['item_id'] not in item_ids:
+                result.rejected.append((line, f"unknown item {fields['item_id']}"))
+                continue
+            if unknown:
+                result.rejected.append((line, f"unknown services {', '.join(map(str, unknown))}"))
+                continue
+            services = [services_by_id[pk] for pk in service_ids]
+            try:
+                validate_service_durations(fields['start_date'], fields['end_date'], services)
+            except ValidationError as e:
+                result.rejected.append((line, e.messages[0]))
+                continue
+            valid.append((fields, services))
+
+        if valid and not dry_run:
+            with transaction.atomic():
+                _save(valid)
+        result.created += len(valid)
+
+    result.rejected.sort()
+    result.seconds = time.perf_counter() - began
+    return result
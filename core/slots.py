@@ -0,0 +1,150 @@
+"""materialized free slots
+
+when settings.SLOT_TABLE_ENABLED is on, the free slots of every shift and
+service are stored as Slot rows so reading free time is a single range scan on
+the (shift, service, start) or (item, start) index. The rows of a shift are
+rebuilt whenever its dates or services change, a reservation only rebuilds
+the slots around its own time and a new duration those of its service.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import busy_intervals, busy_intervals_by_shift, free_slots
+from .models import Shift, Slot
+
+
+def slot_table_enabled():
+    return getattr(settings, 'SLOT_TABLE_ENABLED', False)
+
+
+def build_slots(shift, services, busy):
+    """unsaved Slot rows of a shift for the given services"""
+    return [
+        Slot(shift=shift, service=service, item_id=shift.item_id, start=slot['start'])
+        for service in services
+        for slot in free_slots(shift, service.duration, busy)
+    ]
+
+
+def refresh_shift_slots(shift, services=None):
+    """replace the stored slots of a shift, of all its services or only of those given
+
+    does nothing when the table is off
+    """
+    if not slot_table_enabled():
+        return
+    stored = Slot.objects.filter(shift=shift)
+    if services is None:
+        services = shift.services.all()
+    else:
+        stored = stored.filter(service__in=services)
+    with transaction.atomic():
+        stored.delete()
+        Slot.objects.bulk_create(build_slots(shift, services, busy_intervals(shift.pk)))
+
+
+def refresh_service_slots(service):
+    """replace the stored slots of a service on every shift it is offered on, e.g. once its duration changed"""
+    if not slot_table_enabled():
+        return
+    shifts = list(service.shift_set.all())
+    busy = busy_intervals_by_shift([shift.pk for shift in shifts])
+    with transaction.atomic():
+        Slot.objects.filter(service=service).delete()
+        Slot.objects.bulk_create([
+            slot for shift in shifts for slot in build_slots(shift, [service], busy[shift.pk])
+        ])
+
+
+def booked_range(shift, busy, start, end):
+    """[low, high) of the shift whose slots a reservation over [start, end) can change
+
+    free gaps never cross the end of a busy interval before start or the start
+    of one after end, so the slots outside of them stay where they are
+    """
+    low, high = shift.start_date, shift.end_date
+    for busy_start, busy_end in busy:
+        if busy_end <= busy_start:
+            continue
+        if busy_end <= start:
+            low = max(low, busy_end)
+        elif busy_start >= end:
+            high = min(high, busy_start)
+    return low, high
+
+
+def refresh_booked_slots(bookings):
+    """rebuild the stored slots around the (shift id, start, end) of reservations made, moved or cancelled
+
+    only slots in the booked_range of a reservation are deleted and inserted
+    again, the rest of the shift and its other days are not touched
+    """
+    if not slot_table_enabled():
+        return
+    by_shift = {}
+    for shift_id, start, end in bookings:
+        by_shift.setdefault(shift_id, []).append((start, end))
+    for shift in Shift.objects.filter(pk__in=by_shift).prefetch_related('services'):
+        busy = busy_intervals(shift.pk)
+        ranges = [booked_range(shift, busy, start, end) for start, end in by_shift[shift.pk]]
+        in_ranges = Q()
+        for low, high in ranges:
+            in_ranges |= Q(start__gte=low, start__lt=high)
+        with transaction.atomic():
+            Slot.objects.filter(in_ranges, shift=shift).delete()
+            Slot.objects.bulk_create([
+                slot for slot in build_slots(shift, shift.services.all(), busy)
+                if any(low <= slot.start < high for low, high in ranges)
+            ])
+
+
+def shift_slots(shift_id, service_id):
+    """stored free slots of a shift for a service, in the free_time format"""
+    starts = (
+        Slot.objects
+        .filter(shift_id=shift_id, service_id=service_id)
+        .order_by('start')
+        .values_list('start', flat=True)
+    )
+    return [{'start': start} for start in starts]
+
+
+def not_held(held, duration):
+    """Q of the slots of `duration` overlapping none of held, {shift id: [(start, end)]}"""
+    free = Q()
+    for shift_id, intervals in (held or {}).items():
+        for start, end in intervals:
+            free &= ~Q(shift_id=shift_id, start__lt=end, start__gt=start - duration)
+    return free
+
+
+def slots_by_item_and_day(shifts, service_id, window_start, window_end, held=None, duration=None):
+    """stored free slots of the shifts queryset grouped as {item id: {day: [slots]}}
+
+    without the slots of `duration` overlapping held, see not_held
+    """
+    rows = (
+        Slot.objects
+        .filter(not_held(held, duration), shift__in=shifts, service_id=service_id)
+        .filter(start__gte=window_start, start__lt=window_end)
+        .order_by('item_id', 'start')
+        .values_list('item_id', 'start')
+    )
+    grouped = {}
+    for item_id, start in rows:
+        day = timezone.localdate(start).isoformat()
+        grouped.setdefault(item_id, {}).setdefault(day, []).append({'start': start})
+    return grouped
+
+
+def earliest_slots(shifts, service_id, after, k, held=None, duration=None):
+    """earliest k stored free slots of the shifts queryset starting at or after `after`, held as in slots_by_item_and_day"""
+    rows = (
+        Slot.objects
+        .filter(not_held(held, duration), shift__in=shifts, service_id=service_id, start__gte=after)
+        .order_by('start', 'shift_id')
+        .values_list('start', 'shift_id', 'item_id')[:k]
+    )
+    return [{'start': start, 'shift': shift, 'item': item} for start, shift, item in rows]
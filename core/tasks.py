@@ -0,0 +1,33 @@
+"""background jobs of the core app"""
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from .models import REPEAT_STEPS, Shift, create_repetitions, shifts_bulk_created
+
+
+def expansion_chunk_size():
+    return getattr(settings, 'REPETITION_CHUNK_SIZE', 100)
+
+
+@shared_task
+def expand_repetitions(shift_id):
+    """create the missing repetitions of a shift a chunk at a time
+
+    every chunk is its own transaction and moves n_time_expanded of the shift
+    on, so the admin shows the progress and a job run again carries on where
+    the last one stopped
+    """
+    chunk_size = expansion_chunk_size()
+    while True:
+        with transaction.atomic():
+            shift = Shift.objects.select_for_update().filter(pk=shift_id).first()
+            if shift is None or shift.repeat not in REPEAT_STEPS:
+                return
+            if shift.n_time_expanded >= shift.n_time_repeat:
+                return
+            last = min(shift.n_time_expanded + chunk_size, shift.n_time_repeat)
+            repetitions = create_repetitions(shift, range(shift.n_time_expanded + 1, last + 1))
+            # update() so the parent's own post_save handlers do not run again
+            Shift.objects.filter(pk=shift.pk).update(n_time_expanded=last)
+            shifts_bulk_created.send(sender=Shift, shifts=repetitions)
@@ -1,10 +1,24 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from .models import *
 import datetime
 
 User = get_user_model()
 
+# the tests run without the redis and rabbitmq of docker-compose
+test_settings = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+
+
+def setUpModule():
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+
 
 class ModelTestCase(TestCase):
     def setUp(self):
@@ -220,3 +234,638 @@ class AdminTests(TestCase):
             'email',
             'phone_number'
         ))
+
+
+
+#------------------------ availability ------------------------------
+
+
+
+from django.utils import timezone
+from .availability import busy_intervals, merge_intervals, free_gaps, slot_starts, free_slots, earliest_free_slots
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=15), price=10.0
+        )
+        self.user = User.objects.create(username='testuser')
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+
+    def reserve(self, minutes, service=None):
+        return Reservation.objects.create(
+            reserver=self.user,
+            item=self.item,
+            shift=self.shift,
+            service=service or self.service,
+            time_date=self.start + datetime.timedelta(minutes=minutes),
+        )
+
+    def at(self, minutes):
+        return self.start + datetime.timedelta(minutes=minutes)
+
+    def test_merge_intervals(self):
+        intervals = [(1, 3), (2, 5), (5, 6), (8, 9)]
+        self.assertEqual(merge_intervals(intervals), [(1, 6), (8, 9)])
+
+    def test_free_gaps_clips_to_shift(self):
+        busy = [(-5, 1), (3, 4), (9, 20)]
+        self.assertEqual(free_gaps(0, 10, busy), [(1, 3), (4, 9)])
+
+    def test_slot_starts(self):
+        gaps = [(self.at(0), self.at(40)), (self.at(50), self.at(60))]
+        duration = datetime.timedelta(minutes=15)
+        self.assertEqual(slot_starts(gaps, duration), [self.at(0), self.at(15)])
+
+    def test_busy_intervals_single_query(self):
+        self.reserve(30)
+        self.reserve(0)
+        with self.assertNumQueries(1):
+            busy = busy_intervals(self.shift.pk)
+        self.assertEqual(busy, [(self.at(0), self.at(15)), (self.at(30), self.at(45))])
+
+    def test_free_slots_start_after_reservations(self):
+        self.reserve(10)
+        self.reserve(60)
+        slots = free_slots(self.shift, self.service.duration)
+        self.assertEqual(
+            [slot['start'] for slot in slots],
+            [self.at(25), self.at(40), self.at(75), self.at(90), self.at(105)],
+        )
+
+    def test_free_slots_overlapping_reservations(self):
+        long_service = Service.objects.create(
+            name='Long', duration=datetime.timedelta(minutes=60), price=10.0
+        )
+        self.reserve(0, long_service)
+        self.reserve(15)
+        slots = free_slots(self.shift, self.service.duration)
+        self.assertEqual(slots[0]['start'], self.at(60))
+
+    def test_earliest_free_slots_across_shifts(self):
+        other_item = Item.objects.create(name='Other Item')
+        other = Shift.objects.create(
+            item=other_item,
+            start_date=self.at(20),
+            end_date=self.at(50),
+            repeat='do not repeat',
+        )
+        self.reserve(0)
+        slots = earliest_free_slots(Shift.objects.all(), self.service.duration, self.start, 3)
+        self.assertEqual(slots, [
+            {'start': self.at(15), 'shift': self.shift.pk, 'item': self.item.pk},
+            {'start': self.at(20), 'shift': other.pk, 'item': other_item.pk},
+            {'start': self.at(30), 'shift': self.shift.pk, 'item': self.item.pk},
+        ])
+
+    def test_earliest_free_slots_stops_early(self):
+        for days in range(1, 20):
+            Shift.objects.create(
+                item=self.item,
+                start_date=self.start + datetime.timedelta(days=days),
+                end_date=self.start + datetime.timedelta(days=days, hours=1),
+                repeat='do not repeat',
+            )
+        # one chunk of shifts and its reservations
+        with self.assertNumQueries(2):
+            slots = earliest_free_slots(Shift.objects.all(), self.service.duration, self.at(60), 2, chunk_size=5)
+        self.assertEqual([slot['start'] for slot in slots], [self.at(60), self.at(75)])
+
+
+from unittest import mock, skipIf
+from . import availability
+
+
+class VectorSlotTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.end = self.start + datetime.timedelta(hours=12)
+        self.duration = datetime.timedelta(minutes=5)
+        self.busy = [
+            (self.start - datetime.timedelta(minutes=10), self.start + datetime.timedelta(minutes=7)),
+            (self.start + datetime.timedelta(minutes=20), self.start + datetime.timedelta(minutes=50)),
+            (self.start + datetime.timedelta(minutes=30), self.start + datetime.timedelta(minutes=65)),
+            (self.start + datetime.timedelta(hours=11, minutes=58), self.end + datetime.timedelta(hours=1)),
+        ]
+
+    def python_starts(self):
+        gaps = free_gaps(self.start, self.end, merge_intervals(self.busy))
+        return slot_starts(gaps, self.duration)
+
+    @skipIf(availability.np is None, 'numpy is not installed')
+    def test_matches_python(self):
+        starts = availability.vector_slot_starts(self.start, self.end, self.busy, self.duration)
+        self.assertEqual(starts, self.python_starts())
+        self.assertEqual(starts[0], self.start + datetime.timedelta(minutes=7))
+
+    @skipIf(availability.np is None, 'numpy is not installed')
+    def test_too_fine_grid(self):
+        busy = [(self.start, self.start + datetime.timedelta(microseconds=1))]
+        self.assertIsNone(availability.vector_slot_starts(self.start, self.end, busy, self.duration))
+
+    def test_python_fallback(self):
+        shift = Shift(start_date=self.start, end_date=self.end)
+        with mock.patch.object(availability, 'np', None):
+            slots = free_slots(shift, self.duration, self.busy)
+        self.assertEqual([slot['start'] for slot in slots], self.python_starts())
+
+
+
+#------------------------ slots ------------------------------
+
+
+
+from io import StringIO
+from django.core.management import call_command
+from django.test import override_settings
+from .models import Slot
+
+
+@override_settings(SLOT_TABLE_ENABLED=True)
+class SlotTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+
+    def create_shift(self, repeat='do not repeat', n_time_repeat=1):
+        shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat=repeat,
+            n_time_repeat=n_time_repeat,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.services.add(self.service)
+        return shift
+
+    def test_slots_created_with_services(self):
+        shift = self.create_shift()
+        self.assertEqual(shift.slots.count(), 4)
+        self.assertEqual(
+            list(shift.slots.order_by('start').values_list('start', flat=True)),
+            [self.start + datetime.timedelta(minutes=30 * i) for i in range(4)],
+        )
+
+    def test_slots_created_for_repeat_shifts(self):
+        shift = self.create_shift('every week', 2)
+        self.assertEqual(Slot.objects.count(), 12)
+        for repeat_shift in shift.repeatShifts.all():
+            self.assertEqual(repeat_shift.slots.count(), 4)
+
+    def test_slots_follow_shift_dates(self):
+        shift = self.create_shift()
+        shift.end_date = self.start + datetime.timedelta(hours=1)
+        shift.save()
+        self.assertEqual(shift.slots.count(), 2)
+
+    def test_slots_removed_with_service(self):
+        shift = self.create_shift()
+        shift.services.remove(self.service)
+        self.assertEqual(shift.slots.count(), 0)
+
+    def test_rebuild_slots_command(self):
+        with override_settings(SLOT_TABLE_ENABLED=False):
+            shift = self.create_shift()
+        self.assertEqual(shift.slots.count(), 0)
+        call_command('rebuild_slots', stdout=StringIO())
+        self.assertEqual(shift.slots.count(), 4)
+
+    def starts(self, shift):
+        return [
+            int((start - self.start).total_seconds() // 60)
+            for start in shift.slots.order_by('start').values_list('start', flat=True)
+        ]
+
+    def reserve(self, shift, minutes):
+        user, _ = User.objects.get_or_create(username='patient')
+        return Reservation.objects.create(
+            reserver=user, item=self.item, shift=shift, service=self.service,
+            time_date=self.start + datetime.timedelta(minutes=minutes),
+        )
+
+    def test_slots_follow_reservations(self):
+        shift = self.create_shift()
+        reservation = self.reserve(shift, 30)
+        self.assertEqual(self.starts(shift), [0, 60, 90])
+        reservation.time_date = self.start + datetime.timedelta(minutes=45)
+        reservation.save()
+        self.assertEqual(self.starts(shift), [0, 75])
+        reservation.delete()
+        self.assertEqual(self.starts(shift), [0, 30, 60, 90])
+
+    def test_reservation_keeps_other_slots(self):
+        shift = self.create_shift()
+        self.reserve(shift, 60)
+        kept = shift.slots.get(start=self.start + datetime.timedelta(minutes=90)).pk
+        # the slot after the next reservation is left alone
+        self.reserve(shift, 0)
+        self.assertEqual(self.starts(shift), [30, 90])
+        self.assertEqual(shift.slots.get(start=self.start + datetime.timedelta(minutes=90)).pk, kept)
+
+    def test_slots_follow_service_duration(self):
+        shift = self.create_shift()
+        self.service.duration = datetime.timedelta(minutes=60)
+        self.service.save()
+        self.assertEqual(self.starts(shift), [0, 60])
+        self.service.name = 'Renamed'
+        self.service.save()
+        self.assertEqual(self.starts(shift), [0, 60])
+
+
+
+#------------------------ reservation codes ------------------------------
+
+
+
+from django.db import IntegrityError
+from .booking import bulk_create_reservations
+
+
+class ReservationCodeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.existing = Reservation.objects.create(
+            reserver=self.user, time_date=timezone.now(), code='ABC123',
+        )
+
+    def test_code_is_unique(self):
+        field = Reservation._meta.get_field('code')
+        self.assertTrue(field.unique)
+
+    def test_taken_code_is_redrawn(self):
+        reservation = Reservation.objects.create(
+            reserver=self.user, time_date=timezone.now(), code='ABC123',
+        )
+        self.assertNotEqual(reservation.code, 'ABC123')
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_update_keeps_integrity_errors(self):
+        reservation = Reservation.objects.create(reserver=self.user, time_date=timezone.now())
+        reservation.code = 'ABC123'
+        with self.assertRaises(IntegrityError):
+            reservation.save()
+
+    def test_bulk_create_redraws_codes(self):
+        reservations = [
+            Reservation(reserver=self.user, time_date=timezone.now(), code='ABC123'),
+            Reservation(reserver=self.user, time_date=timezone.now()),
+        ]
+        bulk_create_reservations(reservations)
+        self.assertEqual(Reservation.objects.count(), 3)
+        self.assertEqual(Reservation.objects.filter(code='ABC123').count(), 1)
+
+
+
+#------------------------ repeat shifts ------------------------------
+
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .tasks import expand_repetitions
+
+
+class RepeatShiftTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.item = Item.objects.create(name='Test Item')
+        self.services = [
+            Service.objects.create(name=f'Service {i}', duration=datetime.timedelta(minutes=15), price=10.0)
+            for i in range(3)
+        ]
+
+    def create_shift(self, repeat, n_time_repeat):
+        shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat=repeat,
+            n_time_repeat=n_time_repeat,
+        )
+        # the expansion job runs on commit, as the callbacks are executed
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                shift.services.add(*self.services)
+        return shift, queries.captured_queries
+
+    def test_repeat_dates(self):
+        shift, _ = self.create_shift('every 2 weeks', 3)
+        self.assertEqual(
+            list(shift.repeatShifts.order_by('start_date').values_list('start_date', flat=True)),
+            [self.start + datetime.timedelta(days=14 * i) for i in range(1, 4)],
+        )
+        for repeat_shift in shift.repeatShifts.all():
+            self.assertEqual(repeat_shift.repeat, 'do not repeat')
+            self.assertEqual(repeat_shift.end_date - repeat_shift.start_date, datetime.timedelta(hours=2))
+
+    def test_repeat_services(self):
+        shift, _ = self.create_shift('every week', 4)
+        for repeat_shift in shift.repeatShifts.all():
+            self.assertEqual(set(repeat_shift.services.all()), set(self.services))
+
+    def test_do_not_repeat(self):
+        shift, _ = self.create_shift('do not repeat', 4)
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_queries_do_not_grow_with_repetitions(self):
+        _, few = self.create_shift('every week', 2)
+        _, many = self.create_shift('every week', 52)
+        self.assertEqual(Shift.objects.count(), 2 + 2 + 52)
+        # the repetitions inserted by the job are counted too
+        self.assertTrue(any(query['sql'].startswith('INSERT INTO "core_shift" (') for query in many))
+        self.assertEqual(len(few), len(many))
+
+    def test_monthly_repeat_uses_calendar_months(self):
+        self.start = timezone.make_aware(datetime.datetime(2027, 1, 31, 9, 0))
+        shift, _ = self.create_shift('every month', 3)
+        self.assertEqual(
+            [timezone.localtime(start).date() for start in
+             shift.repeatShifts.order_by('start_date').values_list('start_date', flat=True)],
+            [datetime.date(2027, 2, 28), datetime.date(2027, 3, 31), datetime.date(2027, 4, 30)],
+        )
+        for repeat_shift in shift.repeatShifts.all():
+            self.assertEqual(timezone.localtime(repeat_shift.start_date).time(), datetime.time(9, 0))
+            self.assertEqual(repeat_shift.end_date - repeat_shift.start_date, datetime.timedelta(hours=2))
+
+    @override_settings(REPETITION_CHUNK_SIZE=10)
+    def test_expansion_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            shift, _ = self.create_shift('every 2 months', 25)
+        shift.refresh_from_db()
+        self.assertEqual(shift.n_time_expanded, 25)
+        self.assertEqual(shift.repeatShifts.count(), 25)
+        # three chunks, each a transaction of its own
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 3)
+
+    def test_expansion_runs_after_commit(self):
+        shift = Shift.objects.create(
+            start_date=self.start, end_date=self.start + datetime.timedelta(hours=2),
+            repeat='every week', n_time_repeat=3,
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            shift.services.add(self.services[0])
+            self.assertEqual(shift.repeatShifts.count(), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(shift.repeatShifts.count(), 3)
+
+    def test_expansion_carries_on(self):
+        shift, _ = self.create_shift('every week', 4)
+        shift.repeatShifts.filter(occurrence__gt=2).delete()
+        Shift.objects.filter(pk=shift.pk).update(n_time_expanded=2, n_time_repeat=6)
+        expand_repetitions(shift.pk)
+        shift.refresh_from_db()
+        self.assertEqual(shift.n_time_expanded, 6)
+        self.assertEqual(
+            sorted(shift.repeatShifts.values_list('occurrence', flat=True)), [1, 2, 3, 4, 5, 6],
+        )
+
+
+
+#------------------------ lazy recurrence ------------------------------
+
+
+
+from .recurrence import get_occurrence, materialize, parse_occurrence_id, virtual_occurrences
+
+
+@override_settings(LAZY_RECURRENCE=True)
+class RecurrenceTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=15), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='every 2 weeks',
+            n_time_repeat=4,
+        )
+        self.shift.services.add(self.service)
+
+    def test_parse_occurrence_id(self):
+        self.assertEqual(parse_occurrence_id('12-3'), (12, 3))
+        self.assertIsNone(parse_occurrence_id('12'))
+        self.assertIsNone(parse_occurrence_id(12))
+        self.assertIsNone(parse_occurrence_id('12-x'))
+
+    def test_virtual_occurrences(self):
+        occurrences = virtual_occurrences(Shift.objects.all())
+        self.assertEqual(Shift.objects.count(), 1)
+        self.assertEqual([shift.occurrence_id for shift in occurrences], [f'{self.shift.pk}-{n}' for n in range(1, 5)])
+        self.assertEqual(occurrences[1].start_date, self.start + datetime.timedelta(days=28))
+        self.assertEqual(occurrences[1].service_ids, [self.service.pk])
+
+    def test_virtual_occurrences_window(self):
+        occurrences = virtual_occurrences(
+            Shift.objects.all(),
+            self.start + datetime.timedelta(days=20),
+            self.start + datetime.timedelta(days=40),
+        )
+        self.assertEqual([shift.occurrence for shift in occurrences], [2])
+
+    def test_materialize_once(self):
+        shift = materialize(self.shift.pk, 2)
+        self.assertEqual(shift.occurrence, 2)
+        self.assertEqual(shift.start_date, self.start + datetime.timedelta(days=28))
+        self.assertEqual(list(shift.services.all()), [self.service])
+        self.assertEqual(materialize(self.shift.pk, 2), shift)
+        self.assertEqual(get_occurrence(self.shift.pk, 2), shift)
+        self.assertNotIn(2, [s.occurrence for s in virtual_occurrences(Shift.objects.filter(pk=self.shift.pk))])
+
+    def test_materialize_out_of_range(self):
+        with self.assertRaises(Shift.DoesNotExist):
+            materialize(self.shift.pk, 5)
+
+    def test_admin_lists_occurrences(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        materialize(self.shift.pk, 1)
+        response = self.client.get(reverse('admin:core_shift_change', args=[self.shift.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'not booked yet', count=3)
+
+    def test_admin_shows_first_occurrences(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        self.shift.n_time_repeat = 1000
+        self.shift.save()
+        materialize(self.shift.pk, 500)
+        response = self.client.get(reverse('admin:core_shift_change', args=[self.shift.pk]))
+        self.assertContains(response, 'not booked yet', count=ShiftAdmin.OCCURRENCES_SHOWN)
+        self.assertContains(response, f'{1000 - ShiftAdmin.OCCURRENCES_SHOWN} more')
+        changelist = f"{reverse('admin:core_shift_changelist')}?shift__id__exact={self.shift.pk}"
+        self.assertContains(response, changelist)
+        response = self.client.get(changelist)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), list(self.shift.repeatShifts.all()))
+
+
+class RepeatShiftAgainTests(TestCase):
+    def test_second_post_add_adds_services_only(self):
+        start = timezone.now().replace(microsecond=0)
+        services = [
+            Service.objects.create(name=f'Service {i}', duration=datetime.timedelta(minutes=15), price=10.0)
+            for i in range(2)
+        ]
+        shift = Shift.objects.create(
+            start_date=start, end_date=start + datetime.timedelta(hours=1), repeat='every week', n_time_repeat=2,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.services.add(services[0])
+        shift.services.add(services[1])
+        self.assertEqual(shift.repeatShifts.count(), 2)
+        for repeat_shift in shift.repeatShifts.all():
+            self.assertEqual(set(repeat_shift.services.all()), set(services))
+
+
+
+#------------------------ shift import ------------------------------
+
+
+
+import os
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from .admin import ShiftAdminForm
+from .shift_import import csv_rows, ics_rows, import_shifts
+
+
+class ShiftImportTests(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name='Test Item')
+        self.short = Service.objects.create(name='Short', duration=datetime.timedelta(minutes=15), price=10.0)
+        self.long = Service.objects.create(name='Long', duration=datetime.timedelta(hours=2), price=10.0)
+
+    def csv(self, *rows):
+        return ['item,start_date,end_date,services,repeat,n_time_repeat\n'] + [row + '\n' for row in rows]
+
+    def test_csv_import(self):
+        result = import_shifts(csv_rows(self.csv(
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,',
+            f'{self.item.pk},2027-01-06 09:00,2027-01-06 12:00,"{self.short.pk};{self.long.pk}",,',
+        )), chunk_size=1)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.rejected, [])
+        shift = Shift.objects.get(start_date=timezone.make_aware(datetime.datetime(2027, 1, 6, 9)))
+        self.assertEqual(set(shift.services.all()), {self.short, self.long})
+        self.assertEqual(shift.item, self.item)
+
+    def test_csv_rejects_rows(self):
+        result = import_shifts(csv_rows(self.csv(
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.long.pk},,',
+            f'999,2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,',
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,999,,',
+            f'{self.item.pk},tomorrow,2027-01-05 10:00,{self.short.pk},,',
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 08:00,{self.short.pk},,',
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},every day,2',
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,',
+        )))
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.rejected, [
+            (2, 'duration of service is greater than your time slot length'),
+            (3, 'unknown item 999'),
+            (4, 'unknown services 999'),
+            (5, 'start_date is not a date and time'),
+            (6, 'end_date is not after start_date'),
+            (7, 'unknown repeat every day'),
+        ])
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_csv_repeat_is_expanded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_shifts(csv_rows(self.csv(
+                f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},every week,3',
+            )))
+        parent = Shift.objects.get(shift__isnull=True)
+        self.assertEqual(parent.repeatShifts.count(), 3)
+        self.assertEqual(list(parent.repeatShifts.first().services.all()), [self.short])
+
+    def test_dry_run(self):
+        result = import_shifts(csv_rows(self.csv(
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,',
+        )), dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Shift.objects.count(), 0)
+
+    def test_ics_import(self):
+        lines = [
+            'BEGIN:VCALENDAR\r\n',
+            'BEGIN:VEVENT\r\n',
+            'DTSTART;TZID=Asia/Tehran:20270105T090000\r\n',
+            'DTEND;TZID=Asia/Tehran:20270105T100000\r\n',
+            'RRULE:FREQ=WEEKLY;INTERVAL=2;\r\n',
+            ' COUNT=4\r\n',
+            'END:VEVENT\r\n',
+            'BEGIN:VEVENT\r\n',
+            'DTSTART:20270106T053000Z\r\n',
+            'DTEND:20270106T063000Z\r\n',
+            f'X-SERVICES:{self.long.pk}\r\n',
+            'END:VEVENT\r\n',
+            'BEGIN:VEVENT\r\n',
+            'DTSTART;VALUE=DATE:20270107\r\n',
+            'END:VEVENT\r\n',
+            'END:VCALENDAR\r\n',
+        ]
+        result = import_shifts(ics_rows(lines, str(self.item.pk), str(self.short.pk)))
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.rejected, [
+            (8, 'duration of service is greater than your time slot length'),
+            (13, 'DTSTART: whole day events have no start time'),
+        ])
+        shift = Shift.objects.get()
+        self.assertEqual(shift.start_date, timezone.make_aware(datetime.datetime(2027, 1, 5, 9)))
+        self.assertEqual((shift.repeat, shift.n_time_repeat), ('every 2 weeks', 3))
+        self.assertEqual(list(shift.services.all()), [self.short])
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.writelines(self.csv(f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,'))
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_shifts', f.name, stdout=out, stderr=StringIO())
+        self.assertIn('1 shifts imported, 0 rows rejected', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_admin_upload(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get(reverse('admin:core_shift_import')).status_code, 200)
+        upload = SimpleUploadedFile('shifts.csv', ''.join(self.csv(
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.short.pk},,',
+            f'{self.item.pk},2027-01-05 09:00,2027-01-05 10:00,{self.long.pk},,',
+        )).encode())
+        response = self.client.post(reverse('admin:core_shift_import'), {'file': upload}, follow=True)
+        self.assertRedirects(response, reverse('admin:core_shift_changelist'))
+        shown = [str(message) for message in response.context['messages']]
+        self.assertEqual(shown[0], 'line 3: duration of service is greater than your time slot length')
+        self.assertTrue(shown[1].startswith('1 shifts imported, 1 rows rejected'))
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_admin_form_shares_duration_check(self):
+        form = ShiftAdminForm(data={
+            'item': self.item.pk,
+            'start_date_0': '2027-01-05', 'start_date_1': '09:00',
+            'end_date_0': '2027-01-05', 'end_date_1': '10:00',
+            'repeat': 'do not repeat',
+            'n_time_repeat': 1,
+            'services': [self.long.pk],
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('duration of service is greater than your time slot length', form.non_field_errors())
@@ -0,0 +1,9 @@
+from django.core.exceptions import ValidationError
+
+
+def validate_service_durations(start_date, end_date, services):
+    """every service must fit in the shift, shared by ShiftAdminForm and core.shift_import"""
+    for service in services:
+        difft = end_date - start_date
+        if difft.seconds < service.duration.seconds:
+            raise ValidationError("duration of service is greater than your time slot length")
@@ -0,0 +1,299 @@
+"""version keyed response caching for the shift endpoints
+
+cached entries embed the current version of everything they were computed
+from, e.g. free_time of a shift and a service embeds the versions of
+`shift:<id>` and `service:<id>`. Invalidating is bumping a version, entries
+built from the old one are simply never read again and expire after
+settings.CACHE_TTL. Every bump also records its time, see last_modified.
+
+items, services and categories are bumped on any change of those models,
+main.conditional builds the ETag of the catalog endpoints from them. Their
+rows have versions too, e.g. `item:<id>`, and `item:set` changes when items
+are added or deleted, main.response_cache tags cached responses with them.
+
+the cache is only a shortcut, while it is unreachable reads are computed
+from the database and writes skip their bumps.
+"""
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import Category, Item, Reservation, Service, Shift, shifts_bulk_created
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _tolerated(action):
+    """log and swallow the errors of an unreachable cache inside the block"""
+    try:
+        yield
+    except Exception:
+        logger.warning('could not %s, the cache is unreachable', action, exc_info=True)
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_versions(*names):
+    """current versions of the names, missing ones are started at a fresh value"""
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            # a timestamp so an evicted counter never restarts at a version still in the cache
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def _modified_key(name):
+    return f'modified:{name}'
+
+
+def _incr_version(name):
+    # an unreachable cache must not fail the write, what it holds expires after its TTL
+    with _tolerated(f'bump the version of {name}'):
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.add(_version_key(name), time.time_ns(), timeout=None)
+        cache.set(_modified_key(name), time.time(), timeout=None)
+
+
+def bump_version(name):
+    """invalidate everything cached from name
+
+    bumped again on commit, an entry computed by another request between
+    the change and the commit still saw the old rows
+    """
+    _incr_version(name)
+    transaction.on_commit(lambda: _incr_version(name))
+
+
+def last_modified(*names):
+    """unix time of the latest bump of any of the names, names never bumped count from now"""
+    keys = [_modified_key(name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time(), timeout=None)
+            found[key] = cache.get(key)
+    return max(found.values())
+
+
+def versioned_key(prefix, *parts, versions=()):
+    """key of the current versions, None while the cache is unreachable"""
+    try:
+        return ':'.join([prefix, *map(str, parts), *map(str, get_versions(*versions))])
+    except Exception:
+        logger.warning('could not read the versions of %s, the cache is unreachable', prefix, exc_info=True)
+        return None
+
+
+def url_key(request):
+    return hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+
+def _count(endpoint, outcome):
+    key = f'stats:{endpoint}:{outcome}'
+    with _tolerated(f'count a {outcome} of {endpoint}'):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+
+
+def get_or_compute(endpoint, key, compute, timeout=None):
+    """cached value of key, computed and stored on a miss, counted per endpoint
+
+    timeout defaults to settings.CACHE_TTL, it may also be a function of the
+    computed value. A key of None, see versioned_key, or an unreachable cache
+    computes the value uncached.
+    """
+    if key is None:
+        return compute()
+    try:
+        data = cache.get(key)
+    except Exception:
+        logger.warning('could not read %s, the cache is unreachable', endpoint, exc_info=True)
+        return compute()
+    if data is not None:
+        _count(endpoint, 'hit')
+        return data
+    _count(endpoint, 'miss')
+    data = compute()
+    if callable(timeout):
+        timeout = timeout(data)
+    with _tolerated(f'store {endpoint}'):
+        cache.set(key, data, settings.CACHE_TTL if timeout is None else timeout)
+    return data
+
+
+def stale_grace():
+    return getattr(settings, 'RESPONSE_CACHE_STALE', 60)
+
+
+# seconds a recompute lock is held at most, in case its holder dies
+LOCK_TTL = 30
+
+
+def _tags_current(entry):
+    tags = entry['tags']
+    return dict(zip(tags, get_versions(*tags))) == tags
+
+
+def get_or_compute_tagged(endpoint, key, compute, ttl, guard=(), attempts=50):
+    """cached value of key, recomputed once it is ttl seconds old or a version of one of its tags changed
+
+    compute returns (value, tags). Only the request that takes the lock of
+    the key recomputes it, others get the expired value for up to
+    stale_grace() seconds or wait for the new one. A change to a version in
+    guard while computing, i.e. to any row the value may have been read from,
+    keeps the value out of the cache. An unreachable cache computes the value
+    uncached.
+    """
+    lock = f'{key}:lock'
+    try:
+        entry = cache.get(key)
+        stale = None
+        if entry is not None and _tags_current(entry):
+            if time.time() < entry['expires']:
+                _count(endpoint, 'hit')
+                return entry['data']
+            stale = entry
+
+        for _ in range(attempts):
+            if cache.add(lock, 1, timeout=LOCK_TTL):
+                break
+            if stale is not None:
+                _count(endpoint, 'stale')
+                return stale['data']
+            time.sleep(0.01)
+            entry = cache.get(key)
+            if entry is not None and time.time() < entry['expires'] and _tags_current(entry):
+                _count(endpoint, 'hit')
+                return entry['data']
+        else:
+            lock = None
+        before = get_versions(*guard)
+    except Exception:
+        logger.warning('could not read %s, the cache is unreachable', endpoint, exc_info=True)
+        return compute()[0]
+
+    _count(endpoint, 'miss')
+    if lock is None:
+        # the holder is slow, answering matters more than sparing the database
+        return compute()[0]
+
+    try:
+        data, tags = compute()
+        with _tolerated(f'store {endpoint}'):
+            versions = dict(zip(tags, get_versions(*tags)))
+            if get_versions(*guard) == before:
+                entry = {'data': data, 'tags': versions, 'expires': time.time() + ttl}
+                cache.set(key, entry, ttl + stale_grace())
+        return data
+    finally:
+        with _tolerated(f'release the lock of {endpoint}'):
+            cache.delete(lock)
+
+
+def cache_stats(endpoints):
+    """{endpoint: (hits, misses)} of the counters kept by get_or_compute"""
+    keys = [f'stats:{endpoint}:{outcome}' for endpoint in endpoints for outcome in ('hit', 'miss')]
+    found = cache.get_many(keys)
+    return {
+        endpoint: (found.get(f'stats:{endpoint}:hit', 0), found.get(f'stats:{endpoint}:miss', 0))
+        for endpoint in endpoints
+    }
+
+
+def reset_cache_stats(endpoints):
+    cache.delete_many([f'stats:{endpoint}:{outcome}' for endpoint in endpoints for outcome in ('hit', 'miss')])
+
+
+CACHED_ENDPOINTS = ('free_time', 'service')
+
+
+@receiver(pre_save, sender=Reservation)
+def invalidate_previous_shift(sender, instance, **kwargs):
+    # a reservation moved to another shift frees time on the old one
+    if instance.pk:
+        old_shift = Reservation.objects.filter(pk=instance.pk).values_list('shift_id', flat=True).first()
+        if old_shift is not None and old_shift != instance.shift_id:
+            bump_version(f'shift:{old_shift}')
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_reservation_shift(sender, instance, **kwargs):
+    if instance.shift_id is not None:
+        bump_version(f'shift:{instance.shift_id}')
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+def invalidate_shift(sender, instance, **kwargs):
+    bump_version(f'shift:{instance.pk}')
+    bump_version('shifts')
+
+
+@receiver(shifts_bulk_created, sender=Shift)
+def invalidate_bulk_created_shifts(sender, shifts, **kwargs):
+    bump_version('shifts')
+
+
+@receiver(m2m_changed, sender=Shift.services.through)
+def invalidate_shift_services(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    bump_version('shifts')
+    if reverse:
+        bump_version(f'service:{instance.pk}')
+        for shift_id in pk_set or ():
+            bump_version(f'shift:{shift_id}')
+    else:
+        bump_version(f'shift:{instance.pk}')
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service(sender, instance, created=True, **kwargs):
+    bump_version('services')
+    invalidate_catalog_row('service', instance, created)
+
+
+def invalidate_catalog_row(name, instance, created):
+    """bump the versions of a catalog row, plus those of its list when rows come or go
+
+    post_delete sends no created, the receivers default it to True
+    """
+    bump_version(f'{name}:{instance.pk}')
+    if created:
+        bump_version(f'{name}:set')
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_items(sender, instance, created=True, **kwargs):
+    bump_version('items')
+    invalidate_catalog_row('item', instance, created)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, instance, created=True, **kwargs):
+    bump_version('categories')
+    invalidate_catalog_row('category', instance, created)
@@ -0,0 +1,68 @@
+"""ETag and Last-Modified for GET requests of rarely changing endpoints
+
+the validators come from the versions of main.cache, not from the response,
+so a client revalidating with If-None-Match or If-Modified-Since gets its 304
+after a couple of cache reads, before the view touches the database. Reads
+of these views are taken out of ATOMIC_REQUESTS for the same reason, opening
+the transaction is a statement on some databases. Writes keep their
+transaction. While the cache is unreachable responses go out without
+validators.
+"""
+import hashlib
+import logging
+
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.permissions import SAFE_METHODS
+
+from main.cache import get_versions, last_modified
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionalGetMixin:
+    """list and retrieve with validators from the versions named in version_names"""
+
+    version_names = ()
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        return transaction.non_atomic_requests(super().as_view(*args, **kwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
+    def validators(self, request):
+        """(ETag, Last-Modified) of the response to request"""
+        versions = get_versions(*self.version_names)
+        # the same versions render differently per URL and per media type
+        key = ':'.join([request.get_full_path(), request.accepted_media_type, *map(str, versions)])
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        return etag, int(last_modified(*self.version_names))
+
+    def conditional(self, view, request, *args, **kwargs):
+        try:
+            etag, modified = self.validators(request)
+        except Exception:
+            logger.warning('could not read the versions of %s, the cache is unreachable', request.path, exc_info=True)
+            return view(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified)
+            # stored but revalidated on every use
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,181 @@
+"""read only list rendering of ModelSerializers from .values_list() rows
+
+a CompiledSerializer walks the fields of a serializer once and turns every
+one of them into a function of a values_list row, so rendering a list costs
+a tuple lookup and the field's to_representation per value instead of a
+model instance and DRF's attribute traversal per row. The output is the same
+as serializer(many=True).data. Serializers with fields it does not know, e.g.
+SerializerMethodField, are not compiled and keep the normal path. Writes
+always go through the normal serializers.
+"""
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from main.pagination import paginator_columns
+
+
+class NotCompilable(Exception):
+    """the serializer has a field the compiler cannot read from a row"""
+
+
+def _column_reader(index, field, model_field):
+    convert = field.to_representation
+    if isinstance(model_field, models.FileField):
+        # DRF reads the url of the FieldFile, values_list only has its name
+        def read(row):
+            value = row[index]
+            return None if value is None else convert(model_field.attr_class(None, model_field, value))
+    else:
+        def read(row):
+            value = row[index]
+            return None if value is None else convert(value)
+    return read
+
+
+def _related_reader(start, field, related_model, attnames):
+    convert = field.to_representation
+    end = start + len(attnames)
+    pk_index = start + attnames.index(related_model._meta.pk.attname)
+
+    def read(row):
+        if row[pk_index] is None:
+            return None
+        return convert(related_model.from_db(None, attnames, row[start:end]))
+    return read
+
+
+class CompiledSerializer:
+
+    def __init__(self, serializer_class, context=None):
+        serializer = serializer_class(context=context or {})
+        self.model = serializer.Meta.model
+        self.columns = ['pk']
+        self.readers = []
+        # (field name, m2m model field) rendered from one extra query per list
+        self.many = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            reader = self._compile(field)
+            self.readers.append((name, reader))
+
+    def _add_columns(self, *columns):
+        start = len(self.columns)
+        self.columns.extend(columns)
+        return start
+
+    def _compile(self, field):
+        source = field.source
+        if '.' in source or source == '*':
+            raise NotCompilable(field.field_name)
+        try:
+            model_field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise NotCompilable(field.field_name)
+
+        if isinstance(field, serializers.ManyRelatedField):
+            child = field.child_relation
+            if type(child) is not serializers.PrimaryKeyRelatedField or child.pk_field is not None:
+                raise NotCompilable(field.field_name)
+            if not isinstance(model_field, models.ManyToManyField):
+                raise NotCompilable(field.field_name)
+            self.many.append((field.field_name, model_field))
+            return None
+
+        if model_field.many_to_many or model_field.one_to_many:
+            raise NotCompilable(field.field_name)
+
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            if field.pk_field is not None or not model_field.many_to_one:
+                raise NotCompilable(field.field_name)
+            # the id is all DRF renders of a PKOnlyObject
+            return itemgetter(self._add_columns(source))
+
+        if isinstance(field, serializers.StringRelatedField):
+            if not model_field.many_to_one:
+                raise NotCompilable(field.field_name)
+            related_model = model_field.related_model
+            attnames = [f.attname for f in related_model._meta.concrete_fields]
+            start = self._add_columns(*(f'{source}__{attname}' for attname in attnames))
+            return _related_reader(start, field, related_model, attnames)
+
+        if isinstance(field, (serializers.RelatedField, serializers.SerializerMethodField, serializers.Serializer)):
+            raise NotCompilable(field.field_name)
+        if model_field.is_relation:
+            raise NotCompilable(field.field_name)
+        column = 'pk' if model_field.primary_key else source
+        index = 0 if column == 'pk' else self._add_columns(column)
+        return _column_reader(index, field, model_field)
+
+    def rows(self, queryset, keep=()):
+        """the queryset as values_list rows of the compiled columns, plus the keep columns"""
+        columns = self.columns + [column for column in keep if column not in self.columns]
+        return queryset.prefetch_related(None).values_list(*columns, named=True)
+
+    def _many_values(self, pks):
+        found = {}
+        for name, model_field in self.many:
+            through = model_field.remote_field.through
+            source, target = model_field.m2m_column_name(), model_field.m2m_reverse_name()
+            values = {pk: [] for pk in pks}
+            links = (
+                through.objects
+                .filter(**{f'{source}__in': pks})
+                .order_by(target)
+                .values_list(source, target)
+            )
+            for pk, related_pk in links:
+                values[pk].append(related_pk)
+            found[name] = values
+        return found
+
+    def render(self, rows):
+        """list of dicts as serializer(instances, many=True).data would render them"""
+        rows = list(rows)
+        many = self._many_values([row[0] for row in rows]) if self.many and rows else {}
+        readers = self.readers
+        data = []
+        for row in rows:
+            item = {}
+            for name, read in readers:
+                item[name] = many[name][row[0]] if read is None else read(row)
+            data.append(item)
+        return data
+
+
+def compile_serializer(serializer_class, context=None):
+    """CompiledSerializer of a ModelSerializer class, None if it has fields that cannot be compiled"""
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    try:
+        return CompiledSerializer(serializer_class, context)
+    except NotCompilable:
+        return None
+
+
+class FastListMixin:
+    """list action of a ModelViewSet rendered by a CompiledSerializer when its serializer compiles"""
+
+    def list(self, request, *args, **kwargs):
+        return Response(self.list_data(self.filter_queryset(self.get_queryset())))
+
+    def list_data(self, queryset, serializer_class=None):
+        """rendered queryset, or the page of it when the view paginates"""
+        serializer_class = serializer_class or self.get_serializer_class()
+        context = self.get_serializer_context()
+        compiled = compile_serializer(serializer_class, context)
+        if compiled is not None:
+            queryset = compiled.rows(queryset, keep=paginator_columns(self.paginator))
+            render = compiled.render
+        else:
+            def render(rows):
+                return serializer_class(rows, many=True, context=context).data
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render(page)).data
+        return render(queryset)
@@ -0,0 +1,62 @@
+import django_filters
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import REPEAT_STEPS, Item, Shift
+from core.recurrence import lazy_recurrence_enabled
+
+
+class ItemFilter(django_filters.FilterSet):
+    """/items/?category=<id>&experience=<value>, both on indexed columns"""
+
+    class Meta:
+        model = Item
+        fields = ['category', 'experience']
+
+
+class ShiftFilter(django_filters.FilterSet):
+    """/shifts/?item=&service=&after=&before=&is_available=&is_archive=
+
+    only shifts overlapping [after, before) are listed, after is now when it
+    is not given, and archived shifts only with ?is_archive=. Upcoming shifts
+    are read from the partial end_date indexes of Shift, so the history of a
+    doctor is never scanned.
+    """
+
+    item = django_filters.NumberFilter()
+    service = django_filters.NumberFilter(field_name='services')
+    # applied with their defaults in filter_queryset
+    after = django_filters.DateTimeFilter(method='filter_window')
+    before = django_filters.DateTimeFilter(method='filter_window')
+
+    class Meta:
+        model = Shift
+        fields = ['item', 'service', 'is_available', 'is_archive']
+
+    def filter_window(self, queryset, name, value):
+        return queryset
+
+    def window(self):
+        """(start, end) of the shifts listed, end is None for no end"""
+        data = self.form.cleaned_data
+        return data.get('after') or timezone.now(), data.get('before')
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.form.cleaned_data.get('is_archive') is None:
+            queryset = queryset.filter(is_archive=False)
+        start, end = self.window()
+        overlapping = Q(end_date__gt=start)
+        if end is not None:
+            overlapping &= Q(start_date__lt=end)
+        if lazy_recurrence_enabled():
+            # a repeating shift of the past may have occurrences in the window, see core.recurrence
+            overlapping |= Q(repeat__in=REPEAT_STEPS, n_time_repeat__gt=0)
+        return queryset.filter(overlapping).order_by('start_date', 'pk')
+
+
+def shift_window(params):
+    """(start, end) of the shifts listed for these query parameters"""
+    filterset = ShiftFilter(params)
+    filterset.is_valid()
+    return filterset.window()
@@ -0,0 +1,162 @@
+"""short lived slot holds kept in the cache
+
+a patient filling in the booking form holds the slot for
+settings.SLOT_HOLD_TTL seconds. Holds never touch the database, they expire
+by themselves and are turned into a Reservation on confirm. Each shift keeps
+a registry of its hold tokens, changed only under a per shift mutex taken with
+an atomic add (SET NX on redis), and the shifts with holds are listed under
+one more key so searches over many shifts find their holds in three reads.
+Holds are stored in UTC like the rest of the free time data. Reads find no
+holds while the cache is unreachable, placing one fails.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+logger = logging.getLogger(__name__)
+
+
+class HoldTaken(Exception):
+    """the slot overlaps a hold of another patient"""
+
+
+class HoldBusy(Exception):
+    """the registry of the shift stayed locked for too long"""
+
+
+def hold_ttl():
+    return getattr(settings, 'SLOT_HOLD_TTL', 60 * 5)
+
+
+def _hold_key(token):
+    return f'hold:{token}'
+
+
+def _registry_key(shift_id):
+    return f'holds:{shift_id}'
+
+
+# ids of the shifts that have holds
+HELD_SHIFTS_KEY = 'holds:shifts'
+
+
+@contextmanager
+def _locked(key, attempts=50):
+    for _ in range(attempts):
+        if cache.add(key, 1, timeout=5):
+            break
+        time.sleep(0.01)
+    else:
+        raise HoldBusy()
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def _registry_lock(shift_id):
+    return _locked(f'holds:{shift_id}:lock')
+
+
+def _set_held(shift_id, held):
+    """add the shift to HELD_SHIFTS_KEY or take it off"""
+    with _locked(f'{HELD_SHIFTS_KEY}:lock'):
+        shift_ids = set(cache.get(HELD_SHIFTS_KEY) or ())
+        if held:
+            shift_ids.add(shift_id)
+        else:
+            shift_ids.discard(shift_id)
+        cache.set(HELD_SHIFTS_KEY, sorted(shift_ids), hold_ttl())
+
+
+def shift_holds(shift_id):
+    """live holds of a shift ordered by start"""
+    try:
+        tokens = cache.get(_registry_key(shift_id)) or []
+        holds = cache.get_many([_hold_key(token) for token in tokens])
+    except Exception:
+        logger.warning('could not read the holds of shift %s, the cache is unreachable', shift_id, exc_info=True)
+        return []
+    return sorted(holds.values(), key=lambda hold: hold['start'])
+
+
+def held_intervals(holds, exclude_user=None):
+    return [(hold['start'], hold['end']) for hold in holds if hold['user'] != exclude_user]
+
+
+def held_intervals_by_shift():
+    """{shift id: held intervals} of every shift with live holds"""
+    try:
+        registries = cache.get_many([_registry_key(shift_id) for shift_id in cache.get(HELD_SHIFTS_KEY) or ()])
+        holds = cache.get_many([_hold_key(token) for tokens in registries.values() for token in tokens])
+    except Exception:
+        logger.warning('could not read the holds, the cache is unreachable', exc_info=True)
+        return {}
+    held = {}
+    for hold in sorted(holds.values(), key=lambda hold: hold['start']):
+        held.setdefault(hold['shift'], []).append((hold['start'], hold['end']))
+    return held
+
+
+def check_not_held(shift_id, start, end, user_id):
+    """raise HoldTaken if [start, end) overlaps a hold of another user"""
+    for held_start, held_end in held_intervals(shift_holds(shift_id), exclude_user=user_id):
+        if held_start < end and start < held_end:
+            raise HoldTaken()
+
+
+def place_hold(shift, service, start, user_id):
+    """hold [start, start + service duration) of the shift for the user"""
+    ttl = hold_ttl()
+    # the request may be in any offset, busy intervals from the database are in UTC
+    start = start.astimezone(dt_timezone.utc)
+    end = start + service.duration
+    token = get_random_string(32)
+    hold = {
+        'token': token,
+        'shift': shift.pk,
+        'service': service.pk,
+        'item': shift.item_id,
+        'user': user_id,
+        'start': start,
+        'end': end,
+        'expires': timezone.now() + timedelta(seconds=ttl),
+    }
+    with _registry_lock(shift.pk):
+        holds = shift_holds(shift.pk)
+        for held_start, held_end in held_intervals(holds, exclude_user=user_id):
+            if held_start < end and start < held_end:
+                raise HoldTaken()
+        cache.set(_hold_key(token), hold, ttl)
+        cache.set(_registry_key(shift.pk), [h['token'] for h in holds] + [token], ttl)
+        _set_held(shift.pk, True)
+    return hold
+
+
+def get_hold(token):
+    return cache.get(_hold_key(token))
+
+
+def release_hold(hold):
+    with _registry_lock(hold['shift']):
+        cache.delete(_hold_key(hold['token']))
+        tokens = [h['token'] for h in shift_holds(hold['shift'])]
+        if tokens:
+            cache.set(_registry_key(hold['shift']), tokens, hold_ttl())
+        else:
+            cache.delete(_registry_key(hold['shift']))
+            _set_held(hold['shift'], False)
+
+
+def seconds_to_expiry(holds):
+    """seconds until the first of the holds runs out, None without holds"""
+    if not holds:
+        return None
+    first = min(hold['expires'] for hold in holds)
+    return max(int((first - timezone.now()).total_seconds()) + 1, 1)
@@ -0,0 +1,76 @@
+"""Idempotency-Key support for POST endpoints
+
+the first request with a key claims it with an atomic add (SET NX on redis),
+its response is stored once the transaction commits and every retry with the
+same key gets that response back without running the view again. A retry
+arriving while the first request still runs gets 409.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from main.exceptions import Conflict
+
+PENDING = 'pending'
+# a claimed key is released after this long if its request never finished
+PENDING_TTL = 60
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used with a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def response_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{request.user.pk}:{request.path}:{digest}'
+
+
+def _fingerprint(request):
+    return hashlib.sha256(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def idempotent(view_method):
+    """honour the Idempotency-Key header on a viewset method"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        if not cache.add(cache_key, PENDING, PENDING_TTL):
+            stored = cache.get(cache_key)
+            if stored is None:
+                # expired between the add and the get, claiming again is safe
+                return wrapper(self, request, *args, **kwargs)
+            if stored == PENDING:
+                raise Conflict('A request with this Idempotency-Key is still in progress.')
+            if stored['fingerprint'] != fingerprint:
+                raise KeyReused()
+            return Response(stored['data'], status=stored['status'], headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        stored = {'fingerprint': fingerprint, 'status': response.status_code, 'data': response.data}
+        transaction.on_commit(lambda: cache.set(cache_key, stored, response_ttl()))
+        return response
+
+    return wrapper
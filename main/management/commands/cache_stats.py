@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main.cache import CACHED_ENDPOINTS, cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show the hit rate of the cached shift endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        for endpoint, (hits, misses) in cache_stats(CACHED_ENDPOINTS).items():
+            total = hits + misses
+            rate = hits / total * 100 if total else 0
+            self.stdout.write(f'{endpoint}: {hits} hits, {misses} misses ({rate:.1f}% hit rate)')
+        if options['reset']:
+            reset_cache_stats(CACHED_ENDPOINTS)
@@ -1,4 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def paginator_columns(paginator):
+    """columns a paginator reads from every row of a page"""
+    ordering = getattr(paginator, 'ordering', None)
+    return (ordering,) if ordering else ()
+
 
 class CustomPageNumberPagination(PageNumberPagination):
-    page_size = 12
\ No newline at end of file
+    page_size = 12
+
+
+class KeysetPagination(BasePagination):
+    """cursor pagination on (ordering, id)
+
+    the cursor is the key of the first or last row of a page and the next page
+    is the rows after it in (ordering, id) order, a range scan on an index of
+    those columns however deep the page is. No COUNT and no OFFSET. Pages are
+    always in ascending key order.
+    """
+    page_size = 12
+    ordering = 'start_date'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request, queryset)
+        if isinstance(queryset, list):
+            rows = self.list_page(queryset, cursor)
+        else:
+            rows = self.queryset_page(queryset, cursor)
+
+        reverse = cursor is not None and cursor[2]
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_key = self.previous_key = None
+        if not rows:
+            return rows
+        if reverse:
+            rows.reverse()
+            self.next_key = self.key(rows[-1])
+            if has_more:
+                self.previous_key = self.key(rows[0])
+        else:
+            if has_more:
+                self.next_key = self.key(rows[-1])
+            if cursor is not None:
+                self.previous_key = self.key(rows[0])
+        return rows
+
+    def queryset_page(self, queryset, cursor):
+        if cursor is None:
+            return list(queryset.order_by(self.ordering, 'pk')[:self.page_size + 1])
+        value, pk, reverse = cursor
+        # the redundant bound on the ordering column keeps the scan on its index
+        if reverse:
+            before = Q(**{f'{self.ordering}__lt': value}) | Q(pk__lt=pk)
+            ordered = (
+                queryset.filter(before, **{f'{self.ordering}__lte': value})
+                .order_by(f'-{self.ordering}', '-pk')
+            )
+        else:
+            after = Q(**{f'{self.ordering}__gt': value}) | Q(pk__gt=pk)
+            ordered = (
+                queryset.filter(after, **{f'{self.ordering}__gte': value})
+                .order_by(self.ordering, 'pk')
+            )
+        return list(ordered[:self.page_size + 1])
+
+    def list_page(self, rows, cursor):
+        """the same page of an already fetched list, e.g. shifts with virtual occurrences"""
+        rows = sorted(rows, key=self.sort_key)
+        if cursor is None:
+            return rows[:self.page_size + 1]
+        value, pk, reverse = cursor
+        position = (value, self.id_key(pk))
+        if reverse:
+            return [row for row in reversed(rows) if self.sort_key(row) < position][:self.page_size + 1]
+        return [row for row in rows if self.sort_key(row) > position][:self.page_size + 1]
+
+    @staticmethod
+    def row_id(row):
+        # virtual shift occurrences have no pk, see core.recurrence
+        return row.pk if row.pk is not None else row.occurrence_id
+
+    @staticmethod
+    def id_key(pk):
+        # saved rows first, then virtual ones, each in a stable order
+        return isinstance(pk, str), str(pk).rjust(24, '0')
+
+    def sort_key(self, row):
+        return getattr(row, self.ordering), self.id_key(self.row_id(row))
+
+    def key(self, row):
+        return getattr(row, self.ordering), self.row_id(row)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        if isinstance(queryset, list):
+            model = type(queryset[0]) if queryset else None
+        else:
+            model = queryset.model
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if model is not None:
+                value = model._meta.get_field(self.ordering).to_python(value)
+            if not isinstance(queryset, list) and not isinstance(pk, int):
+                raise ValueError(pk)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, bool(reverse)
+
+    def encode_cursor(self, key, reverse):
+        value, pk = key
+        # isoformat keeps the microseconds the key needs
+        encoded = json.dumps([value, pk, int(reverse)], default=lambda moment: moment.isoformat())
+        encoded = base64.urlsafe_b64encode(encoded.encode())
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded.decode())
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return self.encode_cursor(self.next_key, False)
+
+    def get_previous_link(self):
+        if self.previous_key is None:
+            return None
+        return self.encode_cursor(self.previous_key, True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class SelectablePagination(BasePagination):
+    """page numbers by default, ?pagination=cursor (or a cursor) switches to KeysetPagination"""
+
+    mode_query_param = 'pagination'
+    default_class = CustomPageNumberPagination
+    cursor_class = KeysetPagination
+
+    @property
+    def ordering(self):
+        """column the cursor pages are keyed on"""
+        return self.cursor_class.ordering
+
+    def get_paginator(self, request):
+        wants_cursor = (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+        if wants_cursor:
+            return self.cursor_class()
+        return self.default_class() if self.default_class is not None else None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        if self.paginator is None:
+            return None
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return []
+
+
+class ShiftPagination(SelectablePagination):
+    """shifts by page number or by a cursor on (start_date, id)"""
+
+
+class ReservationCursorPagination(KeysetPagination):
+    ordering = 'time_date'
+
+
+class ReservationPagination(SelectablePagination):
+    """unpaginated reservations unless a cursor on (time_date, id) is asked for"""
+
+    default_class = None
+    cursor_class = ReservationCursorPagination
@@ -0,0 +1,56 @@
+"""server side cache of whole catalog responses
+
+list and detail responses are cached per URL, query parameters and page
+included, and tagged with the versions of the rows they render: `item:<id>`
+for every row, `item:set` for lists and the versions of the models the rows
+depend on. Editing an item bumps `item:<id>`, so only its detail and the
+lists it is on are recomputed. See main.cache.get_or_compute_tagged for the
+recompute lock.
+"""
+from django.conf import settings
+from rest_framework.response import Response
+
+from main.cache import get_or_compute_tagged, url_key
+
+
+class ResponseCacheMixin:
+    """list and retrieve of a viewset served from the cache
+
+    cache_tag names the versions of the rows, cache_depends are versions of
+    other models the rows render, the TTL is settings.RESPONSE_CACHE_TTL of
+    cache_tag. version_names guard the computation, see get_or_compute_tagged
+    """
+
+    cache_tag = None
+    cache_depends = ()
+    version_names = ()
+
+    def cache_ttl(self):
+        return getattr(settings, 'RESPONSE_CACHE_TTL', {}).get(self.cache_tag, settings.CACHE_TTL)
+
+    def row_tags(self, rows):
+        if all('id' in row for row in rows):
+            return [f'{self.cache_tag}:{row["id"]}' for row in rows]
+        # without ids, e.g. ?fields=name, any change of the model is a change of the rows
+        return list(self.version_names[:1])
+
+    def cached(self, request, compute):
+        key = f'response:{self.cache_tag}:{url_key(request)}'
+        data = get_or_compute_tagged(
+            self.cache_tag, key, compute, self.cache_ttl(), guard=self.version_names,
+        )
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        def compute():
+            data = super(ResponseCacheMixin, self).list(request, *args, **kwargs).data
+            rows = data['results'] if isinstance(data, dict) else data
+            return data, [f'{self.cache_tag}:set', *self.row_tags(rows), *self.cache_depends]
+        return self.cached(request, compute)
+
+    def retrieve(self, request, *args, **kwargs):
+        def compute():
+            instance = self.get_object()
+            data = self.get_serializer(instance).data
+            return data, [f'{self.cache_tag}:{instance.pk}', *self.cache_depends]
+        return self.cached(request, compute)
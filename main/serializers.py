@@ -1,7 +1,11 @@
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from core.models import Item, Shift, Reservation, Service, Category
+from core.recurrence import is_virtual, lazy_recurrence_enabled, materialize, parse_occurrence_id
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from datetime import timedelta
+from main.sparse import SparseFieldsMixin
 
 User = get_user_model()
 
@@ -26,10 +30,11 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return attrs
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """serializer for item model"""
 
     category = serializers.StringRelatedField(read_only = True)
+    expandable_fields = {'category': 'CategorySerializer'}
 
     class Meta:
         model = Item
@@ -37,7 +42,7 @@ class ItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id',]
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model= Category
@@ -45,9 +50,10 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id',]
 
 
-class ShiftSerializer(serializers.ModelSerializer):
+class ShiftSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     services = serializers.PrimaryKeyRelatedField(many=True, read_only =True)
+    expandable_fields = {'item': 'ItemSerializer', 'services': 'ServiceSerializer'}
 
     class Meta:
         model = Shift
@@ -55,17 +61,98 @@ class ShiftSerializer(serializers.ModelSerializer):
         read_only_fields = ['id',]
 
 
-class ReservationSerializer(serializers.ModelSerializer):
+class ShiftOccurrenceSerializer(ShiftSerializer):
+    """ShiftSerializer that also renders virtual occurrences, see core.recurrence"""
+
+    id = serializers.SerializerMethodField()
+    services = serializers.SerializerMethodField()
+    # virtual occurrences carry ids only and are built from every column of their parent
+    expandable_fields = {}
+    defer_columns = False
+
+    def get_id(self, shift):
+        return shift.occurrence_id if is_virtual(shift) else shift.pk
+
+    def get_services(self, shift):
+        if is_virtual(shift):
+            return shift.service_ids
+        return [service.pk for service in shift.services.all()]
+
+
+class PreloadedRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that looks ids up in the rows `preload` read, if any"""
+
+    preloaded = None
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def preload(self, values):
+        """read the rows of every valid id of `values` with one query"""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError, serializers.ValidationError):
+                pass
+        self.preloaded = self.get_queryset().in_bulk(pks - {None})
+
+    def to_internal_value(self, data):
+        if self.preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in self.preloaded:
+            self.fail('does_not_exist', pk_value=data)
+        return self.preloaded[pk]
+
+
+class PreloadingListSerializer(serializers.ListSerializer):
+    """ListSerializer reading the related rows of the whole list with one query per field"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            rows = [row for row in data if isinstance(row, dict)]
+            for name, field in self.child.fields.items():
+                if isinstance(field, PreloadedRelatedField) and not field.read_only:
+                    field.preload([row[name] for row in rows if name in row])
+        return super().to_internal_value(data)
+
+
+class ShiftOccurrenceField(PreloadedRelatedField):
+    """shift by id, a virtual occurrence id "parent-n" is saved as a real shift first"""
+
+    def to_internal_value(self, data):
+        occurrence = parse_occurrence_id(data) if lazy_recurrence_enabled() else None
+        if occurrence is None:
+            return super().to_internal_value(data)
+        try:
+            return materialize(*occurrence)
+        except Shift.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class ReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     
     reserver = serializers.StringRelatedField(read_only = True)
+    shift = ShiftOccurrenceField(queryset=Shift.objects.all(), allow_null=True, required=False)
+    expandable_fields = {'item': 'ItemSerializer', 'service': 'ServiceSerializer', 'shift': 'ShiftSerializer'}
+    serializer_related_field = PreloadedRelatedField
 
     class Meta:
         model = Reservation
+        list_serializer_class = PreloadingListSerializer
         fields = ['id', 'reserver', 'time_date', 'service', 'shift', 'item', 'code', 'status']
         read_only_fields = ['id',]
 
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Service
@@ -73,5 +160,55 @@ class ServiceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id',]
 
 
+class FreeTimeRangeSerializer(serializers.Serializer):
+    """query parameters of the bulk free time endpoint"""
+
+    MAX_DAYS = 31
+
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    items = serializers.CharField(required=False)
+    category = serializers.IntegerField(required=False)
+    start = serializers.DateField()
+    end = serializers.DateField(required=False)
+
+    def validate_items(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk]
+        except ValueError:
+            raise serializers.ValidationError("items must be a comma separated list of ids")
+
+    def validate(self, attrs):
+        if not attrs.get('items') and attrs.get('category') is None:
+            raise serializers.ValidationError("items or category is required")
+        end = attrs.setdefault('end', attrs['start'] + timedelta(days=6))
+        if end < attrs['start']:
+            raise serializers.ValidationError("end is before start")
+        if (end - attrs['start']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"date range is longer than {self.MAX_DAYS} days")
+        return attrs
+
+
+class NextAvailableSerializer(serializers.Serializer):
+    """query parameters of the next available endpoint"""
+
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    category = serializers.IntegerField(required=False)
+    after = serializers.DateTimeField(required=False)
+    k = serializers.IntegerField(min_value=1, max_value=50, default=5)
+
+
+class ItemSearchSerializer(serializers.Serializer):
+    """query parameters of the item search endpoint"""
+
+    q = serializers.CharField()
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class HoldSerializer(serializers.Serializer):
+
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    time_date = serializers.DateTimeField()
+
+
 class TimeSerializer(serializers.Serializer):
     time = serializers.TimeField()
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""sparse fieldsets and expansions of GET responses
+
+    /shifts/?fields=id,start_date,end_date
+    /shifts/?expand=item,services
+
+?fields= keeps only the listed fields, ?expand= renders the relations a
+serializer lists in expandable_fields as nested objects instead of ids. Both
+apply to the serializer of the view, nested serializers render every field.
+The viewset then loads only what is rendered: the columns of the fields,
+select_related for related objects rendered and prefetches for many to many
+fields only when they are rendered.
+"""
+import sys
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from main.pagination import paginator_columns
+
+
+def param_list(params, name):
+    return [value for value in params.get(name, '').split(',') if value]
+
+
+def _model_field(model, source):
+    if '.' in source or source == '*':
+        return None
+    try:
+        return model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+
+
+def load_plan(serializer, prefix=''):
+    """(columns, select_related, prefetches, whether every field reads a model field) of a serializer"""
+    model = serializer.Meta.model
+    columns, related, prefetched, known = [model._meta.pk.name], [], [], True
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        model_field = _model_field(model, field.source)
+        if model_field is None:
+            known = False
+        elif model_field.many_to_many:
+            prefetched.append(Prefetch(
+                prefix + field.source, queryset=model_field.related_model.objects.order_by('pk'),
+            ))
+        elif model_field.concrete and model_field.is_relation:
+            columns.append(field.source)
+            if isinstance(field, (serializers.StringRelatedField, serializers.BaseSerializer)):
+                related.append(prefix + field.source)
+            if isinstance(field, serializers.BaseSerializer):
+                _, nested_related, nested_prefetched, _ = load_plan(field, f'{prefix}{field.source}__')
+                related += nested_related
+                prefetched += nested_prefetched
+        elif model_field.concrete:
+            columns.append(field.source)
+        else:
+            known = False
+    return columns, related, prefetched, known
+
+
+class SparseFieldsMixin:
+    """?fields= and ?expand= for a ModelSerializer, see the module doc
+
+    expandable_fields maps a relation to the name of the serializer that
+    renders it, looked up in the module of the serializer
+    """
+
+    expandable_fields = {}
+    # whether the queryset may defer the columns of fields that are not rendered
+    defer_columns = True
+
+    def _params(self):
+        """query parameters of a GET to the view of this serializer, None for anything else"""
+        request = self.context.get('request')
+        params = getattr(request, 'query_params', None)
+        if params is None or request.method not in SAFE_METHODS:
+            return None
+        parent = self.parent
+        if parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return params
+        return None
+
+    def requested_fields(self):
+        params = self._params()
+        return param_list(params, 'fields') if params is not None else []
+
+    def requested_expansions(self):
+        params = self._params()
+        if params is None:
+            return []
+        return [name for name in param_list(params, 'expand') if name in self.expandable_fields]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expanded = self.requested_expansions()
+        module = sys.modules[type(self).__module__]
+        for name in expanded:
+            serializer_class = getattr(module, self.expandable_fields[name])
+            many = self.Meta.model._meta.get_field(name).many_to_many
+            fields[name] = serializer_class(many=many, read_only=True)
+
+        sparse = self.requested_fields()
+        if sparse:
+            fields = OrderedDict(
+                (name, field) for name, field in fields.items() if name in sparse or name in expanded
+            )
+        return fields
+
+    def adapt_queryset(self, queryset, keep=()):
+        """queryset loading what the rendered fields read, unchanged without ?fields= or ?expand=
+
+        keep are columns loaded whether they are rendered or not
+        """
+        if not self.requested_fields() and not self.requested_expansions():
+            return queryset
+        columns, related, prefetched, known = load_plan(self)
+        if not known or not self.defer_columns:
+            # a method field may read anything, only add what the expansions need
+            return queryset.select_related(*related) if related else queryset
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.prefetch_related(*prefetched).only(*columns, *keep)
+
+
+class AdaptiveQuerysetMixin:
+    """filter_queryset of a viewset narrowed by the adapt_queryset of its serializer on reads"""
+
+    def adapt_queryset(self, queryset, serializer_class=None):
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        serializer_class = serializer_class or self.get_serializer_class()
+        serializer = serializer_class(context=self.get_serializer_context())
+        if not isinstance(serializer, SparseFieldsMixin):
+            return queryset
+        return serializer.adapt_queryset(queryset, keep=paginator_columns(self.paginator))
+
+    def filter_queryset(self, queryset):
+        return self.adapt_queryset(super().filter_queryset(queryset))
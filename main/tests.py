@@ -1,9 +1,22 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import *
 
+# the tests run without the redis and rabbitmq of docker-compose
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+test_settings = override_settings(CACHES=LOCMEM_CACHES, CELERY_TASK_ALWAYS_EAGER=True)
+
+
+def setUpModule():
+    test_settings.enable()
+
+
+def tearDownModule():
+    test_settings.disable()
+
+
 class ItemViewSetTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -279,3 +292,1578 @@ class EmailSendingTestCase(TestCase):
         smtp_instance.login.assert_called_once_with(username=globals.USERNAME, password=globals.PASSWORD)
         smtp_instance.sendmail.assert_called_once_with(from_email, to_emails, mock_smtp.return_value.sendmail.return_value)
         smtp_instance.quit.assert_called_once()
+
+
+
+#----------------------free time -------------------------------
+
+from django.utils import timezone
+
+
+class FreeTimeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+        self.shift.services.add(self.service)
+
+    def test_free_time(self):
+        Reservation.objects.create(
+            reserver=self.user, item=self.item, shift=self.shift,
+            service=self.service, time_date=self.start + datetime.timedelta(minutes=30),
+        )
+        url = reverse('shift-free-time', args=[self.shift.pk, self.service.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [slot['start'] for slot in response.data],
+            [self.start, self.start + datetime.timedelta(minutes=60), self.start + datetime.timedelta(minutes=90)],
+        )
+
+
+class FreeTimesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localtime().replace(hour=8, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        self.category = Category.objects.create(name='Test Category')
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.items = [Item.objects.create(name=f'Item {i}', category=self.category) for i in range(3)]
+        self.url = reverse('shift-free-times')
+
+    def add_shift(self, item, days):
+        shift = Shift.objects.create(
+            item=item,
+            start_date=self.day + datetime.timedelta(days=days),
+            end_date=self.day + datetime.timedelta(days=days, hours=1),
+            repeat='do not repeat',
+        )
+        shift.services.add(self.service)
+        return shift
+
+    def test_grouped_by_item_and_day(self):
+        shift = self.add_shift(self.items[0], 0)
+        self.add_shift(self.items[0], 1)
+        self.add_shift(self.items[1], 0)
+        Reservation.objects.create(
+            reserver=self.user, item=self.items[0], shift=shift,
+            service=self.service, time_date=shift.start_date,
+        )
+        response = self.client.get(self.url, {
+            'service': self.service.pk,
+            'items': f'{self.items[0].pk},{self.items[1].pk}',
+            'start': self.day.date().isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first_day = self.day.date().isoformat()
+        second_day = (self.day + datetime.timedelta(days=1)).date().isoformat()
+        self.assertEqual(set(response.data), {self.items[0].pk, self.items[1].pk})
+        self.assertEqual(set(response.data[self.items[0].pk]), {first_day, second_day})
+        self.assertEqual(len(response.data[self.items[0].pk][first_day]), 1)
+        self.assertEqual(len(response.data[self.items[1].pk][first_day]), 2)
+
+    def test_constant_number_of_queries(self):
+        for days in range(5):
+            for item in self.items:
+                self.add_shift(item, days)
+        params = {
+            'service': self.service.pk,
+            'category': self.category.pk,
+            'start': self.day.date().isoformat(),
+        }
+        # savepoint, service, shifts, reservations, release savepoint
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url, params)
+        self.assertEqual(len(response.data), 3)
+
+    def test_requires_items_or_category(self):
+        response = self.client.get(self.url, {
+            'service': self.service.pk,
+            'start': self.day.date().isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+#----------------------slots -------------------------------
+
+from django.test import override_settings
+
+
+@override_settings(SLOT_TABLE_ENABLED=True)
+class SlotTableTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+        self.shift.services.add(self.service)
+        self.url = reverse('shift-free-time', args=[self.shift.pk, self.service.pk])
+
+    def book(self, minutes):
+        return self.client.post(reverse('reservation-list'), {
+            'shift': self.shift.pk,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': self.start + datetime.timedelta(minutes=minutes),
+        })
+
+    def test_free_time_reads_slots(self):
+        # savepoint, shift, service, slots, release savepoint
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 4)
+
+    def test_booking_and_cancelling_updates_slots(self):
+        response = self.book(30)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [slot['start'] for slot in self.client.get(self.url).data],
+            [self.start, self.start + datetime.timedelta(minutes=60), self.start + datetime.timedelta(minutes=90)],
+        )
+
+        self.client.delete(reverse('reservation-detail', args=[response.data['id']]))
+        self.assertEqual(len(self.client.get(self.url).data), 4)
+
+
+
+#----------------------cache -------------------------------
+
+from django.core.cache import cache
+from main.cache import cache_stats
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ShiftCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+        self.shift.services.add(self.service)
+        self.url = reverse('shift-free-time', args=[self.shift.pk, self.service.pk])
+
+    def test_free_time_hit(self):
+        self.client.get(self.url)
+        # only the ATOMIC_REQUESTS savepoint
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(cache_stats(['free_time']), {'free_time': (1, 1)})
+
+    def test_unknown_ids(self):
+        for url in (
+            reverse('shift-free-time', args=[self.shift.pk + 1, self.service.pk]),
+            reverse('shift-free-time', args=[self.shift.pk, self.service.pk + 1]),
+            reverse('shift-service', args=[self.service.pk + 1]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reservation_invalidates_free_time(self):
+        self.client.get(self.url)
+        reservation = Reservation.objects.create(
+            reserver=self.user, item=self.item, shift=self.shift,
+            service=self.service, time_date=self.start,
+        )
+        self.assertEqual(len(self.client.get(self.url).data), 3)
+        reservation.delete()
+        self.assertEqual(len(self.client.get(self.url).data), 4)
+
+    def test_shift_and_service_edits_invalidate_free_time(self):
+        self.client.get(self.url)
+        self.shift.end_date = self.start + datetime.timedelta(hours=1)
+        self.shift.save()
+        self.assertEqual(len(self.client.get(self.url).data), 2)
+        self.service.duration = datetime.timedelta(minutes=15)
+        self.service.save()
+        self.assertEqual(len(self.client.get(self.url).data), 4)
+
+    def test_service_shifts_invalidated_by_new_shift(self):
+        url = reverse('shift-service', args=[self.service.pk])
+        self.assertEqual(self.client.get(url).data['count'], 1)
+        shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+        shift.services.add(self.service)
+        self.assertEqual(self.client.get(url).data['count'], 2)
+
+    def test_service_shifts_drop_started_shifts(self):
+        url = reverse('shift-service', args=[self.service.pk])
+        now = timezone.now()
+        shift = Shift.objects.create(
+            item=self.item,
+            start_date=now + datetime.timedelta(minutes=1),
+            end_date=now + datetime.timedelta(hours=1),
+            repeat='do not repeat',
+        )
+        shift.services.add(self.service)
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        # two minutes later, well inside CACHE_TTL
+        later = now + datetime.timedelta(minutes=2)
+        with patch('time.time', return_value=later.timestamp()), patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['id'], self.shift.pk)
+
+
+
+#----------------------next available -------------------------------
+
+
+class NextAvailableTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.category = Category.objects.create(name='Test Category')
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item', category=self.category)
+        self.other_item = Item.objects.create(name='Other Item')
+        self.url = reverse('shift-next-available')
+
+    def add_shift(self, item, hours):
+        shift = Shift.objects.create(
+            item=item,
+            start_date=self.start + datetime.timedelta(hours=hours),
+            end_date=self.start + datetime.timedelta(hours=hours + 1),
+            repeat='do not repeat',
+        )
+        shift.services.add(self.service)
+        return shift
+
+    def check_next_available(self):
+        self.add_shift(self.other_item, 0)
+        shift = self.add_shift(self.item, 2)
+        self.add_shift(self.item, 5)
+        response = self.client.get(self.url, {
+            'service': self.service.pk,
+            'category': self.category.pk,
+            'k': 3,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [slot['start'] for slot in response.data],
+            [shift.start_date, shift.start_date + datetime.timedelta(minutes=30), self.start + datetime.timedelta(hours=5)],
+        )
+        self.assertEqual(response.data[0]['shift'], shift.pk)
+
+    def test_next_available(self):
+        self.check_next_available()
+
+    @override_settings(SLOT_TABLE_ENABLED=True)
+    def test_next_available_from_slot_table(self):
+        self.check_next_available()
+
+
+
+#----------------------booking -------------------------------
+
+import threading
+from unittest import skipUnless
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from core.availability import busy_intervals
+
+
+class BookingTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+
+    def book(self, minutes):
+        return self.client.post(reverse('reservation-list'), {
+            'shift': self.shift.pk,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': self.start + datetime.timedelta(minutes=minutes),
+        })
+
+    def test_overlapping_booking_conflicts(self):
+        self.assertEqual(self.book(30).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book(45).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.book(15).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.book(0).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book(60).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+    def test_update_into_overlap_conflicts(self):
+        self.book(0)
+        reservation_id = self.book(60).data['id']
+        url = reverse('reservation-detail', args=[reservation_id])
+        response = self.client.patch(url, {'time_date': self.start + datetime.timedelta(minutes=15)})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.patch(url, {'time_date': self.start + datetime.timedelta(minutes=45)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'row locks need PostgreSQL')
+class ConcurrentBookingTestCase(TransactionTestCase):
+    threads = 8
+    attempts = 10
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=4),
+            repeat='do not repeat',
+        )
+        self.users = [User.objects.create(username=f'user{i}') for i in range(self.threads)]
+
+    def patient(self, user, statuses):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            for i in range(self.attempts):
+                # every patient goes for the same handful of overlapping times
+                response = client.post(reverse('reservation-list'), {
+                    'shift': self.shift.pk,
+                    'service': self.service.pk,
+                    'item': self.item.pk,
+                    'time_date': self.start + datetime.timedelta(minutes=15 * (i % 8)),
+                })
+                statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_no_double_booking(self):
+        statuses = []
+        threads = [threading.Thread(target=self.patient, args=(user, statuses)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(statuses), {status.HTTP_201_CREATED, status.HTTP_409_CONFLICT})
+        busy = busy_intervals(self.shift.pk)
+        self.assertEqual(len(busy), statuses.count(status.HTTP_201_CREATED))
+        for (_, end), (start, _) in zip(busy, busy[1:]):
+            self.assertLessEqual(end, start)
+
+
+
+#----------------------holds -------------------------------
+
+import time
+from zoneinfo import ZoneInfo
+from main.holds import held_intervals_by_shift
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HoldTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.other = User.objects.create(username='other')
+        self.client.force_authenticate(self.user)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+        self.free_time_url = reverse('shift-free-time', args=[self.shift.pk, self.service.pk])
+
+    def hold(self, client, minutes):
+        return client.post(reverse('shift-hold', args=[self.shift.pk]), {
+            'service': self.service.pk,
+            'time_date': self.start + datetime.timedelta(minutes=minutes),
+        })
+
+    def free_starts(self):
+        return [slot['start'] for slot in self.client.get(self.free_time_url).data]
+
+    def test_held_slot_hidden(self):
+        self.assertEqual(len(self.free_starts()), 4)
+        response = self.hold(self.client, 30)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(self.start + datetime.timedelta(minutes=30), self.free_starts())
+        self.assertEqual(Reservation.objects.count(), 0)
+
+    def test_overlapping_hold_and_booking_conflict(self):
+        self.hold(self.client, 30)
+        self.assertEqual(self.hold(self.other_client, 45).status_code, status.HTTP_409_CONFLICT)
+        response = self.other_client.post(reverse('reservation-list'), {
+            'shift': self.shift.pk,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': self.start + datetime.timedelta(minutes=30),
+        })
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.hold(self.other_client, 60).status_code, status.HTTP_201_CREATED)
+
+    def test_confirm(self):
+        token = self.hold(self.client, 30).data['hold']
+        response = self.other_client.post(reverse('reservation-confirm'), {'hold': token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('reservation-confirm'), {'hold': token})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reservation = Reservation.objects.get()
+        self.assertEqual(reservation.reserver, self.user)
+        self.assertEqual(reservation.time_date, self.start + datetime.timedelta(minutes=30))
+        response = self.client.post(reverse('reservation-confirm'), {'hold': token})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_release(self):
+        token = self.hold(self.client, 30).data['hold']
+        self.client.post(reverse('reservation-release'), {'hold': token})
+        self.assertEqual(len(self.free_starts()), 4)
+
+    @override_settings(SLOT_HOLD_TTL=1)
+    def test_hold_expires(self):
+        self.hold(self.client, 30)
+        self.assertEqual(len(self.free_starts()), 3)
+        time.sleep(2.1)
+        self.assertEqual(len(self.free_starts()), 4)
+
+    def test_hold_in_another_offset(self):
+        tehran = (self.start + datetime.timedelta(minutes=30)).astimezone(ZoneInfo('Asia/Tehran'))
+        response = self.client.post(reverse('shift-hold', args=[self.shift.pk]), {
+            'service': self.service.pk, 'time_date': tehran.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        starts = [slot['start'] for slot in self.client.get(self.free_time_url).json()]
+        self.assertEqual(len(starts), 3)
+        self.assertTrue(all(start.endswith('Z') for start in starts), starts)
+        self.assertEqual(starts, sorted(starts))
+
+    def check_searches_skip_holds(self):
+        self.shift.services.add(self.service)
+        self.hold(self.other_client, 0)
+        response = self.client.get(reverse('shift-free-times'), {
+            'service': self.service.pk, 'items': str(self.item.pk), 'start': self.start.date().isoformat(),
+        })
+        slots = [slot['start'] for days in response.data[self.item.pk].values() for slot in days]
+        self.assertEqual(slots, [self.start + datetime.timedelta(minutes=m) for m in (30, 60, 90)])
+        response = self.client.get(reverse('shift-next-available'), {'service': self.service.pk, 'k': 1})
+        self.assertEqual(response.data[0]['start'], self.start + datetime.timedelta(minutes=30))
+
+    def test_searches_skip_holds(self):
+        self.check_searches_skip_holds()
+
+    @override_settings(SLOT_TABLE_ENABLED=True)
+    def test_slot_table_searches_skip_holds(self):
+        self.check_searches_skip_holds()
+
+    def test_released_shift_is_not_listed(self):
+        token = self.hold(self.client, 30).data['hold']
+        self.assertEqual(list(held_intervals_by_shift()), [self.shift.pk])
+        self.client.post(reverse('reservation-release'), {'hold': token})
+        self.assertEqual(held_intervals_by_shift(), {})
+
+
+
+#----------------------bulk booking -------------------------------
+
+
+class BulkBookingTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shifts = [
+            Shift.objects.create(
+                item=self.item,
+                start_date=self.start + datetime.timedelta(days=days),
+                end_date=self.start + datetime.timedelta(days=days, hours=2),
+                repeat='do not repeat',
+            )
+            for days in range(2)
+        ]
+        self.url = reverse('reservation-bulk')
+
+    def reservation(self, shift, minutes):
+        return {
+            'shift': shift.pk,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': (shift.start_date + datetime.timedelta(minutes=minutes)).isoformat(),
+        }
+
+    def test_bulk_create(self):
+        data = [
+            self.reservation(self.shifts[0], 0),
+            self.reservation(self.shifts[0], 30),
+            self.reservation(self.shifts[1], 0),
+        ]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(Reservation.objects.filter(reserver=self.user).count(), 3)
+        self.assertEqual(len({reservation['code'] for reservation in response.data}), 3)
+
+    def test_overlap_inside_batch_creates_nothing(self):
+        data = [self.reservation(self.shifts[0], 0), self.reservation(self.shifts[0], 15)]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Reservation.objects.count(), 0)
+
+    def test_overlap_with_stored_reservation_creates_nothing(self):
+        Reservation.objects.create(
+            reserver=self.user, item=self.item, shift=self.shifts[1],
+            service=self.service, time_date=self.shifts[1].start_date + datetime.timedelta(minutes=50),
+        )
+        data = [self.reservation(self.shifts[0], 0), self.reservation(self.shifts[1], 30)]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn('reservation 1', response.data['detail'])
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_invalid_item_creates_nothing(self):
+        data = [self.reservation(self.shifts[0], 0), {'shift': self.shifts[0].pk}]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Reservation.objects.count(), 0)
+
+    def test_empty_list(self):
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_constant_number_of_queries(self):
+        data = [self.reservation(shift, minutes) for shift in self.shifts for minutes in (0, 30, 60, 90)]
+        # the related rows are read once per model, the write is a single INSERT
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, data, format='json')
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        for minutes in ((0,), (0, 30, 60, 90)):
+            Reservation.objects.all().delete()
+            data = [self.reservation(shift, m) for shift in self.shifts for m in minutes]
+            # savepoints, service, shifts and items of the batch, shifts locked,
+            # reservations, the INSERT
+            with self.assertNumQueries(12):
+                response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_unknown_id_creates_nothing(self):
+        data = [self.reservation(self.shifts[0], 0), self.reservation(self.shifts[1], 0)]
+        data[1]['service'] = self.service.pk + 1
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('service', response.data[1])
+        self.assertEqual(Reservation.objects.count(), 0)
+
+
+
+#----------------------idempotency -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=2),
+            repeat='do not repeat',
+        )
+
+    def book(self, key, minutes=0):
+        return self.client.post(reverse('reservation-list'), {
+            'shift': self.shift.pk,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': (self.start + datetime.timedelta(minutes=minutes)).isoformat(),
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.book('retry-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        # only the ATOMIC_REQUESTS savepoint
+        with self.assertNumQueries(2):
+            retry = self.book('retry-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_concurrent_duplicate_conflicts(self):
+        # the first request has not committed yet
+        self.book('retry-2')
+        self.assertEqual(self.book('retry-2').status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_key_reused_with_other_body(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book('retry-3')
+        response = self.book('retry-3', minutes=60)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_failed_request_releases_key(self):
+        self.client.post(reverse('reservation-list'), {'shift': 'x'}, format='json', HTTP_IDEMPOTENCY_KEY='retry-4')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.book('retry-4').status_code, status.HTTP_201_CREATED)
+
+    def test_without_key(self):
+        self.book('')
+        self.book('', minutes=60)
+        self.assertEqual(Reservation.objects.count(), 2)
+
+
+
+#----------------------reservation by code -------------------------------
+
+
+class ReservationByCodeTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = User.objects.create(username='patient')
+        self.staff = User.objects.create(username='reception', is_staff=True)
+        self.reservation = Reservation.objects.create(
+            reserver=self.patient, time_date=timezone.now(), code='ABC123',
+        )
+        self.url = reverse('reservation-by-code', args=['ABC123'])
+
+    def test_staff_lookup(self):
+        self.client.force_authenticate(self.staff)
+        # savepoint, reservation with its reserver, release savepoint
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.reservation.pk)
+
+    def test_unknown_code(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(reverse('reservation-by-code', args=['NOPE']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patients_cannot_lookup(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+#----------------------lazy recurrence -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LAZY_RECURRENCE=True)
+class LazyRecurrenceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        self.shift = Shift.objects.create(
+            item=self.item,
+            start_date=self.start,
+            end_date=self.start + datetime.timedelta(hours=1),
+            repeat='every week',
+            n_time_repeat=3,
+        )
+        self.shift.services.add(self.service)
+
+    def book(self, shift_id, minutes=0, days=7):
+        return self.client.post(reverse('reservation-list'), {
+            'shift': shift_id,
+            'service': self.service.pk,
+            'item': self.item.pk,
+            'time_date': self.start + datetime.timedelta(days=days, minutes=minutes),
+        })
+
+    def test_no_rows_for_repetitions(self):
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_list_includes_occurrences(self):
+        response = self.client.get(reverse('shift-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pk = self.shift.pk
+        self.assertEqual([shift['id'] for shift in response.data['results']], [pk, f'{pk}-1', f'{pk}-2', f'{pk}-3'])
+        self.assertEqual(response.data['results'][2]['services'], [self.service.pk])
+
+    def test_retrieve_occurrence(self):
+        response = self.client.get(reverse('shift-detail', args=[f'{self.shift.pk}-2']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['shift'], self.shift.pk)
+        self.assertEqual(Shift.objects.count(), 1)
+
+    def test_unknown_occurrence(self):
+        response = self.client.get(reverse('shift-detail', args=[f'{self.shift.pk}-4']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_free_time_of_occurrence(self):
+        response = self.client.get(reverse('shift-free-time', args=[f'{self.shift.pk}-1', self.service.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [slot['start'] for slot in response.data],
+            [self.start + datetime.timedelta(days=7, minutes=m) for m in (0, 30)],
+        )
+
+    def test_booking_saves_occurrence(self):
+        response = self.book(f'{self.shift.pk}-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        occurrence = Shift.objects.get(shift=self.shift, occurrence=1)
+        self.assertEqual(response.data['shift'], occurrence.pk)
+        self.assertEqual(list(occurrence.services.all()), [self.service])
+
+        self.assertEqual(self.book(f'{self.shift.pk}-1').status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.book(f'{self.shift.pk}-1', minutes=30).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Shift.objects.count(), 2)
+
+        response = self.client.get(reverse('shift-free-time', args=[f'{self.shift.pk}-1', self.service.pk]))
+        self.assertEqual(response.data, [])
+        ids = [shift['id'] for shift in self.client.get(reverse('shift-list')).data['results']]
+        self.assertEqual(ids, [self.shift.pk, occurrence.pk, f'{self.shift.pk}-2', f'{self.shift.pk}-3'])
+
+    def test_edit_saves_occurrence(self):
+        response = self.client.patch(reverse('shift-detail', args=[f'{self.shift.pk}-3']), {'is_available': False})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        occurrence = Shift.objects.get(shift=self.shift, occurrence=3)
+        self.assertFalse(occurrence.is_available)
+
+    def test_next_available_includes_occurrences(self):
+        response = self.client.get(reverse('shift-next-available'), {
+            'service': self.service.pk,
+            'after': (self.start + datetime.timedelta(days=1)).isoformat(),
+            'k': 3,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(slot['start'], slot['shift']) for slot in response.data],
+            [
+                (self.start + datetime.timedelta(days=7), f'{self.shift.pk}-1'),
+                (self.start + datetime.timedelta(days=7, minutes=30), f'{self.shift.pk}-1'),
+                (self.start + datetime.timedelta(days=14), f'{self.shift.pk}-2'),
+            ],
+        )
+
+    def test_free_times_includes_occurrences(self):
+        day = timezone.localdate(self.start + datetime.timedelta(days=7))
+        response = self.client.get(reverse('shift-free-times'), {
+            'service': self.service.pk,
+            'items': str(self.item.pk),
+            'start': day.isoformat(),
+            'end': day.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [slot['start'] for slot in response.data[self.item.pk][day.isoformat()]],
+            [self.start + datetime.timedelta(days=7, minutes=m) for m in (0, 30)],
+        )
+
+
+
+#----------------------query budgets -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTestCase(TestCase):
+    """list endpoints run the same number of queries however many rows they return"""
+
+    # savepoint and release of ATOMIC_REQUESTS included, the catalog reads run outside it
+    BUDGETS = {
+        'item-list': 1,
+        'category-list': 1,
+        'service-list': 1,
+        'shift-list': 5,
+        'shift-service': 6,
+        'reservation-list': 3,
+        'shift-free-times': 5,
+        'shift-next-available': 6,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        self.services = [
+            Service.objects.create(name=f'Service {i}', duration=datetime.timedelta(minutes=30), price=10.0)
+            for i in range(2)
+        ]
+        self.add_rows(2)
+
+    def add_rows(self, n):
+        for _ in range(n):
+            category = Category.objects.create(name='Test Category')
+            item = Item.objects.create(name='Test Item', category=category)
+            shift = Shift.objects.create(
+                item=item,
+                start_date=self.start,
+                end_date=self.start + datetime.timedelta(hours=2),
+                repeat='do not repeat',
+            )
+            shift.services.add(*self.services)
+            Reservation.objects.create(
+                reserver=self.user, item=item, shift=shift, service=self.services[0], time_date=self.start,
+            )
+
+    def urls(self):
+        service = self.services[0].pk
+        category = Category.objects.first().pk
+        return {
+            'item-list': (reverse('item-list'), {}),
+            'category-list': (reverse('category-list'), {}),
+            'service-list': (reverse('service-list'), {}),
+            'shift-list': (reverse('shift-list'), {}),
+            'shift-service': (reverse('shift-service', args=[service]), {}),
+            'reservation-list': (reverse('reservation-list'), {}),
+            'shift-free-times': (reverse('shift-free-times'), {
+                'service': service,
+                'items': ','.join(str(pk) for pk in Item.objects.values_list('pk', flat=True)),
+                'start': timezone.localdate(self.start).isoformat(),
+            }),
+            'shift-next-available': (reverse('shift-next-available'), {'service': service, 'category': category}),
+        }
+
+    def count_queries(self):
+        # budgets are for computing the responses, not for serving them from the cache
+        cache.clear()
+        counts = {}
+        for name, (url, params) in self.urls().items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_budgets(self):
+        for name, count in self.count_queries().items():
+            self.assertLessEqual(count, self.BUDGETS[name], name)
+
+    def test_constant_as_data_grows(self):
+        few = self.count_queries()
+        self.add_rows(8)
+        self.assertEqual(self.count_queries(), few)
+
+
+
+#----------------------cursor pagination -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now() + datetime.timedelta(days=1)
+        self.service = Service.objects.create(
+            name='Test Service', duration=datetime.timedelta(minutes=30), price=10.0
+        )
+        self.item = Item.objects.create(name='Test Item')
+        # pairs of shifts starting at the same time, the id breaks the tie
+        self.shifts = []
+        for i in range(15):
+            shift = Shift.objects.create(
+                item=self.item,
+                start_date=self.start + datetime.timedelta(hours=i // 2, microseconds=7),
+                end_date=self.start + datetime.timedelta(hours=i // 2 + 1),
+                repeat='do not repeat',
+            )
+            shift.services.add(self.service)
+            self.shifts.append(shift)
+
+    def walk(self, url, params=None):
+        ids = []
+        response = self.client.get(url, params or {})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_page_number_is_default(self):
+        response = self.client.get(reverse('shift-list'))
+        self.assertEqual(response.data['count'], 15)
+
+    def test_cursor_walks_every_shift_once(self):
+        ids, _ = self.walk(reverse('shift-list'), {'pagination': 'cursor'})
+        self.assertEqual(ids, [shift.pk for shift in self.shifts])
+
+    def test_previous_link(self):
+        first = self.client.get(reverse('shift-list'), {'pagination': 'cursor'})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [row['id'] for row in back.data['results']],
+            [row['id'] for row in first.data['results']],
+        )
+
+    def test_constant_queries(self):
+        first = self.client.get(reverse('shift-list'), {'pagination': 'cursor'})
+        # savepoint, page, services, release savepoint
+        with self.assertNumQueries(4):
+            response = self.client.get(first.data['next'])
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('shift-list'), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_service_action(self):
+        ids, _ = self.walk(reverse('shift-service', args=[self.service.pk]), {'pagination': 'cursor'})
+        self.assertEqual(ids, [shift.pk for shift in self.shifts])
+
+    def test_reservations(self):
+        for i in range(14):
+            Reservation.objects.create(
+                reserver=self.user, shift=self.shifts[i], service=self.service,
+                time_date=self.shifts[i].start_date,
+            )
+        self.assertEqual(len(self.client.get(reverse('reservation-list')).data), 14)
+        ids, _ = self.walk(reverse('reservation-list'), {'pagination': 'cursor'})
+        self.assertEqual(ids, list(Reservation.objects.order_by('time_date', 'id').values_list('id', flat=True)))
+
+    @override_settings(LAZY_RECURRENCE=True)
+    def test_virtual_occurrences(self):
+        parent = self.shifts[0]
+        Shift.objects.filter(pk=parent.pk).update(repeat='every week', n_time_repeat=3)
+        ids, _ = self.walk(reverse('shift-list'), {'pagination': 'cursor'})
+        self.assertEqual(
+            ids, [shift.pk for shift in self.shifts] + [f'{parent.pk}-{n}' for n in range(1, 4)],
+        )
+
+
+#----------------------compiled list serializers -------------------------------
+
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from main.fast_serializers import compile_serializer
+from main.serializers import (
+    CategorySerializer, ItemSerializer, ReservationSerializer, ServiceSerializer, ShiftOccurrenceSerializer,
+    ShiftSerializer,
+)
+
+
+class CompiledSerializerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.request = APIRequestFactory().get('/')
+        self.start = timezone.now() + datetime.timedelta(days=1, microseconds=123)
+        category = Category.objects.create(name='Test Category')
+        self.services = [
+            Service.objects.create(name=f'Service {i}', duration=datetime.timedelta(minutes=25), price='10.50')
+            for i in range(3)
+        ]
+        Item.objects.create(name='No Category', description='', image='items/photo.png')
+        for i in range(3):
+            item = Item.objects.create(name=f'Item {i}', category=category, description='text', experience='5')
+            shift = Shift.objects.create(
+                item=item,
+                start_date=self.start,
+                end_date=self.start + datetime.timedelta(hours=2),
+                repeat='do not repeat',
+            )
+            shift.services.add(*reversed(self.services[:i + 1]))
+            Reservation.objects.create(
+                reserver=self.user, item=item, shift=shift, service=self.services[0], time_date=self.start,
+            )
+        Reservation.objects.create(reserver=self.user, time_date=self.start)
+
+    def assertSameJSON(self, serializer_class, queryset):
+        context = {'request': self.request}
+        compiled = compile_serializer(serializer_class, context)
+        self.assertIsNotNone(compiled)
+        expected = serializer_class(queryset, many=True, context=context).data
+        self.assertEqual(
+            JSONRenderer().render(compiled.render(compiled.rows(queryset))),
+            JSONRenderer().render(expected),
+        )
+
+    def test_same_output(self):
+        self.assertSameJSON(ItemSerializer, Item.objects.select_related('category'))
+        self.assertSameJSON(CategorySerializer, Category.objects.all())
+        self.assertSameJSON(ServiceSerializer, Service.objects.all())
+        self.assertSameJSON(ShiftSerializer, Shift.objects.prefetch_related(
+            Prefetch('services', queryset=Service.objects.order_by('pk')),
+        ))
+        self.assertSameJSON(ReservationSerializer, Reservation.objects.select_related('reserver'))
+
+    def test_method_fields_are_not_compiled(self):
+        self.assertIsNone(compile_serializer(ShiftOccurrenceSerializer))
+
+    def test_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('shift-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row['services'] for row in response.data['results']],
+            [[service.pk for service in self.services[:n]] for n in range(1, 4)],
+        )
+
+
+#----------------------orjson -------------------------------
+
+import json
+from collections import OrderedDict
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+from django.http import StreamingHttpResponse
+from main.renderers import ORJSONRenderer
+
+
+class ORJSONTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+
+    def test_same_bytes_as_drf(self):
+        moment = datetime.datetime(2024, 1, 1, 8, 30, 0, 250, tzinfo=ZoneInfo('UTC'))
+        data = OrderedDict([
+            ('utc', moment),
+            ('local', moment.astimezone(ZoneInfo('Asia/Tehran'))),
+            ('day', moment.date()),
+            ('time', datetime.time(9, 15)),
+            ('price', Decimal('10.50')),
+            ('duration', datetime.timedelta(minutes=15)),
+            ('text', 'نوبت '),
+            ('nested', [{'a': None, 'b': True, 'c': 1.5}]),
+        ])
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indent_falls_back(self):
+        rendered = ORJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, b'{\n  "a": 1\n}')
+
+    def test_parses_json(self):
+        response = self.client.post(reverse('category-list'), {'name': 'Cardiology'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['name'], 'Cardiology')
+
+    def test_invalid_json(self):
+        response = self.client.post(reverse('category-list'), '{"name": NaN}', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_long_free_time_streams(self):
+        cache.clear()
+        service = Service.objects.create(name='Test Service', duration=datetime.timedelta(minutes=5), price=10.0)
+        start = timezone.now().replace(microsecond=0)
+        shift = Shift.objects.create(
+            start_date=start, end_date=start + datetime.timedelta(hours=10), repeat='do not repeat',
+        )
+        shift.services.add(service)
+        url = reverse('shift-free-time', args=[shift.pk, service.pk])
+
+        response = self.client.get(url)
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+        with override_settings(STREAM_JSON_MIN_ITEMS=100):
+            streamed = self.client.get(url)
+        self.assertIsInstance(streamed, StreamingHttpResponse)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        body = b''.join(streamed.streaming_content)
+        self.assertEqual(body, response.content)
+        self.assertEqual(len(json.loads(body)), 120)
+
+
+#----------------------sparse fieldsets -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now() + datetime.timedelta(days=1)
+        self.category = Category.objects.create(name='Cardiology')
+        self.services = [
+            Service.objects.create(name=f'Service {i}', duration=datetime.timedelta(minutes=30), price=10.0)
+            for i in range(2)
+        ]
+        for i in range(3):
+            item = Item.objects.create(name=f'Doctor {i}', category=self.category)
+            shift = Shift.objects.create(
+                item=item,
+                start_date=self.start + datetime.timedelta(hours=i),
+                end_date=self.start + datetime.timedelta(hours=i + 2),
+                repeat='do not repeat',
+            )
+            shift.services.add(*self.services)
+            Reservation.objects.create(
+                reserver=self.user, item=item, shift=shift, service=self.services[0], time_date=shift.start_date,
+            )
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, queries
+
+    def test_fields(self):
+        response, queries = self.get(reverse('shift-list'), {'fields': 'id,start_date,end_date'})
+        for row in response.data['results']:
+            self.assertEqual(list(row), ['id', 'start_date', 'end_date'])
+        self.assertFalse(any('core_service' in query['sql'] for query in queries))
+
+    def test_fields_with_cursor(self):
+        response, _ = self.get(reverse('shift-list'), {'fields': 'id', 'pagination': 'cursor'})
+        self.assertEqual(list(response.data['results'][0]), ['id'])
+        self.assertIsNone(response.data['next'])
+
+    def test_expand(self):
+        response, queries = self.get(reverse('shift-list'), {'expand': 'item,services'})
+        row = response.data['results'][0]
+        self.assertEqual(row['item']['name'], 'Doctor 0')
+        self.assertEqual(row['item']['category'], 'Cardiology')
+        self.assertEqual([service['name'] for service in row['services']], ['Service 0', 'Service 1'])
+        # savepoint, count, page with items and categories, services, release
+        self.assertEqual(len(queries), 5)
+
+    def test_expand_with_fields(self):
+        response, _ = self.get(reverse('shift-list'), {'fields': 'id', 'expand': 'item'})
+        row = response.data['results'][0]
+        self.assertEqual(list(row), ['id', 'item'])
+        self.assertEqual(row['item']['name'], 'Doctor 0')
+
+    def test_expand_constant_queries(self):
+        _, few = self.get(reverse('reservation-list'), {'expand': 'shift,service,item'})
+        Reservation.objects.create(
+            reserver=self.user, item=Item.objects.first(), shift=Shift.objects.first(),
+            service=self.services[1], time_date=self.start,
+        )
+        response, more = self.get(reverse('reservation-list'), {'expand': 'shift,service,item'})
+        self.assertEqual(len(more), len(few))
+        self.assertEqual(response.data[0]['shift']['services'], [service.pk for service in self.services])
+
+    def test_retrieve(self):
+        item = Item.objects.first()
+        response, _ = self.get(reverse('item-detail', args=[item.pk]), {'fields': 'name', 'expand': 'category'})
+        self.assertEqual(response.data, {'name': 'Doctor 0', 'category': {'id': self.category.pk, 'name': 'Cardiology'}})
+
+    def test_service_action(self):
+        response, _ = self.get(reverse('shift-service', args=[self.services[0].pk]), {'fields': 'id,item'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'item'])
+
+    def test_writes_ignore_fields(self):
+        url = reverse('category-list') + '?fields=id'
+        response = self.client.post(url, {'name': 'Dentistry'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'Dentistry')
+
+    @override_settings(LAZY_RECURRENCE=True)
+    def test_virtual_occurrences(self):
+        parent = Shift.objects.first()
+        Shift.objects.filter(pk=parent.pk).update(repeat='every week', n_time_repeat=2)
+        response, _ = self.get(reverse('shift-list'), {'fields': 'id,start_date'})
+        ids = [row['id'] for row in response.data['results']]
+        self.assertIn(f'{parent.pk}-2', ids)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'start_date'])
+
+
+#----------------------conditional GET -------------------------------
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Cardiology')
+        self.item = Item.objects.create(name='Doctor', category=self.category)
+        Service.objects.create(name='Visit', duration=datetime.timedelta(minutes=15), price=10.0)
+
+    def test_validators(self):
+        for name in ('item-list', 'service-list', 'category-list'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertIn('Last-Modified', response)
+
+    def test_revalidation_runs_no_query(self):
+        url = reverse('item-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        url = reverse('service-list')
+        modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_changes_invalidate(self):
+        url = reverse('item-list')
+        etag = self.client.get(url)['ETag']
+        # items render the name of their category
+        self.category.name = 'Dentistry'
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['category'], 'Dentistry')
+
+        etag = response['ETag']
+        self.item.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_representations_differ(self):
+        url = reverse('item-detail', args=[self.item.pk])
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.client.get(url, {'fields': 'id'})['ETag'],
+        )
+
+
+#----------------------response cache -------------------------------
+
+from unittest import mock
+from main.cache import cache_stats
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Cardiology')
+        self.items = [Item.objects.create(name=f'Doctor {i}', category=self.category) for i in range(2)]
+
+    def detail(self, item):
+        return reverse('item-detail', args=[item.pk])
+
+    def test_hit_runs_no_query(self):
+        self.client.get(reverse('item-list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('item-list'))
+        self.assertEqual([row['name'] for row in response.data], ['Doctor 0', 'Doctor 1'])
+        self.assertEqual(cache_stats(['item']), {'item': (1, 1)})
+
+    def test_keys_vary_by_query(self):
+        self.client.get(reverse('item-list'))
+        response = self.client.get(reverse('item-list'), {'fields': 'name'})
+        self.assertEqual(response.data, [{'name': 'Doctor 0'}, {'name': 'Doctor 1'}])
+
+    def test_edit_invalidates_only_its_keys(self):
+        for item in self.items:
+            self.client.get(self.detail(item))
+        self.client.get(reverse('item-list'))
+        self.items[0].name = 'Renamed'
+        self.items[0].save()
+
+        with self.assertNumQueries(0):
+            self.client.get(self.detail(self.items[1]))
+        self.assertEqual(self.client.get(self.detail(self.items[0])).data['name'], 'Renamed')
+        self.assertEqual(self.client.get(reverse('item-list')).data[0]['name'], 'Renamed')
+
+    def test_new_rows_invalidate_lists(self):
+        self.client.get(reverse('item-list'))
+        Item.objects.create(name='Doctor 2')
+        self.assertEqual(len(self.client.get(reverse('item-list')).data), 3)
+
+    def test_dependencies_invalidate(self):
+        self.client.get(reverse('item-list'))
+        self.category.name = 'Dentistry'
+        self.category.save()
+        self.assertEqual(self.client.get(reverse('item-list')).data[0]['category'], 'Dentistry')
+
+    def test_missing_rows_are_not_cached(self):
+        url = reverse('item-detail', args=[999])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RESPONSE_CACHE_TTL={'item': 0})
+    def test_expired_key_served_stale_while_locked(self):
+        self.client.get(reverse('item-list'))
+        add = cache.add
+
+        def add_unless_lock(key, *args, **kwargs):
+            # another request holds the recompute lock
+            return False if key.endswith(':lock') else add(key, *args, **kwargs)
+
+        with mock.patch.object(cache, 'add', add_unless_lock), self.assertNumQueries(0):
+            response = self.client.get(reverse('item-list'))
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(cache_stats(['item']), {'item': (0, 1)})
+        # the next request takes the lock and recomputes
+        with self.assertNumQueries(1):
+            self.client.get(reverse('item-list'))
+
+    def test_concurrent_misses_compute_once(self):
+        computed = []
+
+        def compute():
+            computed.append(1)
+            time.sleep(0.05)
+            return ['value'], ['item:set']
+
+        from main.cache import get_or_compute_tagged
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute_tagged('item', 'key', compute, 60)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [['value']] * 4)
+        self.assertEqual(len(computed), 1)
+
+
+#----------------------item search and filters -------------------------------
+
+from core.search import search_items, search_terms
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ItemSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.cardiology = Category.objects.create(name='Cardiology')
+        self.dentistry = Category.objects.create(name='Dentistry')
+        self.heart = Item.objects.create(
+            name='Sara Ahmadi', first_name='Sara', last_name='Ahmadi', category=self.cardiology,
+            description='heart surgeon', experience='10',
+        )
+        self.teeth = Item.objects.create(
+            name='Reza Karimi', first_name='Reza', last_name='Karimi', category=self.dentistry,
+            description='works with Sara on implants', experience='5',
+        )
+        self.other = Item.objects.create(
+            name='Ali Rahimi', category=self.dentistry, description='orthodontist', experience='10',
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('item-search'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data]
+
+    def test_name_match_ranks_first(self):
+        self.assertEqual(self.search(q='sara'), [self.heart.pk, self.teeth.pk])
+
+    def test_prefix(self):
+        self.assertEqual(self.search(q='kar'), [self.teeth.pk])
+
+    def test_every_term_has_to_match(self):
+        self.assertEqual(self.search(q='sara heart'), [self.heart.pk])
+
+    def test_category_and_description(self):
+        self.assertEqual(self.search(q='cardio'), [self.heart.pk])
+        self.assertEqual(self.search(q='orthodont'), [self.other.pk])
+
+    def test_limit_and_filters(self):
+        self.assertEqual(self.search(q='sara', limit=1), [self.heart.pk])
+        self.assertEqual(self.search(q='sara', category=self.dentistry.pk), [self.teeth.pk])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(reverse('item-search')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('item-search'), {'q': 'x', 'limit': 0}).status_code, 400)
+
+    def test_no_terms_match_nothing(self):
+        self.assertEqual(search_terms(' -- '), [])
+        self.assertFalse(search_items(Item.objects.all(), ' -- ').exists())
+
+    def test_new_items_are_found(self):
+        self.search(q='sara')
+        sara = Item.objects.create(name='Sara Nouri', description='')
+        self.assertIn(sara.pk, self.search(q='sara'))
+
+    def test_list_filters(self):
+        response = self.client.get(reverse('item-list'), {'category': self.dentistry.pk, 'experience': '10'})
+        self.assertEqual([row['id'] for row in response.data], [self.other.pk])
+        self.assertEqual(self.client.get(reverse('item-list'), {'category': 'x'}).status_code, 400)
+
+
+#----------------------shift filters -------------------------------
+
+class ShiftFilterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='testuser')
+        self.client.force_authenticate(self.user)
+        self.items = [Item.objects.create(name=f'Doctor {i}') for i in range(2)]
+        self.services = [Service.objects.create(name=f'Service {i}', price=10) for i in range(2)]
+        self.now = timezone.now().replace(microsecond=0)
+        self.past = self.shift(self.items[0], -3)
+        self.archived = self.shift(self.items[0], 1, is_archive=True)
+        self.tomorrow = self.shift(self.items[0], 1)
+        self.unavailable = self.shift(self.items[1], 2, service=self.services[1], is_available=False)
+        self.next_month = self.shift(self.items[1], 30)
+
+    def shift(self, item, days, service=None, **fields):
+        start = self.now + datetime.timedelta(days=days)
+        fields.setdefault('repeat', 'do not repeat')
+        shift = Shift.objects.create(item=item, start_date=start, end_date=start + datetime.timedelta(hours=4), **fields)
+        shift.services.add(service or self.services[0])
+        return shift
+
+    def ids(self, **params):
+        response = self.client.get(reverse('shift-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [shift['id'] for shift in response.data['results']]
+
+    def test_upcoming_and_not_archived_by_default(self):
+        self.assertEqual(self.ids(), [self.tomorrow.pk, self.unavailable.pk, self.next_month.pk])
+
+    def test_item_service_and_availability(self):
+        self.assertEqual(self.ids(item=self.items[1].pk), [self.unavailable.pk, self.next_month.pk])
+        self.assertEqual(self.ids(service=self.services[1].pk), [self.unavailable.pk])
+        self.assertEqual(self.ids(is_available='true', item=self.items[1].pk), [self.next_month.pk])
+
+    def test_archived(self):
+        self.assertEqual(self.ids(is_archive='true'), [self.archived.pk])
+
+    def test_window(self):
+        week = {'after': self.now.isoformat(), 'before': (self.now + datetime.timedelta(days=7)).isoformat()}
+        self.assertEqual(self.ids(**week), [self.tomorrow.pk, self.unavailable.pk])
+        earlier = (self.now - datetime.timedelta(days=5)).isoformat()
+        self.assertEqual(self.ids(after=earlier, item=self.items[0].pk), [self.past.pk, self.tomorrow.pk])
+
+    def test_invalid_params(self):
+        response = self.client.get(reverse('shift-list'), {'after': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_detail_is_not_filtered(self):
+        for shift in (self.past, self.archived):
+            response = self.client.get(reverse('shift-detail', args=[shift.pk]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(LAZY_RECURRENCE=True)
+    def test_occurrences_of_past_repeating_shifts(self):
+        weekly = self.shift(self.items[1], -10, repeat='every week', n_time_repeat=3)
+        ids = self.ids(item=self.items[1].pk)
+        self.assertEqual(ids[:2], [self.unavailable.pk, f'{weekly.pk}-2'])
+        self.assertNotIn(weekly.pk, ids)
+        self.assertNotIn(f'{weekly.pk}-1', ids)
+
+
+#----------------------unreachable cache -------------------------------
+
+UNREACHABLE_CACHES = {'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://127.0.0.1:1'}}
+
+
+@override_settings(CACHES=UNREACHABLE_CACHES)
+class UnreachableCacheTestCase(TestCase):
+    def test_writes_succeed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(name='Doctor')
+            item.delete()
+        self.assertFalse(Item.objects.exists())
+
+    def test_reads_come_from_the_database(self):
+        start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=1)
+        service = Service.objects.create(name='Checkup', duration=datetime.timedelta(minutes=30), price=10.0)
+        category = Category.objects.create(name='Heart')
+        item = Item.objects.create(name='Doctor', category=category)
+        shift = Shift.objects.create(
+            item=item, start_date=start, end_date=start + datetime.timedelta(hours=2), repeat='do not repeat',
+        )
+        shift.services.add(service)
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='testuser'))
+        for url, params, length in (
+            (reverse('item-list'), {}, 1),
+            (reverse('item-detail', args=[item.pk]), {}, None),
+            (reverse('category-list'), {}, 1),
+            (reverse('service-list'), {}, 1),
+            (reverse('shift-service', args=[service.pk]), {}, 1),
+            (reverse('shift-free-time', args=[shift.pk, service.pk]), {}, 4),
+            (reverse('shift-free-times'), {
+                'service': service.pk, 'items': str(item.pk), 'start': timezone.localdate(start).isoformat(),
+            }, 1),
+            (reverse('shift-next-available'), {'service': service.pk, 'k': 2}, 2),
+        ):
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            if length is not None:
+                data = response.data
+                self.assertEqual(len(data['results'] if 'results' in data else data), length, url)
@@ -1,73 +1,320 @@
-from main.pagination import CustomPageNumberPagination
+from main.pagination import ReservationPagination, ShiftPagination
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django_filters.rest_framework import DjangoFilterBackend
 from main.serializers import *
 from core.models import *
+from core.availability import busy_intervals, earliest_free_slots, free_slots, free_slots_by_item_and_day
+from core.recurrence import (
+    earliest_occurrence_slots, get_occurrence, is_virtual, lazy_recurrence_enabled, materialize,
+    merge_by_item_and_day, occurrence_slots_by_item_and_day, parse_occurrence_id, with_occurrences,
+)
+from core.search import search_items
+from core.booking import SlotTaken, bulk_create_reservations, check_all_free, check_free, lock_shift, lock_shifts
+from core.slots import earliest_slots, refresh_booked_slots, shift_slots, slot_table_enabled, slots_by_item_and_day
 from datetime import datetime, date, timedelta
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Min, Prefetch, Q
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from main.send_mail import send_mail
+from main.cache import bump_version, get_or_compute, url_key, versioned_key
+from main.holds import (
+    HoldBusy, HoldTaken, check_not_held, get_hold, held_intervals, held_intervals_by_shift, place_hold,
+    release_hold, seconds_to_expiry, shift_holds,
+)
+from main.exceptions import Conflict
+from main.filters import ItemFilter, ShiftFilter, shift_window
+from main.fast_serializers import FastListMixin
+from main.renderers import should_stream, stream_json
+from main.sparse import AdaptiveQuerysetMixin
+from main.conditional import ConditionalGetMixin
+from main.response_cache import ResponseCacheMixin
+from main.idempotency import idempotent
 import globals
 
 User = get_user_model()
 
 
-class ItemViewSet(viewsets.ModelViewSet):
-    queryset = Item.objects.all()
+class ItemViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, AdaptiveQuerysetMixin, FastListMixin, viewsets.ModelViewSet,
+):
+    queryset = Item.objects.select_related('category')
     serializer_class = ItemSerializer
     permission_classes = [IsAuthenticated]
+    # items render the name of their category
+    version_names = ('items', 'categories')
+    cache_tag = 'item'
+    cache_depends = ('categories',)
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ItemFilter
 
-class ShiftViewSet(viewsets.ModelViewSet):
-    queryset = Shift.objects.all()
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """items matching ?q= by name, doctor name, description or category, best first"""
+        params = ItemSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        def compute():
+            items = search_items(self.filter_queryset(self.get_queryset()), params.validated_data['q'])
+            data = self.list_data(items[:params.validated_data['limit']])
+            return data, [f'{self.cache_tag}:set', *self.row_tags(data), *self.cache_depends]
+
+        return self.conditional(lambda request: self.cached(request, compute), request)
+
+
+def ordered_services():
+    # a stable order so the compiled serializers render the same lists
+    return Prefetch('services', queryset=Service.objects.order_by('pk'))
+
+
+class ShiftViewSet(AdaptiveQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Shift.objects.prefetch_related(ordered_services())
     serializer_class = ShiftSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPageNumberPagination
+    pagination_class = ShiftPagination
+    filterset_class = ShiftFilter
 
-    @action(detail=True, methods=['get'],)   
-    def service(self, request, pk):
-        service = Service.objects.get(pk=pk)
-        shifts = service.shift_set.filter(start_date__gte=datetime.now()).order_by('-start_date')
+    # a virtual occurrence is saved as a real shift before these change it
+    MATERIALIZING_ACTIONS = ('update', 'partial_update', 'hold')
+
+    @property
+    def filter_backends(self):
+        # the defaults of the list do not hide a shift from its detail and actions
+        return [DjangoFilterBackend] if self.action == 'list' else []
+
+    def get_serializer_class(self):
+        if lazy_recurrence_enabled():
+            return ShiftOccurrenceSerializer
+        return super().get_serializer_class()
 
+    def get_object(self):
+        occurrence = parse_occurrence_id(self.kwargs['pk']) if lazy_recurrence_enabled() else None
+        if occurrence is None:
+            return super().get_object()
+        try:
+            if self.action in self.MATERIALIZING_ACTIONS:
+                shift = materialize(*occurrence)
+            else:
+                shift = get_occurrence(*occurrence)
+        except Shift.DoesNotExist:
+            raise NotFound()
+        if is_virtual(shift) and self.action == 'destroy':
+            raise NotFound("occurrence has not been saved")
+        self.check_object_permissions(self.request, shift)
+        return shift
+
+    def list(self, request, *args, **kwargs):
+        if not lazy_recurrence_enabled():
+            return super().list(request, *args, **kwargs)
+        shifts = self.filter_queryset(self.get_queryset())
+        window_start, window_end = shift_window(request.query_params)
+        shifts = with_occurrences(shifts, window_start=window_start, window_end=window_end)
         page = self.paginate_queryset(shifts)
         if page is not None:
-            serializer = ShiftSerializer(page, many=True)
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = ShiftSerializer(shifts, many=True)
+        serializer = self.get_serializer(shifts, many=True)
         return Response(serializer.data)
-        
-            
+
+    @action(detail=True, methods=['get'],)   
+    def service(self, request, pk):
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise NotFound()
+        key = versioned_key('service', pk, url_key(request), versions=(f'service:{pk}', 'shifts'))
+        cached = get_or_compute(
+            'service', key, lambda: self.service_shifts(request, pk), timeout=self.service_shifts_ttl,
+        )
+        return Response(cached['shifts'])
+
+    @staticmethod
+    def service_shifts_ttl(cached):
+        """CACHE_TTL, cut short when the first listed shift starts and leaves the list"""
+        if cached['first_start'] is None:
+            return settings.CACHE_TTL
+        seconds = int((cached['first_start'] - timezone.now()).total_seconds()) + 1
+        return max(min(seconds, settings.CACHE_TTL), 1)
+
+    def service_shifts(self, request, pk):
+        """{'shifts': upcoming shifts of the service, 'first_start': start of the first of them}"""
+        now = timezone.now()
+        if lazy_recurrence_enabled():
+            return self.service_occurrences(request, get_object_or_404(Service, pk=pk), now)
+        service = get_object_or_404(
+            Service.objects.annotate(first_start=Min('shift__start_date', filter=Q(shift__start_date__gte=now))),
+            pk=pk,
+        )
+        shifts = (
+            service.shift_set
+            .filter(start_date__gte=now)
+            .order_by('-start_date')
+            .prefetch_related(ordered_services())
+        )
+        data = self.list_data(self.adapt_queryset(shifts, ShiftSerializer), ShiftSerializer)
+        return {'shifts': data, 'first_start': service.first_start}
+
+    def service_occurrences(self, request, service, now):
+        shifts = [
+            shift for shift in with_occurrences(
+                service.shift_set.prefetch_related(ordered_services()), window_start=now, reverse=True,
+            )
+            if shift.start_date >= now
+        ]
+
+        first_start = shifts[-1].start_date if shifts else None
+
+        page = self.paginate_queryset(shifts)
+        if page is not None:
+            serializer = ShiftOccurrenceSerializer(page, many=True)
+            return {'shifts': self.get_paginated_response(serializer.data).data, 'first_start': first_start}
+
+        serializer = ShiftOccurrenceSerializer(shifts, many=True)
+        return {'shifts': serializer.data, 'first_start': first_start}
 
     @action(detail=True, methods=['get'], url_path='free_time/(?P<serv_id>\w+)')   
     def free_time(self, request, pk, serv_id):
-        shift = Shift.objects.get(pk=pk)
-        service = Service.objects.get(pk=serv_id)
-        reserved = Reservation.objects.filter(shift=shift).order_by('time_date')
-        startAvailable = shift.start_date
-        available_times = []
-        if reserved:
-            for reservation in reserved:
-                difft = reservation.time_date - startAvailable
-                if difft.seconds >= service.duration.seconds:
-                    x = startAvailable
-                    while reservation.time_date >= x+service.duration:
-                        available_times.append({'start': x})
-                        x = x+service.duration
-                startAvailable = reservation.time_date + reservation.service.duration
-        x = startAvailable
-        while x+service.duration <= shift.end_date:
-            available_times.append({'start': x}) 
-            x = x + service.duration
-      
+        occurrence = parse_occurrence_id(pk) if lazy_recurrence_enabled() else None
+        if occurrence is not None:
+            try:
+                shift = get_occurrence(*occurrence)
+            except Shift.DoesNotExist:
+                raise NotFound()
+            if is_virtual(shift):
+                service = get_object_or_404(Service, pk=serv_id)
+                # nothing is booked on an occurrence that was never saved
+                available_times = free_slots(shift, service.duration, busy=[])
+                if should_stream(request, available_times):
+                    return stream_json(available_times)
+                return Response(available_times)
+            pk = shift.pk
+        try:
+            pk, serv_id = int(pk), int(serv_id)
+        except ValueError:
+            raise NotFound()
+        holds = shift_holds(pk)
+        key = versioned_key('free_time', pk, serv_id, versions=(f'shift:{pk}', f'service:{serv_id}'))
+        timeout = seconds_to_expiry(holds)
+        if timeout is not None:
+            # the answer changes as soon as the first hold runs out
+            timeout = min(timeout, settings.CACHE_TTL)
+        available_times = get_or_compute(
+            'free_time', key, lambda: self.shift_free_time(pk, serv_id, holds), timeout=timeout,
+        )
+
+        if should_stream(request, available_times):
+            return stream_json(available_times)
+        return Response(available_times)
+
+    def shift_free_time(self, pk, serv_id, holds=()):
+        shift = get_object_or_404(Shift, pk=pk)
+        service = get_object_or_404(Service, pk=serv_id)
+        held = held_intervals(holds)
+        if slot_table_enabled():
+            return [
+                slot for slot in shift_slots(shift.pk, service.pk)
+                if not any(start < slot['start'] + service.duration and slot['start'] < end for start, end in held)
+            ]
+        busy = sorted(busy_intervals(shift.pk) + held)
+        return free_slots(shift, service.duration, busy)
+
+    @action(detail=True, methods=['post'])
+    def hold(self, request, pk):
+        """hold a free time of the shift for SLOT_HOLD_TTL seconds, confirm it on /reservations/confirm/"""
+        shift = self.get_object()
+        params = HoldSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        service = params.validated_data['service']
+        start = params.validated_data['time_date']
+        if start < shift.start_date or start + service.duration > shift.end_date:
+            raise ValidationError("time is outside of the shift")
+        try:
+            check_free(shift.pk, start, service.duration)
+            hold = place_hold(shift, service, start, request.user.pk)
+        except (SlotTaken, HoldTaken, HoldBusy):
+            raise Conflict()
+        bump_version(f'shift:{shift.pk}')
+
+        return Response({
+            'hold': hold['token'],
+            'shift': hold['shift'],
+            'service': hold['service'],
+            'time_date': hold['start'],
+            'expires': hold['expires'],
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def free_times(self, request):
+        """free slots of a service for many items over a date range, grouped by item and day"""
+        params = FreeTimeRangeSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        service = params.validated_data['service']
+        window_start = timezone.make_aware(datetime.combine(params.validated_data['start'], datetime.min.time()))
+        window_end = timezone.make_aware(datetime.combine(params.validated_data['end'] + timedelta(days=1), datetime.min.time()))
+
+        shifts = Shift.objects.filter(services=service, is_archive=False, is_available=True)
+        held = held_intervals_by_shift()
+        if params.validated_data.get('items'):
+            shifts = shifts.filter(item__in=params.validated_data['items'])
+        if params.validated_data.get('category') is not None:
+            shifts = shifts.filter(item__category=params.validated_data['category'])
+        if slot_table_enabled():
+            available_times = slots_by_item_and_day(
+                shifts.filter(start_date__lt=window_end, end_date__gt=window_start),
+                service.pk, window_start, window_end, held=held, duration=service.duration,
+            )
+        else:
+            available_times = free_slots_by_item_and_day(
+                list(shifts.filter(start_date__lt=window_end, end_date__gt=window_start).order_by('start_date')),
+                service.duration, window_start, window_end, held=held,
+            )
+        if lazy_recurrence_enabled():
+            merge_by_item_and_day(available_times, occurrence_slots_by_item_and_day(
+                shifts, service.duration, window_start, window_end,
+            ))
+
         return Response(available_times)
 
+    @action(detail=False, methods=['get'])
+    def next_available(self, request):
+        """earliest k free slots of a service over every item, optionally of one category"""
+        params = NextAvailableSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        service = params.validated_data['service']
+        after = params.validated_data.get('after') or timezone.now()
+        k = params.validated_data['k']
+
+        shifts = Shift.objects.filter(services=service, is_archive=False, is_available=True)
+        if params.validated_data.get('category') is not None:
+            shifts = shifts.filter(item__category=params.validated_data['category'])
 
-class ReservationViewSet(viewsets.ModelViewSet):
-    queryset = Reservation.objects.all()
+        held = held_intervals_by_shift()
+        if slot_table_enabled():
+            available_times = earliest_slots(shifts, service.pk, after, k, held=held, duration=service.duration)
+        else:
+            available_times = earliest_free_slots(shifts, service.duration, after, k, held=held)
+        if lazy_recurrence_enabled():
+            available_times = sorted(
+                available_times + earliest_occurrence_slots(shifts, service.duration, after, k),
+                key=lambda slot: slot['start'],
+            )[:k]
+
+        return Response(available_times)
+
+
+class ReservationViewSet(AdaptiveQuerysetMixin, FastListMixin, viewsets.ModelViewSet):
+    queryset = Reservation.objects.select_related('reserver')
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ReservationPagination
 
     def destroy(self, request, *args, **kwargs):
         super().destroy(request)
@@ -76,20 +323,125 @@ class ReservationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(reserver = self.request.user)
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        t= serializer.save(reserver = self.request.user)
+        with transaction.atomic():
+            self.lock_and_check(serializer)
+            t= serializer.save(reserver = self.request.user)
 
         return t
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            self.lock_and_check(serializer, exclude=serializer.instance.pk)
+            serializer.save()
+
+    def lock_and_check(self, serializer, exclude=None):
+        """lock the shift and refuse times overlapping its reservations"""
+        data = serializer.validated_data
+        instance = serializer.instance
+        shift = data['shift'] if 'shift' in data else getattr(instance, 'shift', None)
+        service = data['service'] if 'service' in data else getattr(instance, 'service', None)
+        time_date = data['time_date'] if 'time_date' in data else getattr(instance, 'time_date', None)
+        if shift is None or service is None or time_date is None:
+            return
+        lock_shift(shift.pk)
+        try:
+            check_not_held(shift.pk, time_date, time_date + service.duration, self.request.user.pk)
+            check_free(shift.pk, time_date, service.duration, exclude=exclude)
+        except (SlotTaken, HoldTaken):
+            raise Conflict()
 
-class ServiceViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def bulk(self, request):
+        """create a list of reservations in one transaction, all of them or none"""
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        requested = []
+        for data in serializer.validated_data:
+            if data.get('shift') is None or data.get('service') is None:
+                raise ValidationError("every reservation needs a shift and a service")
+            requested.append((data['shift'].pk, data['time_date'], data['time_date'] + data['service'].duration))
+
+        with transaction.atomic():
+            shifts = lock_shifts({shift_id for shift_id, _, _ in requested})
+            try:
+                for index, (shift_id, start, end) in enumerate(requested):
+                    check_not_held(shift_id, start, end, request.user.pk)
+                check_all_free(requested)
+            except HoldTaken:
+                raise Conflict(f"reservation {index} is held by another patient")
+            except SlotTaken as e:
+                raise Conflict(f"reservation {e.args[0]} overlaps another reservation")
+            reservations = bulk_create_reservations([
+                Reservation(reserver=request.user, **data) for data in serializer.validated_data
+            ])
+
+        # bulk_create sends no post_save
+        for shift in shifts:
+            bump_version(f'shift:{shift.pk}')
+        refresh_booked_slots(requested)
+
+        return Response(self.get_serializer(reservations, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path=r'by-code/(?P<code>\w+)', permission_classes=[IsAdminUser])
+    def by_code(self, request, code):
+        """reservation of any patient by its code, for the reception desk"""
+        reservation = get_object_or_404(self.queryset, code=code)
+        serializer = self.get_serializer(reservation)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def confirm(self, request):
+        """turn a hold placed on /shifts/{id}/hold/ into a reservation"""
+        hold = get_hold(request.data.get('hold', ''))
+        if hold is None or hold['user'] != request.user.pk:
+            raise NotFound("hold expired or unknown")
+        serializer = self.get_serializer(data={
+            'shift': hold['shift'],
+            'service': hold['service'],
+            'item': hold['item'],
+            'time_date': hold['start'],
+        })
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        release_hold(hold)
+        bump_version(f'shift:{hold["shift"]}')
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def release(self, request):
+        """give up a hold before it expires"""
+        hold = get_hold(request.data.get('hold', ''))
+        if hold is not None and hold['user'] == request.user.pk:
+            release_hold(hold)
+            bump_version(f'shift:{hold["shift"]}')
+
+        return Response({"msg": "released"})
+
+
+class ServiceViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, AdaptiveQuerysetMixin, FastListMixin, viewsets.ModelViewSet,
+):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticated]
+    version_names = ('services',)
+    cache_tag = 'service'
 
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    ConditionalGetMixin, ResponseCacheMixin, AdaptiveQuerysetMixin, FastListMixin, viewsets.ModelViewSet,
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
-    permission_classes = [IsAuthenticated]
\ No newline at end of file
+    permission_classes = [IsAuthenticated]
+    version_names = ('categories',)
+    cache_tag = 'category'
\ No newline at end of file